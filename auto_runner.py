@@ -1,6 +1,7 @@
 import sys
 import os
 import time
+import threading
 import traceback
 import yaml
 
@@ -8,90 +9,151 @@ import yaml
 sys.path.append(os.path.abspath(os.path.dirname(__file__)))
 
 from tools.config_generator import generate_config_via_ai
+from core import metrics
 from core.config import load_config, get_llm_config
 from core.generator import generate_outline, write_chapters_from_outline
-from drivers.factory import get_driver
+from drivers.factory import get_driver, set_rate_limiter
+from drivers.rate_limiter import RateLimiter
 
-def run_automation_loop():
-    print("🚀 启动全自动小说生成引擎...")
-    FIXED_IDEA = "作恶多端的产品经理，平日专门压榨程序员，给程序员提出各种无理需求，老天爷看不下去了，把他丢到异世界，变成了一个妓女，在异世界赎罪" 
-    # FIXED_IDEA = None 
+# 并发运行的小说流水线数量，以及所有流水线共享的全局配额（0 表示不限制）
+PIPELINES = int(os.getenv("AUTO_RUNNER_PIPELINES", "1"))
+REQUESTS_PER_MINUTE = int(os.getenv("LLM_RPM", "0"))
+TOKENS_PER_MINUTE = int(os.getenv("LLM_TPM", "0"))
+MAX_CONCURRENT_REQUESTS = int(os.getenv("LLM_MAX_CONCURRENCY", "8"))
+# 指标输出目录：pynovel.prom 供 Prometheus textfile collector 读取，每轮另存一份 JSON 汇总
+METRICS_DIR = os.getenv("METRICS_DIR", "metrics")
 
-    loop_count = 0
+def export_round_metrics(pipeline_id, loop_count, title):
+    """导出累计指标 (Prometheus 文本) 与本轮小说的 JSON 汇总。"""
+    try:
+        metrics.registry.write_prometheus(os.path.join(METRICS_DIR, "pynovel.prom"))
+        stamp = time.strftime("%Y%m%d_%H%M%S")
+        summary_path = os.path.join(METRICS_DIR, f"round_p{pipeline_id}_{loop_count}_{stamp}.json")
+        metrics.registry.write_summary(summary_path, novel=title)
+        print(f"📊 本轮指标已导出: {summary_path}")
+    except Exception as e:
+        print(f"⚠️ 指标导出失败: {e}")
+
+def run_single_round(pipeline_id, loop_count, fixed_idea):
+    """执行一轮完整的 创意 → 配置 → 大纲 → 正文 流程，返回本轮是否成功写出了新内容。"""
+    tag = f"[流水线 {pipeline_id}]" if PIPELINES > 1 else ""
+    print(f"\n\n{'='*50}")
+    print(f"🔄 {tag}开始执行第 {loop_count} 轮自动生成任务")
+    print(f"{'='*50}")
+
+    # 1. 自动生成 Config
+    if fixed_idea:
+        print(f"\n[Step 1] 使用固定创意生成配置: {fixed_idea}")
+        current_idea = fixed_idea
+    else:
+        print("\n[Step 1] 生成随机小说配置...")
+        current_idea = None
+    
+    # 不再传递 target_model, 依赖 config_generator 自动从 env/config 读取
+    config_path = generate_config_via_ai(idea=current_idea, model_name=None, auto_save=True)
+    
+    if not config_path:
+        print(f"⚠️ {tag}Config 生成失败。")
+        return False
+        
+    print(f"Config 已生成: {config_path}")
+    
+    # 2. 加载 Config
+    print("\n[Step 2] 加载配置...")
+    config = load_config(config_path)
+    
+    # Update specific generation parameters for automation
+    novel_config = config.get("novel", {})
+    title = novel_config.get("title", f"AutoNovel_{int(time.time())}")
+    if PIPELINES > 1:
+        # 相同创意的多条流水线可能得到同名小说，按流水线编号区分大纲文件与输出目录
+        title = f"{title}_p{pipeline_id}"
+    
+    # 3. 初始化 LLM (使用 get_llm_config 统一获取配置)
+    # 这样会优先读取 ENV 中的 LLM_MODEL, 其次 Config 中的 model_name
+    llm_config = get_llm_config(config)
+    
+    provider = llm_config['provider']
+    api_key = llm_config['api_key']
+    base_url = llm_config['base_url']
+    model_name = llm_config['model_name']
+
+    print(f"当前使用的模型: {model_name}")
+    llm = get_driver(provider, api_key, model_name, base_url,
+                     driver_options={"generation_params": llm_config["generation_params"]})
+    
+    # 4. 生成大纲
+    print(f"\n[Step 3] {tag}生成《{title}》大纲...")
+    chapter_count = config.get("novel", {}).get("chapter_count", 10)
+    sections = config.get("novel", {}).get("sections_per_chapter", 2)
+    meta = config.get("novel", {}).get("details", {})
+    idea = config.get("novel", {}).get("idea", "No Idea")
+    
+    # Ensure generate_outline args match: llm, title, idea, chapter_count, sections_per_chapter, meta, novel_config
+    # 流水线运行在后台线程中，不能等待 input()，已有大纲直接沿用
+    outline = generate_outline(llm, title, idea, chapter_count, sections, meta, novel_config, interactive=False)
     
+    if not outline:
+        print(f"⚠️ {tag}大纲生成失败，跳过本次循环。")
+        export_round_metrics(pipeline_id, loop_count, title)
+        return False
+        
+    # 5. 生成正文
+    print(f"\n[Step 4] {tag}开始撰写《{title}》正文...")
+    words_per_section = config.get("novel", {}).get("words_per_section", 2000)
+    
+    written = write_chapters_from_outline(llm, title, outline, meta, words_per_section, novel_config)
+    export_round_metrics(pipeline_id, loop_count, title)
+
+    if not written:
+        # 沿用了已有大纲且全部小节早已写完：立即进入下一轮只会空转
+        print(f"\n⏸️ {tag}《{title}》没有需要新写的小节。")
+        return False
+    print(f"\n✅ {tag}《{title}》生成流程结束！")
+    return True
+
+def run_pipeline(pipeline_id, fixed_idea):
+    """单条流水线：写出新内容后立即开始下一轮，失败或没有写出任何内容时才休息，避免配额空闲或空转。"""
+    loop_count = 0
     while True:
         loop_count += 1
-        print(f"\n\n{'='*50}")
-        print(f"🔄 开始执行第 {loop_count} 轮自动生成任务")
-        print(f"{'='*50}")
-        
         try:
-            # 1. 自动生成 Config
-            if FIXED_IDEA:
-                print(f"\n[Step 1] 使用固定创意生成配置: {FIXED_IDEA}")
-                current_idea = FIXED_IDEA
-            else:
-                print("\n[Step 1] 生成随机小说配置...")
-                current_idea = None
-            
-            # 不再传递 target_model, 依赖 config_generator 自动从 env/config 读取
-            config_path = generate_config_via_ai(idea=current_idea, model_name=None, auto_save=True)
-            
-            if not config_path:
-                print("⚠️ Config 生成失败，休息 10 秒后重试...")
-                time.sleep(10)
-                continue
-                
-            print(f"Config 已生成: {config_path}")
-            
-            # 2. 加载 Config
-            print("\n[Step 2] 加载配置...")
-            config = load_config(config_path)
-            
-            # Update specific generation parameters for automation
-            novel_config = config.get("novel", {})
-            title = novel_config.get("title", f"AutoNovel_{int(time.time())}")
-            
-            # 3. 初始化 LLM (使用 get_llm_config 统一获取配置)
-            # 这样会优先读取 ENV 中的 LLM_MODEL, 其次 Config 中的 model_name
-            llm_config = get_llm_config(config)
-            
-            provider = llm_config['provider']
-            api_key = llm_config['api_key']
-            base_url = llm_config['base_url']
-            model_name = llm_config['model_name']
-
-            print(f"当前使用的模型: {model_name}")
-            llm = get_driver(provider, api_key, model_name, base_url)
-            
-            # 4. 生成大纲
-            print(f"\n[Step 3] 生成《{title}》大纲...")
-            chapter_count = config.get("novel", {}).get("chapter_count", 10)
-            sections = config.get("novel", {}).get("sections_per_chapter", 2)
-            meta = config.get("novel", {}).get("details", {})
-            idea = config.get("novel", {}).get("idea", "No Idea")
-            
-            # Ensure generate_outline args match: llm, title, idea, chapter_count, sections_per_chapter, meta, novel_config
-            outline = generate_outline(llm, title, idea, chapter_count, sections, meta, novel_config)
-            
-            if not outline:
-                print("⚠️ 大纲生成失败，跳过本次循环。")
-                continue
-                
-            # 5. 生成正文
-            print(f"\n[Step 4] 开始撰写《{title}》正文...")
-            words_per_section = config.get("novel", {}).get("words_per_section", 2000)
-            
-            write_chapters_from_outline(llm, title, outline, meta, words_per_section)
-            
-            print(f"\n✅ 《{title}》生成流程结束！")
-            
+            success = run_single_round(pipeline_id, loop_count, fixed_idea)
         except Exception as e:
             print(f"\n❌ 本轮自动生成发生严重错误: {e}")
             traceback.print_exc()
-        
-        print("\n⏳ 休息 10 秒后开始下一轮...")
-        time.sleep(10)
+            success = False
+
+        if not success:
+            print("\n⏳ 休息 10 秒后开始下一轮...")
+            time.sleep(10)
+
+def run_automation_loop():
+    print("🚀 启动全自动小说生成引擎...")
+    FIXED_IDEA = "作恶多端的产品经理，平日专门压榨程序员，给程序员提出各种无理需求，老天爷看不下去了，把他丢到异世界，变成了一个妓女，在异世界赎罪" 
+    # FIXED_IDEA = None 
+
+    # 所有流水线（以及工具脚本内部新建的驱动）共享同一个自适应限流器
+    set_rate_limiter(RateLimiter(
+        requests_per_minute=REQUESTS_PER_MINUTE,
+        tokens_per_minute=TOKENS_PER_MINUTE,
+        max_concurrency=MAX_CONCURRENT_REQUESTS
+    ))
+
+    if PIPELINES <= 1:
+        run_pipeline(1, FIXED_IDEA)
+        return
+
+    print(f"并发运行 {PIPELINES} 条小说流水线...")
+    # 守护线程：Ctrl+C 时主线程退出即可结束全部流水线
+    workers = [
+        threading.Thread(target=run_pipeline, args=(i, FIXED_IDEA), daemon=True)
+        for i in range(1, PIPELINES + 1)
+    ]
+    for worker in workers:
+        worker.start()
+    while any(worker.is_alive() for worker in workers):
+        time.sleep(1)
 
 if __name__ == "__main__":
     try:
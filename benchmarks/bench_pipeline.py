@@ -0,0 +1,157 @@
+"""
+端到端流水线基准：用 fake 替身驱动跑 generate_outline + write_chapters_from_outline，
+测量章数、每章节数与记忆库规模变化时的总耗时、分阶段耗时、每节提示词字节数与文件 I/O 次数。
+
+用法:
+    python benchmarks/bench_pipeline.py --chapters 5,10 --sections 2,4 --memory 0,2000
+"""
+import argparse
+import contextlib
+import io
+import os
+import sys
+import tempfile
+import time
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from benchmarks.common import InstrumentedDriver, FileIOCounter, summarize, time_method, write_results
+from core.generator import generate_outline, write_chapters_from_outline
+from core.rag_engine import RAGEngine
+from drivers.factory import get_driver
+
+TITLE = "基准测试"
+
+def _int_list(text):
+    return [int(x) for x in text.split(",") if x.strip()]
+
+def preload_memory(llm, novel_dir, size, rag_config=None, batch_size=500):
+    """向记忆库预先写入 size 条合成记忆，模拟长篇连载后期的记忆规模。"""
+    rag_config = rag_config or {}
+    rag = RAGEngine(novel_dir, index_backend=rag_config.get("index_backend", "exact"),
+                    index_params=rag_config.get("index_params"), ann_min_size=rag_config.get("ann_min_size", 1024))
+    rag.check_embedding_model(llm.embedding_id())
+    for start in range(0, size, batch_size):
+        texts = [f"第{i}条历史记忆：少年在第{i % 97}座山门前遇见了第{i % 13}位故人。" for i in range(start, min(size, start + batch_size))]
+        for text, vector in zip(texts, llm.embed_contents(texts)):
+            rag.add_document(text, vector)
+    rag.compact()
+
+def run_case(chapters, sections, memory_size, words_per_section=300, novel_config=None, driver_options=None,
+             quiet=True):
+    """在临时目录中跑一遍完整流水线，返回该组参数的测量结果。"""
+    novel_config = dict(novel_config or {})
+    fake = get_driver("fake", None, "fake-model", embedding_cache=False, response_cache=False,
+                      driver_options=driver_options or {})
+    llm = InstrumentedDriver(fake)
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as tmp:
+        os.chdir(tmp)
+        # 流水线本身会大量 print，基准运行时默认屏蔽，避免终端输出拖慢计时
+        output = contextlib.redirect_stdout(io.StringIO()) if quiet else contextlib.nullcontext()
+        try:
+            with output:
+                if memory_size:
+                    os.makedirs(TITLE)
+                    preload_memory(fake, TITLE, memory_size, novel_config.get("rag"))
+
+                outline_io = FileIOCounter()
+                started = time.perf_counter()
+                with outline_io.patch():
+                    outline = generate_outline(llm, TITLE, "基准测试创意", chapters, sections, {}, novel_config)
+                outline_seconds = time.perf_counter() - started
+                outline_calls = len(llm.calls)
+
+                chapters_io = FileIOCounter()
+                search_seconds = []
+                started = time.perf_counter()
+                with chapters_io.patch(), time_method(RAGEngine, "search", search_seconds):
+                    write_chapters_from_outline(llm, TITLE, outline or "", {}, words_per_section, novel_config)
+                chapters_seconds = time.perf_counter() - started
+        finally:
+            os.chdir(cwd)
+
+    writing_calls = llm.calls[outline_calls:]
+    draft_bytes = [c["prompt_bytes"] for c in writing_calls if c["stage"] == "draft"]
+    state_bytes = [c["prompt_bytes"] for c in writing_calls if c["stage"] == "state_update"]
+    llm_seconds = sum(c["seconds"] for c in llm.calls)
+    wall_seconds = outline_seconds + chapters_seconds
+    section_count = len(draft_bytes)
+    return {
+        "chapters": chapters,
+        "sections_per_chapter": sections,
+        "memory_size": memory_size,
+        "sections_written": section_count,
+        "wall_seconds": wall_seconds,
+        # 调用耗时之外的部分即流水线自身的开销（state_lag > 0 时调用有重叠，仅供参考）
+        "overhead_seconds": wall_seconds - llm_seconds,
+        "overhead_per_section_seconds": (chapters_seconds - sum(c["seconds"] for c in writing_calls)) / section_count
+        if section_count else None,
+        "stages": {"outline": outline_seconds, "chapters": chapters_seconds},
+        "llm_calls": llm.stage_report(),
+        "prompt_bytes_per_section": {
+            "draft": summarize(draft_bytes),
+            "state_update": summarize(state_bytes),
+            "draft_series": draft_bytes,
+        },
+        "rag_search_seconds": summarize(search_seconds),
+        "file_io": {
+            "outline": outline_io.counts,
+            "chapters": chapters_io.counts,
+            "chapters_per_section": chapters_io.total / section_count if section_count else None,
+        },
+    }
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="端到端流水线基准测试 (fake 替身驱动)")
+    parser.add_argument("--chapters", default="3,6", help="章数列表，逗号分隔")
+    parser.add_argument("--sections", default="2", help="每章节数列表，逗号分隔")
+    parser.add_argument("--memory", default="0", help="预置记忆条数列表，逗号分隔")
+    parser.add_argument("--words", type=int, default=300, help="每节字数")
+    parser.add_argument("--batch-size", type=int, default=10, help="大纲批次大小")
+    parser.add_argument("--outline-concurrency", type=int, default=1)
+    parser.add_argument("--state-lag", type=int, default=0)
+    parser.add_argument("--state-update-mode", default="full", choices=["full", "delta"])
+    parser.add_argument("--fused", action="store_true", help="融合模式：起草调用同时返回状态增量")
+    parser.add_argument("--index-backend", default="exact")
+    parser.add_argument("--memory-tree", action="store_true", help="每章写完后归并记忆，按记忆树逐层检索")
+    parser.add_argument("--latency", type=float, default=0.0, help="替身驱动首包延迟 (秒)")
+    parser.add_argument("--latency-dist", default="constant")
+    parser.add_argument("--tokens-per-sec", type=float, default=0.0)
+    parser.add_argument("--embedding-dim", type=int, default=256)
+    parser.add_argument("--output", help="结果 JSON 路径，默认写入 benchmarks/results/")
+    parser.add_argument("--verbose", action="store_true", help="显示流水线自身的输出")
+    args = parser.parse_args(argv)
+
+    novel_config = {
+        "batch_size": args.batch_size,
+        "outline_concurrency": args.outline_concurrency,
+        "state_lag": args.state_lag,
+        "state_update_mode": args.state_update_mode,
+        "fused_state_update": args.fused,
+        "rag": {"index_backend": args.index_backend, "memory_tree": args.memory_tree},
+    }
+    driver_options = {
+        "latency": args.latency,
+        "latency_distribution": args.latency_dist,
+        "tokens_per_second": args.tokens_per_sec,
+        "embedding_dim": args.embedding_dim,
+    }
+
+    results = []
+    for memory_size in _int_list(args.memory):
+        for chapters in _int_list(args.chapters):
+            for sections in _int_list(args.sections):
+                print(f"运行: {chapters} 章 x {sections} 节，预置记忆 {memory_size} 条...")
+                case = run_case(chapters, sections, memory_size, args.words, novel_config, driver_options,
+                                quiet=not args.verbose)
+                print(f"  - 总耗时 {case['wall_seconds']:.3f}s，自身开销 {case['overhead_seconds']:.3f}s，"
+                      f"每节文件 I/O {case['file_io']['chapters_per_section']}")
+                results.append(case)
+
+    params = dict(vars(args), novel_config=novel_config, driver_options=driver_options)
+    path = write_results("pipeline", params, results, args.output)
+    print(f"✅ 结果已写入: {path}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+"""
+记忆库检索基准：随记忆条数增长，测量 RAGEngine.add_document 与 RAGEngine.search 的延迟，
+以及重新加载记忆库的耗时。
+
+用法:
+    python benchmarks/bench_rag.py --sizes 1000,10000,50000 --backends exact,ivf --dim 768
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from benchmarks.common import summarize, write_results
+from core.rag_engine import RAGEngine
+
+def _random_vector(rng, dim):
+    return [rng.gauss(0.0, 1.0) for _ in range(dim)]
+
+def run_backend(backend, sizes, dim, queries=50, top_k=3, index_params=None, ann_min_size=1024, seed=42):
+    """逐步扩充同一个记忆库，在每个规模检查点测量检索延迟。"""
+    rng = random.Random(seed)
+    query_vectors = [_random_vector(rng, dim) for _ in range(queries)]
+    checkpoints = []
+    with tempfile.TemporaryDirectory() as tmp:
+        rag = RAGEngine(tmp, index_backend=backend, index_params=index_params, ann_min_size=ann_min_size)
+        for size in sorted(sizes):
+            add_seconds = []
+            while len(rag.documents) < size:
+                vector = _random_vector(rng, dim)
+                started = time.perf_counter()
+                rag.add_document(f"记忆 {len(rag.documents)}", vector)
+                add_seconds.append(time.perf_counter() - started)
+
+            search_seconds = []
+            for query in query_vectors:
+                started = time.perf_counter()
+                rag.search(query, top_k=top_k)
+                search_seconds.append(time.perf_counter() - started)
+
+            rag.compact()
+            started = time.perf_counter()
+            reloaded = RAGEngine(tmp, index_backend=backend, index_params=index_params, ann_min_size=ann_min_size)
+            load_seconds = time.perf_counter() - started
+            del reloaded
+
+            checkpoints.append({
+                "size": size,
+                "add_seconds": summarize(add_seconds),
+                "search_seconds": summarize(search_seconds),
+                "load_seconds": load_seconds,
+                "index": type(rag.index).__name__ if rag.index is not None else None,
+            })
+            print(f"  - {backend} @ {size}: 检索 p50 {checkpoints[-1]['search_seconds']['p50'] * 1000:.3f} ms，"
+                  f"加载 {load_seconds:.3f}s")
+    return checkpoints
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="RAG 记忆库检索基准测试")
+    parser.add_argument("--sizes", default="100,1000,5000", help="记忆条数检查点，逗号分隔")
+    parser.add_argument("--backends", default="exact,ivf", help="索引后端列表: exact / auto / ivf / hnswlib / faiss")
+    parser.add_argument("--dim", type=int, default=256)
+    parser.add_argument("--queries", type=int, default=50)
+    parser.add_argument("--top-k", type=int, default=3)
+    parser.add_argument("--ann-min-size", type=int, default=1024)
+    parser.add_argument("--output", help="结果 JSON 路径，默认写入 benchmarks/results/")
+    args = parser.parse_args(argv)
+
+    sizes = [int(x) for x in args.sizes.split(",") if x.strip()]
+    results = {}
+    for backend in [b.strip() for b in args.backends.split(",") if b.strip()]:
+        print(f"后端 {backend}:")
+        results[backend] = run_backend(backend, sizes, args.dim, args.queries, args.top_k,
+                                       ann_min_size=args.ann_min_size)
+
+    path = write_results("rag", vars(args), results, args.output)
+    print(f"✅ 结果已写入: {path}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,208 @@
+import builtins
+import datetime
+import json
+import os
+import platform
+import subprocess
+import threading
+import time
+from contextlib import contextmanager
+
+ROOT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+RESULTS_DIR = os.path.join(ROOT_DIR, "benchmarks", "results")
+
+def classify_prompt(prompt, system_instruction=None):
+    """按提示词内容判断调用所属的流水线阶段。"""
+    if "===SUMMARY===" in prompt or "【状态增量】" in prompt:
+        return "state_update"
+    if "只输出修正后的下一章" in prompt:
+        return "outline_reconcile"
+    if "【记忆归并】" in prompt:
+        return "memory_consolidation"
+    if "制定一份《全局剧情路标》" in prompt:
+        return "roadmap"
+    if "章的详细大纲" in prompt:
+        return "outline_batch"
+    if "请重写这段大纲" in prompt:
+        return "safety_retry"
+    if "当前正在写" in prompt:
+        return "draft"
+    return "other"
+
+def summarize(values):
+    """count / total / mean / p50 / p95 / max，空列表返回只含 count 的字典。"""
+    if not values:
+        return {"count": 0}
+    ordered = sorted(values)
+    n = len(ordered)
+    return {
+        "count": n,
+        "total": sum(ordered),
+        "mean": sum(ordered) / n,
+        "p50": ordered[(n - 1) // 2],
+        "p95": ordered[min(n - 1, int(n * 0.95))],
+        "max": ordered[-1],
+    }
+
+
+class InstrumentedDriver:
+    """包在替身驱动外面，按阶段记录每次调用的耗时与发送的提示词字节数。"""
+
+    def __init__(self, driver):
+        self.driver = driver
+        self._lock = threading.Lock()
+        self.calls = [] # [{"stage", "seconds", "prompt_bytes", "response_bytes"}]
+
+    def __getattr__(self, name):
+        return getattr(self.driver, name)
+
+    def _record(self, stage, started, prompt_bytes, response_bytes):
+        with self._lock:
+            self.calls.append({
+                "stage": stage,
+                "seconds": time.perf_counter() - started,
+                "prompt_bytes": prompt_bytes,
+                "response_bytes": response_bytes,
+            })
+
+    def generate_content(self, prompt, system_instruction=None):
+        started = time.perf_counter()
+        text = self.driver.generate_content(prompt, system_instruction)
+        self._record(classify_prompt(prompt, system_instruction), started,
+                     len(prompt.encode("utf-8")) + len((system_instruction or "").encode("utf-8")),
+                     len(text.encode("utf-8")))
+        return text
+
+    def generate_json(self, prompt, system_instruction=None):
+        started = time.perf_counter()
+        text = self.driver.generate_json(prompt, system_instruction)
+        self._record(classify_prompt(prompt, system_instruction), started,
+                     len(prompt.encode("utf-8")) + len((system_instruction or "").encode("utf-8")),
+                     len(text.encode("utf-8")))
+        return text
+
+    def generate_content_stream(self, prompt, system_instruction=None):
+        started = time.perf_counter()
+        chunks = []
+        for chunk in self.driver.generate_content_stream(prompt, system_instruction):
+            chunks.append(chunk)
+            yield chunk
+        self._record(classify_prompt(prompt, system_instruction), started,
+                     len(prompt.encode("utf-8")) + len((system_instruction or "").encode("utf-8")),
+                     len("".join(chunks).encode("utf-8")))
+
+    def embed_content(self, text):
+        started = time.perf_counter()
+        vector = self.driver.embed_content(text)
+        self._record("embedding", started, len(text.encode("utf-8")), 0)
+        return vector
+
+    def embed_contents(self, texts):
+        started = time.perf_counter()
+        vectors = self.driver.embed_contents(texts)
+        self._record("embedding", started, sum(len(t.encode("utf-8")) for t in texts), 0)
+        return vectors
+
+    def stage_report(self):
+        """按阶段汇总调用次数、耗时分布与提示词字节数。"""
+        with self._lock:
+            calls = list(self.calls)
+        report = {}
+        for stage in sorted({c["stage"] for c in calls}):
+            stage_calls = [c for c in calls if c["stage"] == stage]
+            report[stage] = {
+                "seconds": summarize([c["seconds"] for c in stage_calls]),
+                "prompt_bytes": summarize([c["prompt_bytes"] for c in stage_calls]),
+            }
+        return report
+
+
+class FileIOCounter:
+    """统计 open / os.replace / os.fsync 的调用次数，以及按读写模式区分的 open 次数。"""
+
+    def __init__(self):
+        self.counts = {"open_read": 0, "open_write": 0, "replace": 0, "fsync": 0}
+        self._lock = threading.Lock()
+
+    def _bump(self, key):
+        with self._lock:
+            self.counts[key] += 1
+
+    @contextmanager
+    def patch(self):
+        original_open, original_replace, original_fsync = builtins.open, os.replace, os.fsync
+
+        def counting_open(file, mode="r", *args, **kwargs):
+            self._bump("open_write" if any(flag in mode for flag in "wax+") else "open_read")
+            return original_open(file, mode, *args, **kwargs)
+
+        def counting_replace(*args, **kwargs):
+            self._bump("replace")
+            return original_replace(*args, **kwargs)
+
+        def counting_fsync(fd):
+            self._bump("fsync")
+            return original_fsync(fd)
+
+        builtins.open, os.replace, os.fsync = counting_open, counting_replace, counting_fsync
+        try:
+            yield self
+        finally:
+            builtins.open, os.replace, os.fsync = original_open, original_replace, original_fsync
+
+    @property
+    def total(self):
+        return sum(self.counts.values())
+
+
+@contextmanager
+def time_method(cls, name, sink):
+    """在上下文内给 cls.name 计时，每次调用的耗时（秒）追加到 sink 列表。"""
+    original = getattr(cls, name)
+
+    def timed(*args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return original(*args, **kwargs)
+        finally:
+            sink.append(time.perf_counter() - started)
+
+    setattr(cls, name, timed)
+    try:
+        yield sink
+    finally:
+        setattr(cls, name, original)
+
+
+def git_revision():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=ROOT_DIR,
+            capture_output=True, text=True, timeout=10
+        ).stdout.strip() or None
+    except Exception:
+        return None
+
+def write_results(name, params, results, output=None):
+    """
+    把一次基准测试结果写成 JSON，附带提交号与运行环境，便于跨提交对比。
+    默认路径为 benchmarks/results/<name>_<时间>_<提交号>.json，返回实际写入的路径。
+    """
+    revision = git_revision()
+    payload = {
+        "benchmark": name,
+        "git_revision": revision,
+        "timestamp": datetime.datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "params": params,
+        "results": results,
+    }
+    if output is None:
+        if not os.path.exists(RESULTS_DIR):
+            os.makedirs(RESULTS_DIR)
+        stamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
+        output = os.path.join(RESULTS_DIR, f"{name}_{stamp}_{revision or 'nogit'}.json")
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(payload, f, ensure_ascii=False, indent=2)
+    return output
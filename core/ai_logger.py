@@ -1,61 +1,218 @@
-import os
+import atexit
 import datetime
+import gzip
+import json
+import os
+import queue
+import shutil
+import threading
+
+def default_log_dir():
+    root_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+    return os.path.join(root_dir, "logs")
+
+def usage_to_dict(usage_metadata):
+    """把 Gemini 的 usage_metadata / OpenAI 的 usage 统一成 {prompt_tokens, completion_tokens, total_tokens}。"""
+    if not usage_metadata:
+        return None
+    try:
+        # 兼容 Gemini 的 usage_metadata 对象
+        if hasattr(usage_metadata, 'prompt_token_count'):
+            return {
+                "prompt_tokens": usage_metadata.prompt_token_count,
+                "completion_tokens": usage_metadata.candidates_token_count,
+                "total_tokens": usage_metadata.total_token_count,
+            }
+        # 兼容 OpenAI 的 usage 对象
+        if hasattr(usage_metadata, 'prompt_tokens'):
+            return {
+                "prompt_tokens": usage_metadata.prompt_tokens,
+                "completion_tokens": usage_metadata.completion_tokens,
+                "total_tokens": usage_metadata.total_tokens,
+            }
+        if isinstance(usage_metadata, dict):
+            return dict(usage_metadata)
+    except Exception:
+        pass
+    return {"raw": str(usage_metadata)}
+
+
+class AILogWriter:
+    """
+    后台 AI 交互日志写入器。
+
+    调用方只把记录放进队列（不做任何文件 I/O），由单个后台线程批量写成 JSONL：
+    logs/YYYYMMDD.jsonl。文件超过 max_bytes 或跨天时轮转为 YYYYMMDD.N.jsonl.gz。
+    进程退出时通过 atexit 把队列中剩余的记录全部落盘。
+    """
+
+    def __init__(self, log_dir=None, max_bytes=64 * 1024 * 1024, batch_size=256, queue_size=10000, compress=True):
+        self.log_dir = log_dir or default_log_dir()
+        self.max_bytes = max_bytes
+        self.batch_size = batch_size
+        self.compress = compress
+        self.dropped = 0 # 队列满时丢弃的记录数
+        self._dropped_lock = threading.Lock() # dropped 由各调用线程累加、后台线程清零，+= 不是原子操作
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._start_lock = threading.Lock()
+        self._thread = None
+        self._file = None
+        self._file_day = None
+
+    # ---------- 调用方接口（任意线程） ----------
+
+    def submit(self, record):
+        """非阻塞地提交一条记录；队列已满时丢弃并计数，绝不阻塞调用方。"""
+        self._ensure_started()
+        try:
+            self._queue.put_nowait(("record", record))
+        except queue.Full:
+            with self._dropped_lock:
+                self.dropped += 1
+
+    def flush(self, timeout=None):
+        """等待此前提交的记录全部写入磁盘。"""
+        if self._thread is None:
+            return True
+        done = threading.Event()
+        self._queue.put(("flush", done))
+        return done.wait(timeout)
+
+    def close(self, timeout=5.0):
+        """写完剩余记录并停止后台线程。"""
+        with self._start_lock:
+            thread, self._thread = self._thread, None
+        if thread is None:
+            return
+        self._queue.put(("stop", None))
+        thread.join(timeout)
+
+    def _ensure_started(self):
+        if self._thread is not None:
+            return
+        with self._start_lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="ai-log-writer", daemon=True)
+                self._thread.start()
+
+    # ---------- 后台线程 ----------
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            # 把当前积压的记录一次取完，合并成一次写入
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            records, waiters, stop = [], [], False
+            for kind, payload in batch:
+                if kind == "record":
+                    records.append(payload)
+                elif kind == "flush":
+                    waiters.append(payload)
+                else:
+                    stop = True
+
+            try:
+                if records:
+                    self._write(records)
+                with self._dropped_lock:
+                    dropped, self.dropped = self.dropped, 0
+                if dropped:
+                    self._write([{"time": self._now(), "event": "dropped", "count": dropped}])
+                if self._file is not None:
+                    self._file.flush()
+            except Exception as e:
+                print(f"⚠️ 日志记录失败: {e}")
+            for waiter in waiters:
+                waiter.set()
+            if stop:
+                self._close_file()
+                return
+
+    @staticmethod
+    def _now():
+        return datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+
+    def _write(self, records):
+        day = datetime.datetime.now().strftime("%Y%m%d")
+        if self._file is None or day != self._file_day:
+            if self._file is not None:
+                self._rotate()
+            self._open(day)
+        self._file.write("".join(json.dumps(r, ensure_ascii=False) + "\n" for r in records))
+        if self._file.tell() >= self.max_bytes:
+            self._rotate()
+            self._open(day)
+
+    def _path(self, day):
+        return os.path.join(self.log_dir, f"{day}.jsonl")
+
+    def _open(self, day):
+        if not os.path.exists(self.log_dir):
+            os.makedirs(self.log_dir)
+        self._file = open(self._path(day), "a", encoding="utf-8")
+        self._file_day = day
+
+    def _close_file(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def _rotate(self):
+        """关闭当前文件，改名为 YYYYMMDD.N.jsonl 并按配置压缩。"""
+        day = self._file_day
+        self._close_file()
+        current = self._path(day)
+        if not os.path.exists(current) or os.path.getsize(current) == 0:
+            return
+        n = 1
+        while (os.path.exists(os.path.join(self.log_dir, f"{day}.{n}.jsonl"))
+               or os.path.exists(os.path.join(self.log_dir, f"{day}.{n}.jsonl.gz"))):
+            n += 1
+        rotated = os.path.join(self.log_dir, f"{day}.{n}.jsonl")
+        os.replace(current, rotated)
+        if self.compress:
+            with open(rotated, "rb") as src, gzip.open(rotated + ".gz", "wb") as dst:
+                shutil.copyfileobj(src, dst)
+            os.remove(rotated)
+
+
+_writer = None
+_writer_lock = threading.Lock()
+
+def get_ai_logger():
+    """进程内共享的日志写入器，首次调用时创建并注册退出时落盘。"""
+    global _writer
+    if _writer is None:
+        with _writer_lock:
+            if _writer is None:
+                _writer = AILogWriter()
+                atexit.register(_writer.close)
+    return _writer
+
+def flush_ai_logs(timeout=None):
+    """等待已提交的日志全部写入磁盘（例如在一轮生成结束时）。"""
+    if _writer is not None:
+        _writer.flush(timeout)
 
 def log_ai_interaction(prompt, response_text, usage_metadata=None):
     """
-    记录 AI 交互日志到 logs/YYYYMMDD.log
-    
+    记录 AI 交互日志到 logs/YYYYMMDD.jsonl（后台线程异步写入，线程安全）。
+
     :param prompt: 发送给 AI 的提示词
     :param response_text: AI 返回的文本
     :param usage_metadata: (可选) Token 使用情况字典/对象
     """
     try:
-        # 获取项目根目录
-        root_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
-        logs_dir = os.path.join(root_dir, "logs")
-        
-        if not os.path.exists(logs_dir):
-            os.makedirs(logs_dir)
-            
-        today_str = datetime.datetime.now().strftime("%Y%m%d")
-        log_file = os.path.join(logs_dir, f"{today_str}.log")
-        
-        now_time = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        
-        usage_str = "未知"
-        if usage_metadata:
-             try:
-                 # 兼容 Gemini 的 usage_metadata 对象
-                 if hasattr(usage_metadata, 'prompt_token_count'):
-                     p_tokens = usage_metadata.prompt_token_count
-                     r_tokens = usage_metadata.candidates_token_count
-                     t_tokens = usage_metadata.total_token_count
-                     usage_str = f"提问(Prompt): {p_tokens}, 回答(Response): {r_tokens}, 总计(Total): {t_tokens}"
-                 # 兼容 OpenAI 的 usage 对象
-                 elif hasattr(usage_metadata, 'prompt_tokens'):
-                     p_tokens = usage_metadata.prompt_tokens
-                     r_tokens = usage_metadata.completion_tokens
-                     t_tokens = usage_metadata.total_tokens
-                     usage_str = f"提问(Prompt): {p_tokens}, 回答(Response): {r_tokens}, 总计(Total): {t_tokens}"
-                 else:
-                     usage_str = str(usage_metadata)
-             except:
-                 usage_str = str(usage_metadata)
-
-        log_content = f"""
-[{now_time}]
-==================== 请求内容 (REQUEST) ====================
-{prompt}
-
-==================== 响应内容 (RESPONSE) ===================
-{response_text}
-
-==================== 用量统计 (USAGE) ======================
-Tokens: {usage_str}
-============================================================
-"""
-        with open(log_file, "a", encoding="utf-8") as f:
-            f.write(log_content)
-            
+        get_ai_logger().submit({
+            "time": AILogWriter._now(),
+            "prompt": prompt,
+            "response": response_text,
+            "usage": usage_to_dict(usage_metadata),
+        })
     except Exception as e:
         print(f"⚠️ 日志记录失败: {e}")
@@ -0,0 +1,320 @@
+import inspect
+import os
+from abc import ABC, abstractmethod
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+class VectorIndex(ABC):
+    """
+    RAGEngine 的近似最近邻 (ANN) 索引后端接口。
+
+    索引只保存向量行号，向量本身仍由 RAGEngine 的内存映射矩阵提供；
+    传入的向量均已归一化，内积即余弦相似度。
+    """
+    name = "base"
+
+    def __init__(self, dim, path):
+        self.dim = dim
+        self.path = path # 索引文件路径（不含扩展名，由后端自行追加）
+
+    @property
+    @abstractmethod
+    def count(self):
+        """已收录的向量行数。"""
+        pass
+
+    @abstractmethod
+    def add(self, matrix, start, end):
+        """增量收录 matrix[start:end]，行号即文档下标。"""
+        pass
+
+    @abstractmethod
+    def search(self, matrix, query, top_k):
+        """返回按相似度降序排列的行号数组；索引尚不可用时返回 None，由调用方退回精确检索。"""
+        pass
+
+    def save(self):
+        pass
+
+    def load(self):
+        """从磁盘加载索引，成功返回 True。"""
+        return False
+
+
+class IVFIndex(VectorIndex):
+    """
+    纯 NumPy 实现的倒排文件 (IVF) 索引：球面 k-means 聚类 + 按簇探查。
+
+    nprobe 为召回/延迟旋钮：探查的簇越多召回越高、越接近精确检索，也越慢。
+    规模不足 min_train 时不训练，直接由调用方走精确检索；
+    数据量增长到训练时的 retrain_factor 倍后自动重新聚类。
+    """
+    name = "ivf"
+
+    def __init__(self, dim, path, nprobe=8, nlist=None, min_train=1024, retrain_factor=4, seed=42):
+        super().__init__(dim, path)
+        self.nprobe = nprobe
+        self.nlist = nlist
+        self.min_train = min_train
+        self.retrain_factor = retrain_factor
+        self.seed = seed
+        self.centroids = None
+        self.assignments = np.zeros(0, dtype=np.int32)
+        self.trained_size = 0
+        self._lists = []
+
+    @property
+    def count(self):
+        return len(self.assignments)
+
+    @property
+    def file_path(self):
+        return self.path + ".ivf.npz"
+
+    def add(self, matrix, start, end):
+        if end <= start:
+            return
+        if self.centroids is None or end > self.trained_size * self.retrain_factor:
+            if end >= self.min_train:
+                self._train(matrix, end)
+            return
+        assigned = self._assign(np.asarray(matrix[start:end]))
+        for offset, cluster in enumerate(assigned):
+            self._lists[cluster].append(start + offset)
+        self.assignments = np.concatenate([self.assignments, assigned.astype(np.int32)])
+
+    def search(self, matrix, query, top_k):
+        if self.centroids is None:
+            return None
+        nprobe = min(self.nprobe, len(self.centroids))
+        centroid_scores = self.centroids @ query
+        probe = np.argpartition(-centroid_scores, nprobe - 1)[:nprobe]
+        candidates = np.concatenate([np.asarray(self._lists[c], dtype=np.int64) for c in probe])
+        if len(candidates) == 0:
+            return np.zeros(0, dtype=np.int64)
+        scores = np.asarray(matrix[candidates]) @ query
+        k = min(top_k, len(candidates))
+        if k < len(candidates):
+            best = np.argpartition(-scores, k - 1)[:k]
+        else:
+            best = np.arange(len(candidates))
+        best = best[np.argsort(-scores[best], kind="stable")]
+        return candidates[best]
+
+    def _train(self, matrix, n):
+        nlist = self.nlist or max(1, int(np.sqrt(n)))
+        nlist = min(nlist, n)
+        rng = np.random.default_rng(self.seed)
+        # 训练只需采样，避免大库聚类时把整个向量文件读入内存
+        sample_size = min(n, nlist * 64)
+        sample_ids = np.sort(rng.choice(n, size=sample_size, replace=False))
+        sample = np.asarray(matrix[sample_ids], dtype=np.float32)
+
+        centroids = sample[rng.choice(sample_size, size=nlist, replace=False)].copy()
+        for _ in range(10):
+            labels = np.argmax(sample @ centroids.T, axis=1)
+            for c in range(nlist):
+                members = sample[labels == c]
+                if len(members):
+                    centroids[c] = members.sum(axis=0)
+            norms = np.linalg.norm(centroids, axis=1, keepdims=True)
+            norms[norms == 0] = 1.0
+            centroids /= norms
+
+        self.centroids = centroids
+        self.trained_size = n
+        self.assignments = np.zeros(0, dtype=np.int32)
+        self._lists = [[] for _ in range(nlist)]
+        # 分块分配全部向量，控制峰值内存
+        for block_start in range(0, n, 4096):
+            block_end = min(block_start + 4096, n)
+            assigned = self._assign(np.asarray(matrix[block_start:block_end]))
+            for offset, cluster in enumerate(assigned):
+                self._lists[cluster].append(block_start + offset)
+            self.assignments = np.concatenate([self.assignments, assigned.astype(np.int32)])
+        self.save()
+
+    def _assign(self, vectors):
+        return np.argmax(np.asarray(vectors, dtype=np.float32) @ self.centroids.T, axis=1)
+
+    def save(self):
+        if self.centroids is None:
+            return
+        tmp_file = self.file_path + ".tmp.npz"
+        try:
+            np.savez(tmp_file, centroids=self.centroids, assignments=self.assignments,
+                     trained_size=np.array([self.trained_size]))
+            os.replace(tmp_file, self.file_path)
+        except Exception as e:
+            print(f"⚠️ 保存 IVF 索引失败: {e}")
+
+    def load(self):
+        if not os.path.exists(self.file_path):
+            return False
+        try:
+            with np.load(self.file_path) as data:
+                centroids = data["centroids"]
+                if centroids.shape[1] != self.dim:
+                    return False
+                self.centroids = centroids
+                self.assignments = data["assignments"].astype(np.int32)
+                self.trained_size = int(data["trained_size"][0])
+            self._lists = [[] for _ in range(len(centroids))]
+            for i, cluster in enumerate(self.assignments):
+                self._lists[cluster].append(i)
+            return True
+        except Exception as e:
+            print(f"⚠️ 加载 IVF 索引失败，将重建: {e}")
+            return False
+
+
+class HNSWLibIndex(VectorIndex):
+    """基于 hnswlib 的 HNSW 索引（可选依赖）。ef 为召回/延迟旋钮。"""
+    name = "hnswlib"
+
+    def __init__(self, dim, path, ef=64, m=16, ef_construction=200):
+        super().__init__(dim, path)
+        import hnswlib
+        self.ef = ef
+        self.m = m
+        self.ef_construction = ef_construction
+        self.index = hnswlib.Index(space="ip", dim=dim)
+        self._initialized = False
+
+    @property
+    def count(self):
+        return self.index.get_current_count() if self._initialized else 0
+
+    @property
+    def file_path(self):
+        return self.path + ".hnsw.bin"
+
+    def add(self, matrix, start, end):
+        if end <= start:
+            return
+        if not self._initialized:
+            self.index.init_index(max_elements=max(1024, end), ef_construction=self.ef_construction, M=self.m)
+            self.index.set_ef(self.ef)
+            self._initialized = True
+        elif end > self.index.get_max_elements():
+            self.index.resize_index(max(end, self.index.get_max_elements() * 2))
+        self.index.add_items(np.asarray(matrix[start:end]), np.arange(start, end))
+
+    def search(self, matrix, query, top_k):
+        k = min(top_k, self.count)
+        if k == 0:
+            return np.zeros(0, dtype=np.int64)
+        self.index.set_ef(max(self.ef, k))
+        labels, _ = self.index.knn_query(query.reshape(1, -1), k=k)
+        return labels[0].astype(np.int64)
+
+    def save(self):
+        if not self._initialized:
+            return
+        try:
+            self.index.save_index(self.file_path)
+        except Exception as e:
+            print(f"⚠️ 保存 HNSW 索引失败: {e}")
+
+    def load(self):
+        if not os.path.exists(self.file_path):
+            return False
+        try:
+            self.index.load_index(self.file_path)
+            self.index.set_ef(self.ef)
+            self._initialized = True
+            return True
+        except Exception as e:
+            print(f"⚠️ 加载 HNSW 索引失败，将重建: {e}")
+            return False
+
+
+class FaissIndex(VectorIndex):
+    """基于 faiss IndexHNSWFlat 的索引（可选依赖）。ef 对应 efSearch。"""
+    name = "faiss"
+
+    def __init__(self, dim, path, ef=64, m=16):
+        super().__init__(dim, path)
+        import faiss
+        self._faiss = faiss
+        self.ef = ef
+        self.index = faiss.IndexHNSWFlat(dim, m, faiss.METRIC_INNER_PRODUCT)
+        self.index.hnsw.efSearch = ef
+
+    @property
+    def count(self):
+        return self.index.ntotal
+
+    @property
+    def file_path(self):
+        return self.path + ".faiss"
+
+    def add(self, matrix, start, end):
+        if end <= start:
+            return
+        self.index.add(np.ascontiguousarray(matrix[start:end], dtype=np.float32))
+
+    def search(self, matrix, query, top_k):
+        k = min(top_k, self.count)
+        if k == 0:
+            return np.zeros(0, dtype=np.int64)
+        self.index.hnsw.efSearch = max(self.ef, k)
+        _, labels = self.index.search(query.reshape(1, -1).astype(np.float32), k)
+        return labels[0][labels[0] >= 0].astype(np.int64)
+
+    def save(self):
+        try:
+            self._faiss.write_index(self.index, self.file_path)
+        except Exception as e:
+            print(f"⚠️ 保存 faiss 索引失败: {e}")
+
+    def load(self):
+        if not os.path.exists(self.file_path):
+            return False
+        try:
+            index = self._faiss.read_index(self.file_path)
+            if index.d != self.dim:
+                return False
+            self.index = index
+            self.index.hnsw.efSearch = self.ef
+            return True
+        except Exception as e:
+            print(f"⚠️ 加载 faiss 索引失败，将重建: {e}")
+            return False
+
+
+INDEX_BACKENDS = {
+    "ivf": IVFIndex,
+    "hnswlib": HNSWLibIndex,
+    "faiss": FaissIndex,
+}
+
+def create_index(backend, dim, path, **params):
+    """
+    按名称创建索引后端。
+
+    :param backend: exact / auto / ivf / hnswlib / faiss。
+                    exact 返回 None（始终精确检索）；auto 依次尝试 hnswlib、faiss，均未安装时使用 NumPy IVF。
+    :param params: 透传给后端的参数，如 nprobe (IVF)、ef (HNSW)。
+    """
+    backend = (backend or "exact").lower()
+    if backend == "exact" or np is None:
+        return None
+
+    candidates = ["hnswlib", "faiss", "ivf"] if backend == "auto" else [backend]
+    for name in candidates:
+        cls = INDEX_BACKENDS.get(name)
+        if cls is None:
+            raise ValueError(f"不支持的向量索引后端: {backend}")
+        try:
+            # 只传递该后端认识的参数，便于在配置中同时写 nprobe 和 ef
+            accepted = inspect.signature(cls).parameters
+            return cls(dim, path, **{k: v for k, v in params.items() if k in accepted})
+        except ImportError:
+            if backend != "auto":
+                print(f"⚠️ 未安装 {name}，向量索引退回精确检索。")
+                return None
+    return None
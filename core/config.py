@@ -65,7 +65,8 @@ def get_llm_config(config):
         'provider': str,
         'api_key': str,
         'model_name': str,
-        'base_url': str
+        'base_url': str,
+        'generation_params': dict | None
     }
     """
     # 1. Provider
@@ -86,6 +87,10 @@ def get_llm_config(config):
         if config_key and config_key.strip() and config_key != "YOUR_API_KEY_HERE":
             api_key = config_key
 
+    # 合成驱动与离线回放不访问接口，没有配置密钥时用占位值，保证各入口的密钥检查能通过
+    if not api_key and (provider == "fake" or (os.getenv("LLM_RESPONSE_CACHE") or "").strip().lower() == "replay"):
+        api_key = "offline"
+
     # 3. Base URL
     # 优先环境变量 LLM_BASE_URL -> config['base_url']
     base_url = os.getenv("LLM_BASE_URL") or config.get("base_url")
@@ -98,14 +103,16 @@ def get_llm_config(config):
             "provider": provider,
             "api_key": api_key,
             "model_name": None,  # Explicitly No Default
-            "base_url": base_url
+            "base_url": base_url,
+            "generation_params": config.get("generation_params")
         }
 
     return {
         "provider": provider,
         "api_key": api_key,
         "model_name": model_name,
-        "base_url": base_url
+        "base_url": base_url,
+        "generation_params": config.get("generation_params")
     }
 
 def get_api_key(config):
@@ -0,0 +1,163 @@
+import math
+
+import yaml
+
+# 标记剧情线已经收束的关键词
+RESOLVED_MARKERS = ("已解决", "已回收", "已完结", "resolved")
+
+def estimate_tokens(text):
+    """粗略估算 token 数：按字符数计（中文约 1 字 1 token，对英文偏保守）。"""
+    return len(text or "")
+
+def _bigrams(text):
+    text = "".join(str(text).split())
+    return {text[i:i + 2] for i in range(len(text) - 1)} or ({text} if text else set())
+
+def relevance(query_grams, name, body):
+    """条目与当前任务的相关度：名字直接出现在任务中权重最高，其余按字符二元组重合度计。"""
+    if not query_grams:
+        return 0.0
+    score = 0.0
+    name_grams = _bigrams(name)
+    if name_grams and name_grams <= query_grams:
+        score += 10.0
+    body_grams = _bigrams(body)
+    if body_grams:
+        score += len(body_grams & query_grams) / math.sqrt(len(body_grams))
+    return score
+
+def _dump_yaml(data):
+    return yaml.safe_dump(data, allow_unicode=True, sort_keys=False).strip() if data else ""
+
+def parse_mapping(text):
+    """解析为 {名字: 内容}；不是映射或解析失败时返回 None，由调用方整体处理。"""
+    try:
+        data = yaml.safe_load(text) if text and text.strip() else {}
+    except yaml.YAMLError:
+        return None
+    return data if isinstance(data, dict) else None
+
+
+class ContextAssembler:
+    """
+    在 token 预算内拼装写作上下文。
+
+    全局摘要最多占预算的 summary_share，超出时保留最新的结尾部分；
+    角色与剧情线按与本节任务的相关度排序后依次放入，已收束的剧情线不再注入；
+    放不下的条目只列出名字。assemble 同时返回被省略/截断内容的报告。
+    """
+
+    def __init__(self, token_budget, summary_share=0.35):
+        self.token_budget = token_budget
+        self.summary_share = summary_share
+
+    def assemble(self, summary, characters_text, arcs_text, memories, query="", characters=None, arcs=None):
+        """
+        :param memories: RAG 命中的记忆文本列表（已按相似度排序）。
+        :param characters: (可选) 已解析好的角色映射，给出时不再解析 characters_text；arcs 同理。
+        :return: (上下文文本, 报告 dict)
+        """
+        budget = self.token_budget
+        report = {"budget": budget, "used": 0, "dropped": [], "truncated": []}
+        query_grams = _bigrams(query or "")
+        remaining = budget
+
+        # 1. 全局摘要
+        summary_cap = int(budget * self.summary_share)
+        if estimate_tokens(summary) > summary_cap:
+            report["truncated"].append({"kind": "summary", "from": estimate_tokens(summary), "to": summary_cap})
+            summary = "……" + summary[-max(0, summary_cap - 2):] if summary_cap > 2 else ""
+        remaining -= estimate_tokens(summary)
+
+        # 2. 角色与剧情线条目
+        if characters is None:
+            characters = parse_mapping(characters_text)
+        if arcs is None:
+            arcs = parse_mapping(arcs_text)
+        candidates = []
+        if characters is None:
+            candidates.append(("characters", "角色状态", characters_text, 0.0))
+        else:
+            for name, body in characters.items():
+                candidates.append(("character", str(name), body, relevance(query_grams, str(name), _dump_yaml(body))))
+        if arcs is None:
+            candidates.append(("arcs", "剧情线", arcs_text, 0.0))
+        else:
+            for name, body in arcs.items():
+                if any(marker in str(body) for marker in RESOLVED_MARKERS):
+                    report["dropped"].append({"kind": "arc", "name": str(name), "reason": "resolved"})
+                    continue
+                candidates.append(("arc", str(name), body, relevance(query_grams, str(name), _dump_yaml(body))))
+
+        # 相关度相同时角色优先，并保持原有顺序
+        order = {"character": 0, "characters": 0, "arc": 1, "arcs": 1}
+        candidates.sort(key=lambda c: (-c[3], order[c[0]]))
+
+        kept_chars, kept_arcs, raw_blocks = {}, {}, {}
+        omitted = {"character": [], "arc": []}
+        # 至少给最相关的一条记忆留出位置，并为排在后面的条目预留“从略”名单的空间
+        memory_reserve = sum(estimate_tokens(m) + 4 for m in memories[:1])
+        name_costs = [estimate_tokens(c[1]) + 1 if c[0] in omitted else 0 for c in candidates]
+        for i, (kind, name, body, score) in enumerate(candidates):
+            text = body if kind in ("characters", "arcs") else _dump_yaml({name: body})
+            cost = estimate_tokens(text) + 1
+            names_reserve = sum(name_costs[i + 1:]) + sum(len(v) + 1 for v in omitted.values())
+            reserve = memory_reserve + names_reserve + (16 * 2 if names_reserve else 0)
+            if cost <= remaining - reserve:
+                remaining -= cost
+                if kind == "character":
+                    kept_chars[name] = body
+                elif kind == "arc":
+                    kept_arcs[name] = body
+                else:
+                    raw_blocks[kind] = body
+            else:
+                report["dropped"].append({"kind": kind, "name": name, "reason": "budget"})
+                if kind in omitted:
+                    omitted[kind].append(name)
+
+        # 3. RAG 记忆按相似度依次放入
+        kept_memories = []
+        for rank, memory in enumerate(memories, 1):
+            cost = estimate_tokens(memory) + 4
+            if cost <= remaining:
+                remaining -= cost
+                kept_memories.append(memory)
+            else:
+                report["dropped"].append({"kind": "memory", "name": f"#{rank}", "reason": "budget"})
+
+        # 4. 放不下的角色/剧情线只留名字，提醒模型它们仍然存在
+        chars_block = raw_blocks.get("characters", _dump_yaml(kept_chars))
+        arcs_block = raw_blocks.get("arcs", _dump_yaml(kept_arcs))
+        for kind, label in (("character", "其余角色"), ("arc", "其余剧情线")):
+            if omitted[kind]:
+                note = f"（{label}本节未涉及，从略：{'、'.join(omitted[kind])}）"
+                if estimate_tokens(note) <= remaining:
+                    remaining -= estimate_tokens(note)
+                    if kind == "character":
+                        chars_block = f"{chars_block}\n{note}".strip()
+                    else:
+                        arcs_block = f"{arcs_block}\n{note}".strip()
+
+        report["used"] = budget - remaining
+        return format_context(summary, chars_block, arcs_block, kept_memories), report
+
+
+def format_context(summary, chars, arcs, memories):
+    """按固定版式拼出写作上下文。"""
+    rag_context = ""
+    if memories:
+        rag_context = "\n【历史相关事件回溯】："
+        for i, text in enumerate(memories, 1):
+            rag_context += f"\n{i}. {text}"
+    return f"""
+【全局剧情摘要】：
+{summary}
+
+【角色当前状态】：
+{chars}
+
+【当前未解伏笔/剧情线】：
+{arcs}
+{rag_context}
+            """
@@ -1,10 +1,23 @@
+import functools
+import itertools
+import json
 import os
 import re
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 
+from core import metrics
+from core.journal import DRAFT_WRITTEN, SectionJournal
+from core.outline_model import CompletionManifest, OutlineModel, load_outline, outline_model_path, split_chapters
+from core.state_delta import DELTA_INSTRUCTIONS, STATE_DELTA_MARKER, STATE_DELTA_SCHEMA
 from core.state_manager import StateManager
 
-def generate_outline(llm, title, idea, chapter_count, sections_per_chapter, meta, novel_config):
-    """阶段 1：根据用户描述生成详细大纲"""
+def generate_outline(llm, title, idea, chapter_count, sections_per_chapter, meta, novel_config, interactive=True):
+    """阶段 1：根据用户描述生成详细大纲。interactive=False 时不询问，直接沿用已有大纲（供后台流水线使用）。"""
+    with metrics.metric_labels(novel=title):
+        return _generate_outline(llm, title, idea, chapter_count, sections_per_chapter, meta, novel_config, interactive)
+
+def _generate_outline(llm, title, idea, chapter_count, sections_per_chapter, meta, novel_config, interactive=True):
     outlines_dir = "outlines"
     if not os.path.exists(outlines_dir):
         os.makedirs(outlines_dir)
@@ -14,7 +27,11 @@ def generate_outline(llm, title, idea, chapter_count, sections_per_chapter, meta
     # 检查大纲是否已存在
     if os.path.exists(outline_file):
         print(f"\n检测到大纲文件已存在: {outline_file}")
-        choice = input("是否直接使用已有大纲并进入创作阶段？(y: 使用已有 / n: 重新生成): ").strip().lower()
+        if interactive:
+            choice = input("是否直接使用已有大纲并进入创作阶段？(y: 使用已有 / n: 重新生成): ").strip().lower()
+        else:
+            choice = 'y'
+            print("非交互模式，直接使用已有大纲。")
         if choice == 'y':
             with open(outline_file, "r", encoding="utf-8") as f:
                 return f.read()
@@ -31,6 +48,21 @@ def generate_outline(llm, title, idea, chapter_count, sections_per_chapter, meta
         else:
             details_str += f"{fields}\n"
 
+    batches = [
+        (start, min(start + batch_size - 1, chapter_count))
+        for start in range(1, chapter_count + 1, batch_size)
+    ]
+    outline_concurrency = int(novel_config.get("outline_concurrency", 1) or 1)
+    parallel = outline_concurrency > 1 and len(batches) > 1
+
+    # 并行模式下各批次看不到前一批的大纲，需要路标额外给出每个批次区间的推进计划
+    segment_request = ""
+    if parallel:
+        ranges = "、".join(f"第{start}-{end}章" for start, end in batches)
+        segment_request = f"""4. **分段路标**：按以下章节区间逐段列出该区间必须推进的主线进展、人物关系变化与伏笔动作，每段一行，格式严格为“第A-B章：内容”。
+           区间：{ranges}
+        """
+
     # --- 新增步骤：生成全局剧情路标（Roadmap） ---
     print(f"\n正在构建全局剧情路标与伏笔埋设方案...")
     roadmap_system = "你是一位殿堂级的网文架构师。你的任务是构建宏大的故事架构，设计草蛇灰线的伏笔。"
@@ -45,11 +77,12 @@ def generate_outline(llm, title, idea, chapter_count, sections_per_chapter, meta
         1. **核心故事曲线**（起、承、转、合 四个阶段的关键节点）。
         2. **全书终极悬念**（贯穿全书的最大谜题是什么）。
         3. **3-5 个关键伏笔方案**（具体的伏笔内容 + 预计揭秘时刻 + 建议在前期哪个阶段埋下）。
-        
+        {segment_request}
         请简练输出，不要废话。
     """
     try:
-        global_roadmap = llm.generate_content(prompt=roadmap_prompt, system_instruction=roadmap_system)
+        with metrics.stage("roadmap"):
+            global_roadmap = llm.generate_content(prompt=roadmap_prompt, system_instruction=roadmap_system)
         print("全局路标构建完成。")
         print("-" * 30)
         print(global_roadmap[:200] + "...")
@@ -58,14 +91,7 @@ def generate_outline(llm, title, idea, chapter_count, sections_per_chapter, meta
         print(f"⚠️ 全局路标生成失败: {e}，将跳过此步骤。")
         global_roadmap = "（无全局路标，常规生成）"
 
-    full_outline = ""
-    history_context = "故事背景已由上述【基本信息】提供。"
-
-    for start_chapter in range(1, chapter_count + 1, batch_size):
-        end_chapter = min(start_chapter + batch_size - 1, chapter_count)
-        print(f"正在生成第 {start_chapter} 章至第 {end_chapter} 章的大纲...")
-        
-        outline_system = """你是一位资深的网文架构师和白金作家。
+    outline_system = """你是一位资深的网文架构师和白金作家。
 
         你的任务是根据提供的背景和路标，创作详细的章节大纲。
         要求：
@@ -81,7 +107,8 @@ def generate_outline(llm, title, idea, chapter_count, sections_per_chapter, meta
         ...
         """
 
-        prompt = f"""
+    def build_batch_prompt(start_chapter, end_chapter, history_context):
+        return f"""
         【基本信息】
         小说题目：{title}
         核心创意：{idea}
@@ -98,55 +125,178 @@ def generate_outline(llm, title, idea, chapter_count, sections_per_chapter, meta
         【任务要求】
         请为这个创意创作第 {start_chapter} 章至第 {end_chapter} 章的详细大纲（共 {end_chapter - start_chapter + 1} 章），每一章必须包含 {sections_per_chapter} 节。
         """
-        
-        # ---------------------------------------------------------
-        #  Retry Loop for Outline Generation (Safety Block Handling)
-        # ---------------------------------------------------------
-        max_retries = 3
-        current_try = 0
-        
-        while current_try < max_retries:
-            current_prompt = prompt
-            if current_try > 0:
-                print(f"🔄 [尝试 {current_try+1}/{max_retries}] 大纲生成触发安全拦截，正在切换至【唯美/隐喻模式】重试...")
-                # Append strict safety guidelines to the prompt for the retry
-                current_prompt += f"""
-                
-                【重要修正指令 ({current_try})】：
-                检测到上一轮内容触发了安全审查（可能包含过于露骨的色情或暴力描述）。
-                请立即调整写作策略：
-                1. **彻底去敏感化**：严禁任何直接的性行为、器官描写或过度暴力。
-                2. **使用文学隐喻**：用“潮汐”、“火焰”、“花朵”、“眼神交流”等意象代替直白描写。
-                3. **侧重情感与氛围**：重点描写心理博弈和环境氛围，而非生理动作。
-                请重新生成一段符合全年龄段安全标准的大纲。
-                """
 
-            batch_outline = llm.generate_content(prompt=current_prompt, system_instruction=outline_system)
-            
-            # If successful (no error marker), break the loop
-            if not batch_outline.startswith("⚠️"):
-                break
-                
-            print(f"⚠️ [失败] 尝试 {current_try+1} 仍被拦截: {batch_outline[:50]}...")
-            current_try += 1
-            
-        # 检查是否在多次尝试后仍然失败
-        if batch_outline.startswith("⚠️"):
-            print(f"\n❌ [大纲生成失败] 第 {start_chapter} 章之后由于以下原因停止：")
-            print(batch_outline)
+    if parallel:
+        full_outline = _generate_outline_parallel(
+            llm, batches, global_roadmap, chapter_count, sections_per_chapter,
+            outline_system, build_batch_prompt, outline_concurrency,
+            reconcile=novel_config.get("outline_reconcile", True)
+        )
+        if full_outline is None:
             return None
-            
-        full_outline += "\n" + batch_outline
-        history_context = f"前 {end_chapter} 章大纲概要：\n" + batch_outline
+    else:
+        full_outline = ""
+        history_context = "故事背景已由上述【基本信息】提供。"
+
+        for start_chapter, end_chapter in batches:
+            print(f"正在生成第 {start_chapter} 章至第 {end_chapter} 章的大纲...")
+            prompt = build_batch_prompt(start_chapter, end_chapter, history_context)
+            batch_outline = _generate_outline_batch(llm, prompt, outline_system)
+
+            # 检查是否在多次尝试后仍然失败
+            if batch_outline.startswith("⚠️"):
+                print(f"\n❌ [大纲生成失败] 第 {start_chapter} 章之后由于以下原因停止：")
+                print(batch_outline)
+                return None
+
+            full_outline += "\n" + batch_outline
+            history_context = f"前 {end_chapter} 章大纲概要：\n" + batch_outline
 
     with open(outline_file, "w", encoding="utf-8") as f:
         f.write(f"# 《{title}》分集大纲\n\n")
         f.write(f"## 全局剧情路标\n{global_roadmap}\n\n")
         f.write(full_outline)
     
+    # 同时保存解析好的大纲模型，创作阶段直接读取
+    OutlineModel.parse(full_outline).save(outline_model_path(title))
     print(f"迭代大纲生成完毕，已保存至：{outline_file}")
     return full_outline
 
+def _generate_outline_batch(llm, prompt, outline_system):
+    """生成一个批次的大纲，触发安全拦截时切换到唯美/隐喻模式重试。失败时返回以 ⚠️ 开头的错误信息。"""
+    # ---------------------------------------------------------
+    #  Retry Loop for Outline Generation (Safety Block Handling)
+    # ---------------------------------------------------------
+    max_retries = 3
+    current_try = 0
+    
+    while current_try < max_retries:
+        current_prompt = prompt
+        if current_try > 0:
+            print(f"🔄 [尝试 {current_try+1}/{max_retries}] 大纲生成触发安全拦截，正在切换至【唯美/隐喻模式】重试...")
+            # Append strict safety guidelines to the prompt for the retry
+            current_prompt += f"""
+            
+            【重要修正指令 ({current_try})】：
+            检测到上一轮内容触发了安全审查（可能包含过于露骨的色情或暴力描述）。
+            请立即调整写作策略：
+            1. **彻底去敏感化**：严禁任何直接的性行为、器官描写或过度暴力。
+            2. **使用文学隐喻**：用“潮汐”、“火焰”、“花朵”、“眼神交流”等意象代替直白描写。
+            3. **侧重情感与氛围**：重点描写心理博弈和环境氛围，而非生理动作。
+            请重新生成一段符合全年龄段安全标准的大纲。
+            """
+
+        with metrics.stage("outline_batch"):
+            batch_outline = llm.generate_content(prompt=current_prompt, system_instruction=outline_system)
+        
+        # If successful (no error marker), break the loop
+        if not batch_outline.startswith("⚠️"):
+            break
+            
+        print(f"⚠️ [失败] 尝试 {current_try+1} 仍被拦截: {batch_outline[:50]}...")
+        metrics.inc("pynovel_safety_retries_total", stage="outline_batch")
+        current_try += 1
+
+    return batch_outline
+
+def _roadmap_segment(global_roadmap, start_chapter, end_chapter, chapter_count):
+    """从全局路标的“分段路标”中取出与本批次区间重叠的行；找不到时按全书进度给出定位提示。"""
+    lines = []
+    for match in re.finditer(r"第\s*(\d+)\s*[-—~至到]\s*(\d+)\s*章[：:](.*)", global_roadmap):
+        seg_start, seg_end = int(match.group(1)), int(match.group(2))
+        if seg_start <= end_chapter and seg_end >= start_chapter:
+            lines.append(match.group(0).strip())
+    if lines:
+        return "\n".join(lines)
+
+    begin_pct = (start_chapter - 1) * 100 // chapter_count
+    end_pct = end_chapter * 100 // chapter_count
+    return f"本批次位于全书约 {begin_pct}%–{end_pct}% 的进度，请推进全局路标中对应阶段的剧情与伏笔。"
+
+def _generate_outline_parallel(llm, batches, global_roadmap, chapter_count, sections_per_chapter,
+                               outline_system, build_batch_prompt, concurrency, reconcile=True):
+    """
+    并行模式：所有批次只以全局路标和本批次的分段路标为锚点同时生成，
+    最后对批次交界处的章节做一次轻量衔接修正。
+    """
+    print(f"并行生成 {len(batches)} 个大纲批次 (并发数 {concurrency})...")
+
+    def run_batch(batch):
+        start_chapter, end_chapter = batch
+        segment = _roadmap_segment(global_roadmap, start_chapter, end_chapter, chapter_count)
+        history_context = f"""本批次与其他批次并行创作，看不到相邻批次的大纲。请严格按照全局路标与下面的【本段路标】推进剧情，
+        开头承接第 {start_chapter - 1} 章之前应已发生的事件，结尾为第 {end_chapter + 1} 章之后的剧情留好接口。
+        【本段路标】：
+        {segment}""" if start_chapter > 1 else f"""故事背景已由上述【基本信息】提供。
+        【本段路标】：
+        {segment}"""
+        return _generate_outline_batch(llm, build_batch_prompt(start_chapter, end_chapter, history_context), outline_system)
+
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        # 线程池不继承调用方的上下文标签，需显式绑定
+        results = list(executor.map(metrics.bind_labels(run_batch), batches))
+
+    for (start_chapter, end_chapter), batch_outline in zip(batches, results):
+        if batch_outline.startswith("⚠️"):
+            print(f"\n❌ [大纲生成失败] 第 {start_chapter} 章至第 {end_chapter} 章由于以下原因失败：")
+            print(batch_outline)
+            return None
+        print(f"第 {start_chapter} 章至第 {end_chapter} 章的大纲已生成。")
+
+    if reconcile:
+        results = _reconcile_batch_boundaries(llm, results, sections_per_chapter, outline_system, concurrency)
+
+    return "".join("\n" + batch_outline for batch_outline in results)
+
+def _reconcile_batch_boundaries(llm, batch_outlines, sections_per_chapter, outline_system, concurrency):
+    """
+    衔接修正：对每个批次交界，只把上一批的最后一章和下一批的第一章交给模型，
+    重写下一批的第一章使其自然承接。输出格式不合规时保留原文。
+    """
+    print(f"正在修正 {len(batch_outlines) - 1} 处批次交界的衔接...")
+
+    def reconcile(index):
+        prev_chapters = split_chapters(batch_outlines[index - 1])
+        next_chapters = split_chapters(batch_outlines[index])
+        if not prev_chapters or not next_chapters:
+            return batch_outlines[index]
+        prev_title, prev_body = prev_chapters[-1]
+        next_title, next_body = next_chapters[0]
+
+        prompt = f"""
+        以下两章大纲分别来自两个并行生成的批次，衔接处可能存在人物状态、地点或事件上的断裂。
+
+        【上一章（保持不变）】
+        {prev_title}
+        {prev_body.strip()}
+
+        【下一章（需要修正）】
+        {next_title}
+        {next_body.strip()}
+
+        【任务】
+        在不改变下一章核心事件与伏笔任务的前提下，修正下一章使其与上一章自然衔接。
+        只输出修正后的下一章，保持原有格式：以“{next_title.split('：')[0]}：”开头，包含【本章伏笔/悬念任务】和 {sections_per_chapter} 个“第M节：”。
+        """
+        with metrics.stage("outline_reconcile"):
+            revised = llm.generate_content(prompt=prompt, system_instruction=outline_system).strip()
+        revised_chapters = split_chapters(revised)
+        if (revised.startswith("⚠️") or len(revised_chapters) != 1
+                or not revised_chapters[0][0].startswith(next_title.split("：")[0] + "：")
+                or not re.search(r"第\d+节：", revised_chapters[0][1])):
+            print(f"⚠️ {next_title} 的衔接修正结果格式不符，保留原大纲。")
+            return batch_outlines[index]
+
+        new_block = revised_chapters[0][0] + revised_chapters[0][1].rstrip() + "\n"
+        original = batch_outlines[index]
+        title_pos = original.index(next_title)
+        body_end = title_pos + len(next_title) + len(next_body)
+        return original[:title_pos] + new_block + original[body_end:].lstrip("\n")
+
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        revised = list(executor.map(metrics.bind_labels(reconcile), range(1, len(batch_outlines))))
+    return batch_outlines[:1] + revised
+
 def sanitize_chapter_outline(llm, chapter_plan, error_msg):
     """
     当章节触发安全拦截时，尝试让 AI 重写该章节的大纲，使其更委婉、安全。
@@ -172,20 +322,120 @@ def sanitize_chapter_outline(llm, chapter_plan, error_msg):
     3. **输出要求**：只输出修正后的大纲内容，不要解释。
     """
     try:
-        new_plan = llm.generate_content(prompt=prompt, system_instruction=system_instruction)
+        with metrics.stage("safety_retry"):
+            new_plan = llm.generate_content(prompt=prompt, system_instruction=system_instruction)
         print("✅ 大纲修正完成。")
         return new_plan.strip()
     except Exception as e:
         print(f"⚠️ 大纲修正失败: {e}")
         return chapter_plan # 如果修正失败，只能返回原版尝试
 
-def write_chapters_from_outline(llm, title, outline_text, meta, words_per_section):
-    """阶段 2：读取嵌套大纲，按章建立文件夹，逐节创作"""
+def _stream_section(llm, prompt, system_instruction, partial_path, stop_marker=None):
+    """
+    流式生成一节正文，每收到一块就追加写入 partial_path，返回本次生成的文本。
+    请求一开始就失败时返回以 ⚠️ 开头的错误信息，不写文件；中途断开则异常向上抛出，
+    已写入的部分留在 partial_path 中供下次续写。
+    给出 stop_marker 时，分隔行及其之后的内容（融合模式的状态增量块）只出现在返回值中，不写入文件。
+    """
+    stream = getattr(llm, "generate_content_stream", None)
+    if stream is None:
+        chunks = iter([llm.generate_content(prompt=prompt, system_instruction=system_instruction)])
+    else:
+        chunks = iter(stream(prompt, system_instruction))
+
+    first = next(chunks, "")
+    if not first or first.startswith("⚠️"):
+        return first or "⚠️ [LLM 错误] 模型未返回任何内容。"
+
+    parts = []
+    # 尚未写盘的尾部：可能是被拆到两个分块里的分隔行的前半截（连同它前面的换行）
+    pending = ""
+    keep = len(stop_marker) + 2 if stop_marker else 0
+    with open(partial_path, "a", encoding="utf-8") as f:
+        for chunk in itertools.chain([first], chunks):
+            parts.append(chunk)
+            if pending is None:
+                continue
+            pending += chunk
+            if stop_marker and stop_marker in pending:
+                f.write(pending.split(stop_marker, 1)[0].rstrip())
+                pending = None
+            elif len(pending) > keep:
+                f.write(pending[:len(pending) - keep])
+                pending = pending[len(pending) - keep:]
+            f.flush()
+        if pending:
+            f.write(pending)
+        os.fsync(f.fileno())
+    return "".join(parts)
+
+def _finish_section(partial_path, file_path, content=None):
+    """把写完的 .partial 原子地改名为正式小节文件；给出 content 时先整体覆盖写入。"""
+    if content is not None:
+        with open(partial_path, "w", encoding="utf-8") as f:
+            f.write(content)
+            f.flush()
+            os.fsync(f.fileno())
+    os.replace(partial_path, file_path)
+
+def _section_path(title, chapter, section):
+    return os.path.join(title, f"第{chapter:02d}章", f"第{section:02d}节.txt")
+
+def _recover_sections(llm, title, state_manager, journal):
+    """
+    启动时按预写日志补做上次中断的小节：正文已写完（改名成功）但状态更新或记忆入库没有落盘的，
+    只重做缺失的步骤；日志中记了正文但文件并未写出的小节丢弃记录，稍后正常重新创作。
+    """
+    pending = journal.incomplete()
+    if not pending:
+        return
+    print(f"🔄 预写日志显示有 {len(pending)} 节的后续步骤未完成，正在恢复...")
+    for chapter, section in pending:
+        file_path = _section_path(title, chapter, section)
+        if not os.path.exists(file_path):
+            journal.forget(chapter, section)
+            continue
+        with open(file_path, "r", encoding="utf-8") as f:
+            content = f.read()
+        draft = journal.get(chapter, section, DRAFT_WRITTEN)
+        state_manager.recover_section(llm, content, {"chapter": chapter, "section": section}, draft.get("delta"))
+    state_manager.flush()
+    journal.compact()
+
+def write_chapters_from_outline(llm, title, outline_text, meta, words_per_section, novel_config=None):
+    """阶段 2：读取嵌套大纲，按章建立文件夹，逐节创作。返回本次新写完的小节数。"""
+    with metrics.metric_labels(novel=title):
+        return _write_chapters_from_outline(llm, title, outline_text, meta, words_per_section, novel_config)
+
+def _write_chapters_from_outline(llm, title, outline_text, meta, words_per_section, novel_config=None):
     if not os.path.exists(title):
         os.makedirs(title)
+    novel_config = novel_config or {}
 
     # 初始化状态管理器
-    state_manager = StateManager(title)
+    # 状态常驻内存，每 state_flush_every 次更新写回一次磁盘（结束时总会写回）
+    # 预写日志：逐节记录正文写完、状态落盘、记忆入库三个步骤，崩溃后只补做缺失的步骤
+    journal = SectionJournal(title)
+    state_manager = StateManager(title, rag_config=novel_config.get("rag"),
+                                 flush_every=novel_config.get("state_flush_every", 1),
+                                 update_mode=novel_config.get("state_update_mode", "full"),
+                                 journal=journal)
+    _recover_sections(llm, title, state_manager, journal)
+
+    # 流水线模式：第 n 节的状态更新在后台执行，同时开始起草下一节。
+    # state_lag = k 表示起草时允许最多 k 节的状态更新尚未完成；0 为原有的串行模式。
+    # 状态更新只有一个后台线程，因此总是按小节顺序应用。
+    state_lag = int(novel_config.get("state_lag", 0) or 0)
+    state_executor = ThreadPoolExecutor(max_workers=1) if state_lag > 0 else None
+    pending_updates = deque()
+    # 融合模式：起草调用在正文之后直接附带状态增量块，每节省去一次状态更新请求
+    fused = bool(novel_config.get("fused_state_update", False))
+    # 记忆树：每章写完后在后台把本章小节记忆归并为章级/卷级摘要。
+    # 有状态更新线程时排在它后面执行（保证本章记忆都已入库），否则使用单独的后台线程。
+    consolidation_executor = None
+    if state_manager.memory_tree:
+        consolidation_executor = state_executor or ThreadPoolExecutor(max_workers=1)
+    pending_consolidations = []
 
     details_str = ""
     for category, fields in meta.items():
@@ -196,49 +446,66 @@ def write_chapters_from_outline(llm, title, outline_text, meta, words_per_sectio
         else:
             details_str += f"{fields}\n"
 
-    chapter_blocks = re.split(r"(第\d+章：.*)", outline_text)
-    
-    chapter_id = 0
-    chapter_title = ""
-    chapter_dir = "" # 初始化防止报错
+    # 大纲只解析一次（缓存为 JSON），已完成的小节记录在与大纲指纹绑定的完成清单中。
+    # 续传时清单记为整章完成的章节直接跳过，只有部分完成的章节 listdir 一次核对文件
+    outline = load_outline(title, outline_text)
+    manifest = CompletionManifest(title, outline.fingerprint)
+    if len(manifest):
+        print(f"断点续传：已完成 {len(manifest)}/{outline.section_count} 节，跳过已完成的小节。")
 
-    for block in chapter_blocks:
-        if not block.strip():
-            continue
-            
-        # 章节标题行
-        if block.strip().startswith("第") and "章：" in block:
-            chapter_title = block.strip()
-            chapter_id += 1
-            chapter_dir = os.path.join(title, f"第{chapter_id:02d}章")
-            if not os.path.exists(chapter_dir):
-                os.makedirs(chapter_dir)
-            continue
-        
-        # 章节内容块（包含"第N节"）
-        sections = re.findall(r"第\d+节：(.*)", block)
-        if not sections:
-            continue
+    interrupted = False
+    written_count = 0
 
-        if not chapter_dir:
-            print(f"⚠️ 跳过无法归属章节的大纲片段: {block[:50]}...")
-            continue
+    for chapter in outline.chapters:
+        if interrupted:
+            break
+        chapter_id = chapter.number
+        chapter_title = chapter.title
+        chapter_dir = os.path.join(title, f"第{chapter_id:02d}章")
+        current_chapter_plan = chapter.plan # 本章的完整大纲内容作为局部上下文
+        complete = manifest.chapter_done(chapter_id, [section.number for section in chapter.sections])
+        written = set(os.listdir(chapter_dir)) if not complete and os.path.isdir(chapter_dir) else set()
 
-        current_chapter_plan = block.strip() # 提取本章的完整大纲内容作为局部上下文
-        
-        for j, mission in enumerate(sections, 1):
-            file_path = os.path.join(chapter_dir, f"第{j:02d}节.txt")
-            
-            # 断点续传检查
-            if os.path.exists(file_path):
-                print(f"检测到 {chapter_title} - 第 {j} 节 已存在，自动跳过。")
+        for section in ([] if complete else chapter.sections):
+            j, mission = section.number, section.mission
+            file_path = _section_path(title, chapter_id, j)
+            partial_path = file_path + ".partial"
+
+            # 是否完成以文件为准：清单落后于磁盘（上次在清单写盘前退出）时补记，文件被删除时重新创作
+            if os.path.basename(file_path) in written:
+                if not manifest.is_done(chapter_id, j):
+                    print(f"检测到 {chapter_title} - 第 {j} 节 已存在，自动跳过。")
+                    manifest.mark_done(chapter_id, j)
                 continue
+            if manifest.is_done(chapter_id, j):
+                print(f"⚠️ {chapter_title} - 第 {j} 节 的正文文件已不存在，重新创作。")
+                manifest.discard(chapter_id, j)
+            os.makedirs(chapter_dir, exist_ok=True)
 
-            print(f"正在根据大纲创作 {chapter_title} - 第 {j} 节...")
+            # 上次流式输出中断留下的半成品，在此基础上续写
+            existing = ""
+            if os.path.exists(partial_path):
+                with open(partial_path, "r", encoding="utf-8") as f:
+                    existing = f.read()
+            if existing:
+                print(f"检测到 {chapter_title} - 第 {j} 节 未写完（已有 {len(existing)} 字），继续续写...")
+            else:
+                print(f"正在根据大纲创作 {chapter_title} - 第 {j} 节...")
             
+            # 等待足够早的状态更新完成，保证本节基于第 (n-1-k) 节之后的状态快照起草
+            while len(pending_updates) > state_lag:
+                pending_updates.popleft().result()
+
             # 获取当前实时状态上下文 (Summary + Character State + Arcs + RAG Memory)
-            # 使用当前章节大纲作为查询 query
-            state_context = state_manager.get_context_prompt(llm=llm, current_query=current_chapter_plan)
+            # 以本节任务（带上章标题）作为查询 query：同一章的各节按各自的任务取舍上下文，
+            # 用整章大纲查询时每节得到的排序都一样
+            section_query = f"{chapter_title}\n{mission}"
+            with metrics.stage("context"):
+                # 只检索本节之前写入的记忆（重写前面的章节时不会读到“未来”的剧情）
+                state_context = state_manager.get_context_prompt(
+                    llm=llm, current_query=section_query, token_budget=novel_config.get("context_budget"),
+                    filters={"before": (chapter_id, j)}
+                )
 
             # --- Retry Loop for Safety/Content Blocks ---
             max_retries = 3
@@ -275,12 +542,35 @@ def write_chapters_from_outline(llm, title, outline_text, meta, words_per_sectio
                 【注意】：这是该小说的第 {chapter_id} 章第 {j} 节，请在内容中确保逻辑连贯。
                 请展开细节，创作约 {words_per_section} 字的小说正文。
                 """
+                if fused:
+                    write_prompt += f"""
+                【状态记录】：正文写完后，另起一行输出 {STATE_DELTA_MARKER}，再输出一个 JSON 对象，
+                记录本节引起的状态变化（这部分不属于正文，不计入字数）。
+                {DELTA_INSTRUCTIONS}
+                JSON 须符合以下 JSON Schema：
+                {json.dumps(STATE_DELTA_SCHEMA, ensure_ascii=False)}
+                """
+                if existing:
+                    write_prompt += f"""
+                【断点续写】：本节已经写出了以下内容，请紧接着最后一个字继续往下写，
+                不要重复已有内容，也不要添加任何说明。全文（含已有部分）约 {words_per_section} 字：
+                {existing}
+                """
                 
-                content = llm.generate_content(prompt=write_prompt, system_instruction=write_system)
+                try:
+                    with metrics.stage("draft"):
+                        content = _stream_section(llm, write_prompt, write_system, partial_path,
+                                                  stop_marker=STATE_DELTA_MARKER if fused else None)
+                except Exception as e:
+                    print(f"\n❌ [流式输出中断] {chapter_title} 第 {j} 节: {e}")
+                    print("已生成的部分保存在 .partial 文件中，重新运行即可续写。")
+                    interrupted = True
+                    break
                 
                 # 检查是否发生 LLM 错误 (Safety Block usually returns a specific message or empty)
                 if content.startswith("⚠️"):
                     print(f"⚠️ [尝试 {current_try + 1}/{max_retries}] 创作触发安全/错误拦截: {content}")
+                    metrics.inc("pynovel_safety_retries_total", stage="draft")
                     
                     # 尝试修正大纲
                     new_plan = sanitize_chapter_outline(llm, current_chapter_plan, content)
@@ -294,16 +584,56 @@ def write_chapters_from_outline(llm, title, outline_text, meta, words_per_sectio
                     # Success
                     break
             
+            if interrupted:
+                break
+
             # End of Retry Loop check
-            if content.startswith("⚠️"):
+            delta_block = None
+            failed = content.startswith("⚠️")
+            if failed:
                 print(f"\n❌ [正文创作失败] {chapter_title} 第 {j} 节在 {max_retries} 次尝试后仍然失败。跳过本节。")
-                content = f"（本节内容因反复触发安全策略生成失败，请人工介入补全。错误信息：{content}）"
-            
-            with open(file_path, "w", encoding="utf-8") as f:
-                f.write(content)
+                content = existing + f"（本节内容因反复触发安全策略生成失败，请人工介入补全。错误信息：{content}）"
+            else:
+                if fused and STATE_DELTA_MARKER in content:
+                    content, delta_block = content.split(STATE_DELTA_MARKER, 1)
+                    content = content.rstrip()
+                content = existing + content
+            # 先写预写日志再改名：正式文件一旦存在，日志中必有对应记录（融合模式连同状态增量块）
+            journal.record(chapter_id, j, DRAFT_WRITTEN, delta=delta_block)
+            _finish_section(partial_path, file_path, content if failed else None)
+            manifest.mark_done(chapter_id, j)
+            written_count += 1
                 
             # --- State Update ---
             # 使用 StateManager 更新全局摘要、角色状态和伏笔
-            state_manager.update_state(llm, content)
+            section_meta = {"chapter": chapter_id, "section": j}
+            if fused:
+                update = functools.partial(state_manager.apply_fused_update, llm, delta_block, content, section_meta)
+            else:
+                update = functools.partial(state_manager.update_state, llm, content, section_meta)
+            if state_executor:
+                pending_updates.append(state_executor.submit(metrics.bind_labels(update)))
+            else:
+                update()
                 
             print(f"第 {chapter_id} 章第 {j} 节完成。")
+
+        manifest.flush()
+        if consolidation_executor and not interrupted:
+            consolidate = functools.partial(state_manager.consolidate_chapter, llm, chapter_id)
+            pending_consolidations.append(consolidation_executor.submit(metrics.bind_labels(consolidate)))
+
+    # 等待剩余的后台状态更新全部落盘
+    if state_executor:
+        while pending_updates:
+            pending_updates.popleft().result()
+        state_executor.shutdown()
+    for future in pending_consolidations:
+        future.result()
+    if consolidation_executor:
+        consolidation_executor.shutdown()
+    state_manager.flush()
+    state_manager.save_memory_index()
+    manifest.flush()
+    journal.compact()
+    return written_count
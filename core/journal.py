@@ -0,0 +1,98 @@
+import json
+import os
+import threading
+
+from core.jsonl_log import read_log_records
+
+# 每节依次经历的三个步骤
+DRAFT_WRITTEN = "draft_written"   # 正文已写完（记录先于 .partial 改名为正式文件）
+STATE_APPLIED = "state_applied"   # 状态更新已写回磁盘（随 StateManager.flush 记录）
+MEMORY_INDEXED = "memory_indexed" # 本节记忆已存入记忆库
+STEPS = (DRAFT_WRITTEN, STATE_APPLIED, MEMORY_INDEXED)
+
+def section_key(metadata):
+    """从记忆元数据中取出 (章, 节)；缺少章节信息时返回 None（不记入日志）。"""
+    metadata = metadata or {}
+    if isinstance(metadata.get("chapter"), int) and isinstance(metadata.get("section"), int):
+        return metadata["chapter"], metadata["section"]
+    return None
+
+def _parse_record(record):
+    return (int(record["chapter"]), int(record["section"])), record
+
+
+class SectionJournal:
+    """
+    每部小说一份的预写日志（小说目录下的 journal.jsonl），逐节记录三个步骤是否完成。
+
+    每条记录追加写入后立即 fsync。进程在任意位置退出后，重新启动时 incomplete()
+    给出写完正文但状态或记忆没有落盘的小节，由调用方按日志顺序只补做缺失的步骤。
+    全部完成的小节在 compact 时从日志中移除，日志只保留未完成的尾部。
+    """
+    FILE_NAME = "journal.jsonl"
+
+    def __init__(self, novel_dir):
+        self.path = os.path.join(novel_dir, self.FILE_NAME)
+        self._lock = threading.Lock()
+        self._sections = {} # (章, 节) -> {步骤: 记录}，按首次出现的顺序
+        self._stale = False # 内存中丢弃了记录，需要在 compact 时写回
+        self._load()
+
+    def _load(self):
+        for key, record in read_log_records(self.path, _parse_record, "预写日志"):
+            if record.get("step") in STEPS:
+                self._sections.setdefault(key, {})[record["step"]] = record
+
+    def record(self, chapter, section, step, **fields):
+        """追加一条记录并落盘；值为 None 的字段不写入。"""
+        record = {"chapter": chapter, "section": section, "step": step}
+        record.update({k: v for k, v in fields.items() if v is not None})
+        line = json.dumps(record, ensure_ascii=False) + "\n"
+        with self._lock:
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(line)
+                f.flush()
+                os.fsync(f.fileno())
+            self._sections.setdefault((chapter, section), {})[step] = record
+
+    def has(self, chapter, section, step):
+        with self._lock:
+            return step in self._sections.get((chapter, section), {})
+
+    def get(self, chapter, section, step):
+        with self._lock:
+            return self._sections.get((chapter, section), {}).get(step)
+
+    def incomplete(self):
+        """正文已写完但状态或记忆未完成的小节 [(章, 节)]，按日志顺序排列。"""
+        with self._lock:
+            return [key for key, steps in self._sections.items()
+                    if DRAFT_WRITTEN in steps and not all(step in steps for step in STEPS)]
+
+    def forget(self, chapter, section):
+        """丢弃某节的记录（正文文件并未真正写出，该节会重新创作）。"""
+        with self._lock:
+            if self._sections.pop((chapter, section), None) is not None:
+                self._stale = True
+
+    def compact(self):
+        """把日志重写为只含未完成小节的记录（临时文件 + os.replace）。"""
+        with self._lock:
+            done = [key for key, steps in self._sections.items() if all(step in steps for step in STEPS)]
+            if not done and not self._stale:
+                return
+            for key in done:
+                del self._sections[key]
+            tmp_path = self.path + ".tmp"
+            try:
+                with open(tmp_path, "w", encoding="utf-8") as f:
+                    for steps in self._sections.values():
+                        for step in STEPS:
+                            if step in steps:
+                                f.write(json.dumps(steps[step], ensure_ascii=False) + "\n")
+                    f.flush()
+                    os.fsync(f.fileno())
+                os.replace(tmp_path, self.path)
+                self._stale = False
+            except OSError as e:
+                print(f"⚠️ 预写日志压缩失败: {e}")
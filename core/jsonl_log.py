@@ -0,0 +1,50 @@
+import json
+import os
+
+def read_log_records(path, parse, label):
+    """
+    逐行读取追加写入的 JSONL 日志（记忆日志、预写日志共用），返回 parse(记录) 的结果列表。
+    parse 抛出 ValueError / KeyError / TypeError 的行视为损坏并跳过。
+    最后一行没有换行（进程在追加途中崩溃）时，读完后立即用 repair_log_tail 修复。
+    """
+    results = []
+    if not os.path.exists(path):
+        return results
+    offset = 0
+    tail = None # 没有以换行结尾的最后一行：(起始偏移, 是否完整可用)
+    with open(path, "rb") as f:
+        for line_no, line in enumerate(f, 1):
+            start, offset = offset, offset + len(line)
+            if not line.strip():
+                continue
+            try:
+                parsed, valid = parse(json.loads(line)), True
+            except (ValueError, KeyError, TypeError):
+                parsed, valid = None, False
+            if not line.endswith(b"\n"):
+                tail = (start, valid)
+            if valid:
+                results.append(parsed)
+            elif line.endswith(b"\n"):
+                print(f"⚠️ {label}第 {line_no} 行无法解析，已忽略。")
+    if tail:
+        repair_log_tail(path, *tail, label=label)
+    return results
+
+def repair_log_tail(path, start, complete, label):
+    """
+    修复末尾没有换行的日志，必须在下一次追加之前完成，否则新记录会接在半行后面一起损坏。
+    写了一半的最后一行直接截掉（对应的操作也尚未执行）；内容完整只缺换行的补上换行。
+    """
+    try:
+        with open(path, "r+b") as f:
+            if complete:
+                f.seek(0, os.SEEK_END)
+                f.write(b"\n")
+            else:
+                print(f"⚠️ {label}末尾存在不完整记录（上次写入时中断），已截断。")
+                f.truncate(start)
+            f.flush()
+            os.fsync(f.fileno())
+    except OSError as e:
+        print(f"⚠️ 修复{label}末尾失败: {e}")
@@ -0,0 +1,94 @@
+import math
+import re
+from collections import Counter
+
+# 连续的字母/数字/汉字片段；标点与空白只起分隔作用
+_RUN = re.compile(r"\w+")
+
+def char_bigrams(text):
+    """
+    按字符二元组切词：人名、地名、物品名无需分词词典即可命中。
+    只有一个字的片段保留为单字。
+    """
+    terms = []
+    for run in _RUN.findall((text or "").lower()):
+        run = run.replace("_", "")
+        if len(run) == 1:
+            terms.append(run)
+        else:
+            terms.extend(run[i:i + 2] for i in range(len(run) - 1))
+    return terms
+
+
+class BM25Index:
+    """
+    基于字符二元组的内存倒排索引，使用 BM25 打分。
+
+    文档编号即 RAGEngine.documents 中的下标，只支持追加（add），与记忆库一致。
+    """
+
+    def __init__(self, k1=1.5, b=0.75):
+        self.k1 = k1
+        self.b = b
+        self.postings = {} # term -> {doc_id: 词频}
+        self.doc_lengths = []
+        self.total_length = 0
+
+    def __len__(self):
+        return len(self.doc_lengths)
+
+    def add(self, text):
+        """追加一篇文档，返回其编号。"""
+        doc_id = len(self.doc_lengths)
+        terms = Counter(char_bigrams(text))
+        for term, tf in terms.items():
+            self.postings.setdefault(term, {})[doc_id] = tf
+        length = sum(terms.values())
+        self.doc_lengths.append(length)
+        self.total_length += length
+        return doc_id
+
+    def search(self, query, top_k=3, candidates=None, limit=None, exclude=None):
+        """
+        返回 [(得分, 文档编号)]，按得分降序；没有任何词命中时返回空列表。
+
+        :param candidates: (可选) 候选文档编号集合，只给这些文档打分。
+        :param limit: (可选) 只给编号小于 limit 的文档打分。
+        :param exclude: (可选) 不参与打分的文档编号（支持 in 判断的容器即可）。
+        """
+        n = len(self.doc_lengths)
+        if not n or top_k <= 0 or candidates is not None and not candidates:
+            return []
+        avg_length = self.total_length / n or 1.0
+        scores = {}
+        for term, qtf in Counter(char_bigrams(query)).items():
+            docs = self.postings.get(term)
+            if not docs:
+                continue
+            idf = math.log(1 + (n - len(docs) + 0.5) / (len(docs) + 0.5))
+            if candidates is not None:
+                # 从较小的一侧遍历：候选集很小时不必扫完整条倒排链
+                if len(candidates) < len(docs):
+                    docs = {d: docs[d] for d in candidates if d in docs}
+                else:
+                    docs = {d: tf for d, tf in docs.items() if d in candidates}
+            for doc_id, tf in docs.items():
+                if (limit is not None and doc_id >= limit) or (exclude and doc_id in exclude):
+                    continue
+                norm = self.k1 * (1 - self.b + self.b * self.doc_lengths[doc_id] / avg_length)
+                scores[doc_id] = scores.get(doc_id, 0.0) + qtf * idf * tf * (self.k1 + 1) / (tf + norm)
+        # 得分相同时按插入顺序
+        ranked = sorted(scores.items(), key=lambda item: (-item[1], item[0]))
+        return [(score, doc_id) for doc_id, score in ranked[:top_k]]
+
+
+def reciprocal_rank_fusion(rankings, k=60):
+    """
+    倒数排名融合 (RRF)：把多路检索的排名列表合成一个，得分为 sum(1 / (k + 名次))。
+    rankings 为若干个按相关度降序排列的文档编号列表。
+    """
+    fused = {}
+    for ranking in rankings:
+        for rank, doc_id in enumerate(ranking, 1):
+            fused[doc_id] = fused.get(doc_id, 0.0) + 1.0 / (k + rank)
+    return [doc_id for doc_id, _ in sorted(fused.items(), key=lambda item: (-item[1], item[0]))]
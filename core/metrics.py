@@ -0,0 +1,195 @@
+import contextvars
+import json
+import math
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+# 当前调用链上的标签（stage / novel 等），驱动与生成器记录指标时自动带上
+_labels = contextvars.ContextVar("metrics_labels", default={})
+
+# 延迟直方图的桶上限（秒）
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+# 指标名 -> (类型, 说明)
+METRIC_HELP = {
+    "pynovel_llm_request_seconds": ("histogram", "单次 LLM 接口调用耗时"),
+    "pynovel_llm_requests_total": ("counter", "LLM 接口调用次数，按 outcome 区分成功与失败"),
+    "pynovel_llm_prompt_tokens_total": ("counter", "提示词 token 数"),
+    "pynovel_llm_completion_tokens_total": ("counter", "生成 token 数"),
+    "pynovel_llm_retries_total": ("counter", "因限流等原因重试的次数"),
+    "pynovel_safety_retries_total": ("counter", "触发安全拦截后修正重试的次数"),
+    "pynovel_stage_seconds": ("histogram", "流水线各阶段的耗时"),
+}
+
+def current_labels():
+    return dict(_labels.get())
+
+@contextmanager
+def metric_labels(**labels):
+    """在上下文内附加标签，例如 metric_labels(novel=title)。"""
+    token = _labels.set({**_labels.get(), **labels})
+    try:
+        yield
+    finally:
+        _labels.reset(token)
+
+def bind_labels(fn):
+    """
+    把当前标签绑定到 fn 上，供提交到线程池的任务使用
+    （线程池中的线程不会继承提交方的 contextvars）。
+    """
+    labels = _labels.get()
+
+    def bound(*args, **kwargs):
+        token = _labels.set(labels)
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            _labels.reset(token)
+    return bound
+
+@contextmanager
+def stage(name):
+    """标记流水线阶段：上下文内的调用都带 stage 标签，并记录该阶段耗时。"""
+    started = time.perf_counter()
+    with metric_labels(stage=name):
+        try:
+            yield
+        finally:
+            observe("pynovel_stage_seconds", time.perf_counter() - started)
+
+
+class MetricsRegistry:
+    """进程内的指标注册表：计数器与直方图，按 (指标名, 标签) 分组，线程安全。"""
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = tuple(buckets)
+        self._lock = threading.Lock()
+        self._counters = {}
+        self._histograms = {}
+
+    @staticmethod
+    def _key(name, labels):
+        return name, tuple(sorted((k, str(v)) for k, v in labels.items() if v is not None))
+
+    def inc(self, name, value=1, **labels):
+        key = self._key(name, labels)
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def observe(self, name, value, **labels):
+        key = self._key(name, labels)
+        with self._lock:
+            hist = self._histograms.get(key)
+            if hist is None:
+                hist = {"count": 0, "sum": 0.0, "max": 0.0, "buckets": [0] * len(self.buckets)}
+                self._histograms[key] = hist
+            hist["count"] += 1
+            hist["sum"] += value
+            hist["max"] = max(hist["max"], value)
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    hist["buckets"][i] += 1
+
+    def reset(self):
+        with self._lock:
+            self._counters.clear()
+            self._histograms.clear()
+
+    # ---------- 导出 ----------
+
+    @staticmethod
+    def _format_labels(labels, extra=None):
+        items = list(labels) + (list(extra) if extra else [])
+        if not items:
+            return ""
+        escaped = [(k, v.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")) for k, v in items]
+        return "{" + ",".join(f'{k}="{v}"' for k, v in escaped) + "}"
+
+    def prometheus_text(self):
+        """Prometheus 文本格式 (node_exporter textfile collector 可直接读取)。"""
+        with self._lock:
+            counters = dict(self._counters)
+            histograms = {k: dict(v, buckets=list(v["buckets"])) for k, v in self._histograms.items()}
+
+        lines = []
+        names = sorted({name for name, _ in counters} | {name for name, _ in histograms})
+        for name in names:
+            metric_type, help_text = METRIC_HELP.get(name, ("untyped", name))
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {metric_type}")
+            for (metric, labels), value in sorted(counters.items()):
+                if metric == name:
+                    lines.append(f"{name}{self._format_labels(labels)} {value}")
+            for (metric, labels), hist in sorted(histograms.items()):
+                if metric != name:
+                    continue
+                for bound, count in zip(self.buckets, hist["buckets"]):
+                    lines.append(f"{name}_bucket{self._format_labels(labels, [('le', repr(float(bound)))])} {count}")
+                lines.append(f"{name}_bucket{self._format_labels(labels, [('le', '+Inf')])} {hist['count']}")
+                lines.append(f"{name}_sum{self._format_labels(labels)} {hist['sum']}")
+                lines.append(f"{name}_count{self._format_labels(labels)} {hist['count']}")
+        return "\n".join(lines) + "\n"
+
+    def summary(self, **match):
+        """
+        JSON 友好的汇总，可按标签过滤，例如 summary(novel=title) 只统计一本小说。
+        返回 {"counters": [...], "histograms": [...]}，每项含 name、labels 与数值。
+        """
+        match = {k: str(v) for k, v in match.items()}
+
+        def selected(labels):
+            labels = dict(labels)
+            return all(labels.get(k) == v for k, v in match.items())
+
+        with self._lock:
+            counters = [
+                {"name": name, "labels": dict(labels), "value": value}
+                for (name, labels), value in sorted(self._counters.items()) if selected(labels)
+            ]
+            histograms = [
+                {"name": name, "labels": dict(labels), "count": h["count"], "sum": h["sum"],
+                 "mean": h["sum"] / h["count"] if h["count"] else 0.0, "max": h["max"]}
+                for (name, labels), h in sorted(self._histograms.items()) if selected(labels)
+            ]
+        return {"counters": counters, "histograms": histograms}
+
+    def write_prometheus(self, path):
+        _atomic_write(path, self.prometheus_text())
+
+    def write_summary(self, path, **match):
+        _atomic_write(path, json.dumps(self.summary(**match), ensure_ascii=False, indent=2))
+
+
+def _atomic_write(path, content):
+    directory = os.path.dirname(path)
+    if directory and not os.path.exists(directory):
+        os.makedirs(directory)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(content)
+    os.replace(tmp_path, path)
+
+
+registry = MetricsRegistry()
+
+def inc(name, value=1, **labels):
+    """计数器加 value，自动合并当前上下文标签。"""
+    registry.inc(name, value, **{**_labels.get(), **labels})
+
+def observe(name, value, **labels):
+    """直方图记录一个观测值，自动合并当前上下文标签。"""
+    registry.observe(name, value, **{**_labels.get(), **labels})
+
+def record_token_usage(usage, **labels):
+    """记录 usage_to_dict 格式的 token 用量。"""
+    if not usage:
+        return
+    prompt_tokens = usage.get("prompt_tokens")
+    completion_tokens = usage.get("completion_tokens")
+    if isinstance(prompt_tokens, (int, float)) and not math.isnan(prompt_tokens):
+        inc("pynovel_llm_prompt_tokens_total", prompt_tokens, **labels)
+    if isinstance(completion_tokens, (int, float)) and not math.isnan(completion_tokens):
+        inc("pynovel_llm_completion_tokens_total", completion_tokens, **labels)
@@ -0,0 +1,223 @@
+import hashlib
+import json
+import os
+import re
+
+OUTLINES_DIR = "outlines"
+
+# 章标题必须独占一行（允许前面带 Markdown 的 #、*、- 等修饰），
+# 正文或路标里顺带提到的“第N章：”不会被当成新的一章
+_CHAPTER_HEADING = re.compile(r"^[ \t#>*-]*(第(\d+)章：.*?)[ \t*]*$", re.M)
+_SECTION = re.compile(r"第\d+节：(.*)")
+
+def outline_model_path(title):
+    """解析后的大纲模型与大纲 Markdown 放在同一目录。"""
+    return os.path.join(OUTLINES_DIR, f"{title}_outline.json")
+
+def _fingerprint(outline_text):
+    """
+    只对第一个章标题起的部分取 sha256：解析结果只取决于这部分，生成大纲时的纯章节大纲
+    与之后重新读取的大纲文件（前面多了书名与全局路标）得到同一个指纹。
+    """
+    match = _CHAPTER_HEADING.search(outline_text)
+    body = outline_text[match.start():] if match else outline_text
+    return hashlib.sha256(body.strip().encode("utf-8")).hexdigest()
+
+def split_chapters(outline_text):
+    """
+    按独占一行的“第N章：”标题切分大纲，返回 [(标题, 正文), ...]，标题之前的内容被忽略。
+    与 OutlineModel.parse 使用同一条标题规则；正文从标题之后开始，到下一个标题行之前结束。
+    """
+    headings = list(_CHAPTER_HEADING.finditer(outline_text))
+    return [
+        (match.group(1), outline_text[match.end(1):headings[i + 1].start() if i + 1 < len(headings) else len(outline_text)])
+        for i, match in enumerate(headings)
+    ]
+
+def _atomic_write_json(path, data):
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False)
+    os.replace(tmp_path, path)
+
+
+class Section:
+    __slots__ = ("number", "mission")
+
+    def __init__(self, number, mission):
+        self.number = number
+        self.mission = mission
+
+
+class Chapter:
+    __slots__ = ("number", "title", "plan", "sections")
+
+    def __init__(self, number, title, plan, sections):
+        self.number = number
+        self.title = title
+        self.plan = plan # 本章完整大纲（不含标题行），作为起草时的局部上下文
+        self.sections = sections
+
+
+class OutlineModel:
+    """
+    解析好的大纲：[Chapter(number, title, plan, [Section(number, mission)])]。
+
+    章号取自标题中的数字，而不是按出现次数计数；没有任何小节的标题（多余的标题行）被忽略，
+    重复的章号只保留第一次出现的那一章。fingerprint 为大纲章节部分的 sha256，用于判断缓存是否过期。
+    """
+    __slots__ = ("fingerprint", "chapters")
+
+    def __init__(self, fingerprint, chapters):
+        self.fingerprint = fingerprint
+        self.chapters = chapters
+
+    @property
+    def section_count(self):
+        return sum(len(chapter.sections) for chapter in self.chapters)
+
+    @classmethod
+    def parse(cls, outline_text):
+        headings = list(_CHAPTER_HEADING.finditer(outline_text))
+        chapters, seen = [], set()
+        for i, match in enumerate(headings):
+            end = headings[i + 1].start() if i + 1 < len(headings) else len(outline_text)
+            plan = outline_text[match.end():end].strip()
+            missions = _SECTION.findall(plan)
+            number = int(match.group(2))
+            if not missions:
+                continue
+            if number in seen:
+                print(f"⚠️ 大纲中第 {number} 章重复出现，忽略后一处: {match.group(1)[:30]}")
+                continue
+            seen.add(number)
+            sections = [Section(j, mission) for j, mission in enumerate(missions, 1)]
+            chapters.append(Chapter(number, match.group(1).strip(), plan, sections))
+        return cls(_fingerprint(outline_text), chapters)
+
+    def to_dict(self):
+        return {
+            "fingerprint": self.fingerprint,
+            "chapters": [
+                {"number": c.number, "title": c.title, "plan": c.plan,
+                 "sections": [s.mission for s in c.sections]}
+                for c in self.chapters
+            ],
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        chapters = [
+            Chapter(c["number"], c["title"], c["plan"],
+                    [Section(j, mission) for j, mission in enumerate(c["sections"], 1)])
+            for c in data["chapters"]
+        ]
+        return cls(data["fingerprint"], chapters)
+
+    def save(self, path):
+        """原子地写入 JSON，失败只打印警告（下次运行重新解析即可）。"""
+        try:
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+            _atomic_write_json(path, self.to_dict())
+        except OSError as e:
+            print(f"⚠️ 大纲模型保存失败: {e}")
+
+
+def load_outline(title, outline_text):
+    """
+    读取缓存的大纲模型；缓存不存在、损坏或与当前大纲原文不一致时重新解析并写回。
+    """
+    path = outline_model_path(title)
+    fingerprint = _fingerprint(outline_text)
+    if os.path.exists(path):
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            if data.get("fingerprint") == fingerprint:
+                return OutlineModel.from_dict(data)
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            print(f"⚠️ 大纲模型缓存无法读取，重新解析: {e}")
+    model = OutlineModel.parse(outline_text)
+    model.save(path)
+    return model
+
+
+class CompletionManifest:
+    """
+    已写完的小节清单（小说目录下的 manifest.json），断点续传时据此直接算出剩余任务。
+
+    清单记录所对应大纲的指纹，大纲改动后清单作废、从空清单重新开始。指纹一致时，
+    清单记为整章完成的章节（chapter_done）直接信任，不再访问文件系统；只有部分完成的章节由调用方
+    listdir 一次核对：清单中的小节文件不存在（被删除）时用 discard 移出并重新创作，
+    清单中没有但文件已存在（上次在清单写盘前退出）时补记。手动删除已完成章节中的小节后，
+    需一并删除清单，清单丢失时按章节目录重新扫描。
+    清单只在 flush 时写盘（每章结束与运行结束时）。
+    """
+    FILE_NAME = "manifest.json"
+
+    def __init__(self, novel_dir, fingerprint=None):
+        self.path = os.path.join(novel_dir, self.FILE_NAME)
+        self.fingerprint = fingerprint
+        self._dirty = False
+        self.completed = self._load(novel_dir)
+
+    def _load(self, novel_dir):
+        if os.path.exists(self.path):
+            try:
+                with open(self.path, "r", encoding="utf-8") as f:
+                    data = json.load(f)
+                if self.fingerprint is not None and data.get("fingerprint") != self.fingerprint:
+                    print("🔄 大纲已变化，完成清单重置。")
+                    self._dirty = True
+                    return {}
+                return {int(chapter): set(sections) for chapter, sections in data["completed"].items()}
+            except (OSError, ValueError, KeyError, TypeError, AttributeError) as e:
+                print(f"⚠️ 完成清单无法读取，按章节目录重新扫描: {e}")
+        return self._scan(novel_dir)
+
+    def _scan(self, novel_dir):
+        """每个章节目录 listdir 一次，重建清单（旧版本写出的小说目录没有清单）。"""
+        completed = {}
+        if not os.path.isdir(novel_dir):
+            return completed
+        for name in os.listdir(novel_dir):
+            match = re.fullmatch(r"第(\d+)章", name)
+            if not match or not os.path.isdir(os.path.join(novel_dir, name)):
+                continue
+            sections = {int(m.group(1)) for m in
+                        (re.fullmatch(r"第(\d+)节\.txt", f) for f in os.listdir(os.path.join(novel_dir, name))) if m}
+            if sections:
+                completed[int(match.group(1))] = sections
+        self._dirty = bool(completed)
+        return completed
+
+    def __len__(self):
+        return sum(len(sections) for sections in self.completed.values())
+
+    def is_done(self, chapter, section):
+        return section in self.completed.get(chapter, ())
+
+    def chapter_done(self, chapter, sections):
+        """sections 中的小节是否全部已完成。"""
+        return self.completed.get(chapter, set()).issuperset(sections)
+
+    def mark_done(self, chapter, section):
+        if not self.is_done(chapter, section):
+            self.completed.setdefault(chapter, set()).add(section)
+            self._dirty = True
+
+    def discard(self, chapter, section):
+        if self.is_done(chapter, section):
+            self.completed[chapter].discard(section)
+            self._dirty = True
+
+    def flush(self):
+        if not self._dirty:
+            return
+        data = {"fingerprint": self.fingerprint,
+                "completed": {str(c): sorted(s) for c, s in sorted(self.completed.items())}}
+        try:
+            _atomic_write_json(self.path, data)
+            self._dirty = False
+        except OSError as e:
+            print(f"⚠️ 完成清单写入失败，将在下次保存时重试: {e}")
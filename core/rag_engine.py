@@ -1,16 +1,99 @@
-
+import bisect
 import json
 import os
 import math
+import struct
+from array import array
+
+from core.ann_index import create_index
+from core.jsonl_log import read_log_records
+from core.lexical_index import BM25Index, reciprocal_rank_fusion
+
+try:
+    import numpy as np
+except ImportError:
+    # 未安装 NumPy 时退回纯 Python 实现
+    np = None
+
+# 向量侧车文件头：8 字节魔数 + uint32 维度 + uint32 保留位，之后是逐行的 float32 (小端)
+VECTOR_MAGIC = b"PNVEC01\0"
+VECTOR_HEADER = struct.Struct("<8sII")
+
+def pack_vector_header(dim):
+    return VECTOR_HEADER.pack(VECTOR_MAGIC, dim, 0)
+
+def _parse_log_record(record):
+    record["text"] # 缺少原文的记录视为损坏
+    return record
+
+def unit_vector(vector):
+    norm = math.sqrt(sum(a * a for a in vector))
+    if norm == 0:
+        return [0.0] * len(vector)
+    return [a / norm for a in vector]
+
+# 支持作为检索过滤条件的列表型元数据字段（与章节号一起建立二级索引）
+TAG_FIELDS = ("characters", "arcs")
+
+# 记忆树的层级：小节记忆 -> 章级摘要节点 -> 卷级摘要节点。
+# 摘要节点也是普通文档，metadata 中 level 标明层级，children 列出下一层的文档下标。
+LEVEL_SECTION = "section"
+LEVEL_CHAPTER = "chapter"
+LEVEL_ARC = "arc"
+
+def pack_vector_row(vector):
+    """归一化后以小端 float32 打包一行向量。"""
+    row = array("f", unit_vector(vector))
+    if struct.pack("=I", 1) != struct.pack("<I", 1):
+        row.byteswap()
+    return row.tobytes()
 
 class RAGEngine:
-    def __init__(self, novel_dir):
+    # 启动时日志记录数超过该值则自动 compact 一次，避免日志无限增长
+    COMPACT_THRESHOLD = 1000
+    # 混合检索时每一路取回的候选数下限，融合后再截取 top_k
+    HYBRID_CANDIDATES = 20
+    # 记忆树逐层检索时每层保留的节点数
+    TREE_BEAM = 2
+
+    def __init__(self, novel_dir, index_backend="exact", index_params=None, ann_min_size=1024):
+        """
+        :param index_backend: 向量索引后端 exact / auto / ivf / hnswlib / faiss，详见 core.ann_index。
+        :param index_params: 后端参数，召回/延迟旋钮为 nprobe (IVF) 或 ef (HNSW)。
+        :param ann_min_size: 记忆条数少于该值时始终精确检索。
+        """
         self.novel_dir = novel_dir
         self.memory_file = os.path.join(novel_dir, "memory.json")
-        self.documents = [] # List of {'text': str, 'vector': list[float], 'metadata': dict}
+        # 追加写日志：add_document 只追加一行 JSON，compact() 时才合并进快照
+        self.memory_log_file = os.path.join(novel_dir, "memory.log.jsonl")
+        # 定长 float32 向量侧车文件，第 i 行对应 documents[i]，以 mmap 方式打开
+        self.vector_file = os.path.join(novel_dir, "memory.vectors.f32")
+        # 记录生成向量所用的嵌入模型，切换模型后需用 tools/reembed_memory.py 重建向量
+        self.meta_file = os.path.join(novel_dir, "memory.meta.json")
+        self.embedding_model = None
+        self.documents = [] # List of {'text': str, 'metadata': dict}，向量存放在 vector_file 中
+        self.dim = 0
+        # 预归一化的 float32 向量矩阵 (N x D)，NumPy 下是 vector_file 的只读内存映射
+        self._matrix = None
+        self._count = 0
+        self._py_vectors = [] # 无 NumPy 时的纯 Python 向量缓存
+        self.index_backend = index_backend
+        self.index_params = dict(index_params or {})
+        self.ann_min_size = ann_min_size
+        self.index = None
+        self._index_saved = 0 # 磁盘上的索引文件包含的条目数，用于跳过没有新增的保存
+        self._reset_side_indexes()
         self._load_memory()
 
     def _load_memory(self):
+        if os.path.exists(self.meta_file):
+            try:
+                with open(self.meta_file, "r", encoding="utf-8") as f:
+                    self.embedding_model = json.load(f).get("embedding_model")
+            except Exception as e:
+                print(f"⚠️ 加载记忆元数据失败: {e}")
+
+        legacy_vectors = []
         if os.path.exists(self.memory_file):
             try:
                 with open(self.memory_file, "r", encoding="utf-8") as f:
@@ -19,50 +102,583 @@ class RAGEngine:
                 print(f"⚠️ 加载记忆文件失败: {e}")
                 self.documents = []
 
-    def save_memory(self):
+            # 旧版 memory.json 将向量内联保存，迁移到侧车文件
+            if any("vector" in doc for doc in self.documents):
+                legacy_vectors = [doc.pop("vector", None) or [] for doc in self.documents]
+
+        replayed = self._replay_log()
+
+        if legacy_vectors:
+            self._migrate_legacy_vectors(legacy_vectors)
+            self._init_index()
+            self.compact()
+        else:
+            self._open_vectors()
+            self._init_index()
+            if replayed >= self.COMPACT_THRESHOLD:
+                self.compact()
+
+        self._reset_side_indexes()
+        for doc_id, doc in enumerate(self.documents):
+            self.lexical.add(doc["text"])
+            self._index_metadata(doc_id, doc["metadata"])
+
+    def _init_index(self):
+        """创建 ANN 索引并加载持久化文件，只补录索引落后于向量文件的部分。"""
+        self.index = None
+        if not self.dim or np is None:
+            return
+        index_path = os.path.join(self.novel_dir, "memory")
+        index = create_index(self.index_backend, self.dim, index_path, **self.index_params)
+        if index is None:
+            return
+        self._index_saved = 0
+        if index.load():
+            if index.count > self._count:
+                # 向量文件被截断过，索引里有不存在的行，只能重建
+                index = create_index(self.index_backend, self.dim, index_path, **self.index_params)
+            else:
+                self._index_saved = index.count
+        self.index = index
+        self._sync_index()
+
+    def check_embedding_model(self, embedding_model):
+        """
+        检查当前嵌入模型是否与记忆库一致。记忆库尚无记录时登记该模型并返回 True。
+        embedding_model 为 None（调用方无法提供模型标识）时不做检查。
+        """
+        if not embedding_model:
+            return True
+        if self.embedding_model is None or not self.documents:
+            if self.embedding_model != embedding_model:
+                self._save_meta(embedding_model)
+            return True
+        return self.embedding_model == embedding_model
+
+    def _save_meta(self, embedding_model):
+        self.embedding_model = embedding_model
+        try:
+            with open(self.meta_file, "w", encoding="utf-8") as f:
+                json.dump({"embedding_model": embedding_model}, f, ensure_ascii=False)
+        except Exception as e:
+            print(f"⚠️ 保存记忆元数据失败: {e}")
+
+    def install_vectors(self, vector_path, embedding_model):
+        """
+        用重新嵌入得到的向量文件整体替换当前向量（行数须与 documents 一致），
+        并丢弃旧的 ANN 索引文件，随后按新向量重建。
+        """
+        self._matrix = None
+        self.index = None
+        os.replace(vector_path, self.vector_file)
+        self._remove_index_files()
+        self._save_meta(embedding_model)
+        self._open_vectors()
+        self._init_index()
+
+    def _remove_index_files(self):
+        for suffix in (".ivf.npz", ".hnsw.bin", ".faiss"):
+            index_file = os.path.join(self.novel_dir, "memory" + suffix)
+            if os.path.exists(index_file):
+                os.remove(index_file)
+
+    def save_index(self):
+        """
+        把 ANN 索引写入磁盘，下次打开时直接加载、只补录之后新增的条目。
+        由流水线在检查点调用（compact 也会保存）；自上次保存以来没有新增条目时跳过。
+        """
+        if self.index is not None and self.index.count != self._index_saved:
+            self.index.save()
+            self._index_saved = self.index.count
+
+    def _sync_index(self):
+        if self.index is not None and self._matrix is not None and self.index.count < self._count:
+            self.index.add(self._matrix, self.index.count, self._count)
+
+    def _replay_log(self):
+        """重放快照之后追加的日志记录，返回日志中的有效记录数。"""
+        replayed = 0
+        try:
+            records = read_log_records(self.memory_log_file, _parse_log_record, "记忆日志")
+        except Exception as e:
+            print(f"⚠️ 重放记忆日志失败: {e}")
+            return replayed
+        for record in records:
+            # seq 小于快照长度说明该记录已被 compact 合并过（compact 后截断日志前崩溃）
+            if record.get("seq", len(self.documents)) < len(self.documents):
+                continue
+            self.documents.append({
+                "text": record["text"],
+                "metadata": record.get("metadata") or {}
+            })
+            replayed += 1
+        return replayed
+
+    def _open_vectors(self):
+        """读取向量文件头并建立内存映射，使文档数与向量行数对齐。"""
+        self._matrix = None
+        self._py_vectors = []
+        self._count = 0
+        self.dim = 0
+        if not os.path.exists(self.vector_file):
+            # 没有向量的记忆（嵌入失败或未启用时写入）仍可按关键词检索
+            if self.documents:
+                print("⚠️ 未找到向量文件，已有记忆只能按关键词检索。")
+            return
+
+        with open(self.vector_file, "rb") as f:
+            header = f.read(VECTOR_HEADER.size)
+        if len(header) < VECTOR_HEADER.size:
+            # 首次写入向量时崩溃只会留下不完整的文件头，其中没有任何向量
+            print("⚠️ 向量文件不完整，已删除；已有记忆暂时只能按关键词检索，下一条向量写入时重建。")
+            self._discard_vectors(self.vector_file)
+            return
+        magic, dim, _ = VECTOR_HEADER.unpack(header)
+        if magic != VECTOR_MAGIC or dim == 0:
+            # 保留原文件以便排查，记忆原文照常加载
+            backup = self.vector_file + ".corrupt"
+            print(f"⚠️ 向量文件格式无法识别，已移至 {backup}；已有记忆暂时只能按关键词检索，"
+                  "可运行 tools/reembed_memory.py 重建向量。")
+            self._discard_vectors(backup)
+            return
+        self.dim = dim
+
+        row_bytes = dim * 4
+        size = os.path.getsize(self.vector_file)
+        rows = (size - VECTOR_HEADER.size) // row_bytes
+        if rows > len(self.documents):
+            # 向量已写入但日志未写入时崩溃：截掉多余的向量行，保证行号与文档对齐
+            with open(self.vector_file, "r+b") as f:
+                f.truncate(VECTOR_HEADER.size + len(self.documents) * row_bytes)
+            rows = len(self.documents)
+        elif rows < len(self.documents) or size != VECTOR_HEADER.size + rows * row_bytes:
+            # 向量行写入失败或只写了半行：截掉残缺的行，缺少的行补零向量（视为未嵌入，只能按关键词检索），
+            # 文档本身全部保留
+            missing = len(self.documents) - rows
+            if missing:
+                print(f"⚠️ 向量文件比记忆少 {missing} 行，对应记忆暂时只能按关键词检索，"
+                      "可运行 tools/reembed_memory.py 重建向量。")
+            with open(self.vector_file, "r+b") as f:
+                f.truncate(VECTOR_HEADER.size + rows * row_bytes)
+                f.seek(0, os.SEEK_END)
+                f.write(pack_vector_row([0.0] * dim) * missing)
+            rows = len(self.documents)
+        self._count = rows
+        self._map_vectors()
+
+    def _discard_vectors(self, target):
+        """移走（target 为原路径时删除）无法使用的向量文件与依赖它的 ANN 索引，文档保留为只有原文。"""
+        if target == self.vector_file:
+            os.remove(self.vector_file)
+        else:
+            os.replace(self.vector_file, target)
+        self._remove_index_files()
+
+    def _map_vectors(self):
+        if self._count == 0:
+            self._matrix = None
+            self._py_vectors = []
+            return
+        if np is not None:
+            self._matrix = np.memmap(
+                self.vector_file, dtype="<f4", mode="r",
+                offset=VECTOR_HEADER.size, shape=(self._count, self.dim)
+            )
+        else:
+            values = array("f")
+            with open(self.vector_file, "rb") as f:
+                f.seek(VECTOR_HEADER.size)
+                values.fromfile(f, self._count * self.dim)
+            if struct.pack("=I", 1) != struct.pack("<I", 1):
+                values.byteswap()
+            self._py_vectors = [
+                values[i * self.dim:(i + 1) * self.dim].tolist() for i in range(self._count)
+            ]
+
+    def _migrate_legacy_vectors(self, vectors):
+        """将旧版内联向量写入侧车文件。维度以最新一条为准，不一致的旧向量置零（与此前检索得分为 0 的行为一致）。"""
+        dim = next((len(v) for v in reversed(vectors) if v), 0)
+        if dim == 0:
+            return
+        print(f"  * 正在将 {len(vectors)} 条记忆向量迁移到二进制文件 {self.vector_file} ...")
+        tmp_file = self.vector_file + ".tmp"
+        with open(tmp_file, "wb") as f:
+            f.write(pack_vector_header(dim))
+            for vec in vectors:
+                f.write(pack_vector_row(vec if len(vec) == dim else [0.0] * dim))
+        os.replace(tmp_file, self.vector_file)
+        self._open_vectors()
+
+    def compact(self):
+        """将全部文档写成新快照（临时文件 + 原子替换），然后清空追加日志。"""
+        tmp_file = self.memory_file + ".tmp"
         try:
-            with open(self.memory_file, "w", encoding="utf-8") as f:
-                json.dump(self.documents, f, ensure_ascii=False, indent=2)
+            with open(tmp_file, "w", encoding="utf-8") as f:
+                json.dump(self.documents, f, ensure_ascii=False)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_file, self.memory_file)
+            self.save_index()
+            # 快照已落盘，日志中的记录全部作废
+            with open(self.memory_log_file, "w", encoding="utf-8"):
+                pass
         except Exception as e:
-            print(f"⚠️ 保存记忆文件失败: {e}")
+            print(f"⚠️ 压缩记忆文件失败: {e}")
+
+    def save_memory(self):
+        """兼容旧接口：等同于 compact()。"""
+        self.compact()
 
     def add_document(self, text, vector, metadata=None):
-        if not vector:
+        """
+        追加一条记忆。vector 为空（嵌入失败或未启用）时仍然保存原文供关键词检索，
+        向量文件中对应位置写入零向量（不会被向量检索命中）。
+        """
+        if not vector and self.dim:
+            vector = [0.0] * self.dim
+        if vector and self.dim and len(vector) != self.dim:
+            print(f"⚠️ 记忆向量维度 ({len(vector)}) 与记忆库 ({self.dim}) 不一致，已跳过。切换嵌入模型后请重建记忆向量。")
             return
-        
+
         doc = {
             "text": text,
-            "vector": vector,
             "metadata": metadata or {}
         }
+        # 先写向量再写日志：崩溃时多出的向量行会在下次加载时被截掉
+        if vector and not self._append_vector(vector):
+            return
+        self._append_log(doc)
         self.documents.append(doc)
-        self.save_memory()
+        self.lexical.add(text)
+        self._index_metadata(len(self.documents) - 1, doc["metadata"])
+        if not vector:
+            return
+        if self.index is None:
+            self._init_index()
+        else:
+            self._sync_index()
+
+    def _append_vector(self, vector):
+        try:
+            if not self.dim:
+                with open(self.vector_file, "wb") as f:
+                    f.write(pack_vector_header(len(vector)))
+                    # 此前只保存了原文的记忆补写零向量，保持第 i 行对应 documents[i]
+                    f.write(pack_vector_row([0.0] * len(vector)) * len(self.documents))
+                self.dim = len(vector)
+                self._count = len(self.documents)
+                if np is None:
+                    self._py_vectors = [[0.0] * self.dim for _ in self.documents]
+            with open(self.vector_file, "r+b") as f:
+                # 从最后一个完整行之后写：上一次写入失败留下的半行会被覆盖，不会让之后每一行都错位
+                f.seek(VECTOR_HEADER.size + self._count * self.dim * 4)
+                f.truncate()
+                f.write(pack_vector_row(vector))
+        except Exception as e:
+            print(f"⚠️ 写入记忆向量失败: {e}")
+            return False
+
+        self._count += 1
+        if np is not None:
+            # 重新映射只是一次系统调用，不读取数据
+            self._map_vectors()
+        else:
+            self._py_vectors.append(unit_vector(vector))
+        return True
+
+    def _append_log(self, doc):
+        record = dict(doc, seq=len(self.documents))
+        try:
+            with open(self.memory_log_file, "a", encoding="utf-8") as f:
+                f.write(json.dumps(record, ensure_ascii=False) + "\n")
+        except Exception as e:
+            print(f"⚠️ 追加记忆日志失败: {e}")
+
+    def _reset_side_indexes(self):
+        # 字符二元组 BM25 倒排索引，只存在内存中，启动时由文档原文重建
+        self.lexical = BM25Index()
+        # 元数据二级索引：章节号 -> 文档下标列表（另存有序的章节号用于范围查询），角色/剧情线名 -> 文档下标集合
+        self._by_chapter = {}
+        self._chapter_keys = []
+        self._by_tag = {field: {} for field in TAG_FIELDS}
+        # 记忆树：各层摘要节点、节点的子节点、尚未被归并到上一层的文档（最近写入的尾部）
+        self._nodes = {LEVEL_CHAPTER: {}, LEVEL_ARC: {}} # 层级 -> {章号或卷起始章号: 文档下标}
+        self._children = {}
+        self._unparented = {LEVEL_SECTION: set(), LEVEL_CHAPTER: set()}
+        # 摘要节点的下标（写入顺序即升序），平铺检索时据此把节点排除在向量空间之外；数组形式按需缓存
+        self._summary_rows = []
+        self._summary_array = None
+
+    def _index_metadata(self, doc_id, metadata):
+        level = metadata.get("level", LEVEL_SECTION)
+        if level in self._unparented:
+            self._unparented[level].add(doc_id)
+        if level != LEVEL_SECTION:
+            key = metadata.get("chapter") if level == LEVEL_CHAPTER else (metadata.get("chapters") or [0])[0]
+            self._nodes[level][key] = doc_id
+            self._children[doc_id] = list(metadata.get("children") or [])
+            child_level = LEVEL_SECTION if level == LEVEL_CHAPTER else LEVEL_CHAPTER
+            self._unparented[child_level].difference_update(self._children[doc_id])
+            self._summary_rows.append(doc_id)
+            self._summary_array = None
+            # 摘要节点不进入章节/标签索引，过滤条件只作用于小节记忆
+            return
+
+        # 没有章节信息的记忆（加入元数据之前写入的旧记忆）视为第 0 章
+        chapter = metadata.get("chapter") or 0
+        if chapter not in self._by_chapter:
+            self._by_chapter[chapter] = []
+            bisect.insort(self._chapter_keys, chapter)
+        self._by_chapter[chapter].append(doc_id)
+        for field in TAG_FIELDS:
+            for name in metadata.get(field) or []:
+                self._by_tag[field].setdefault(name, set()).add(doc_id)
+
+    def _chapters_between(self, low, high):
+        """章节号在 [low, high] 内的全部文档下标。"""
+        start = bisect.bisect_left(self._chapter_keys, low)
+        end = bisect.bisect_right(self._chapter_keys, high)
+        return {doc_id for key in self._chapter_keys[start:end] for doc_id in self._by_chapter[key]}
+
+    def _candidates(self, filters):
+        """
+        用二级索引求出满足过滤条件的文档下标集合，不扫描全部记忆。filters 为空时返回 None（不过滤）。
+
+        支持的条件（同时给出时取交集）：
+        - chapter: 章节号，或 (起, 止) 闭区间
+        - characters / arcs: 名字或名字列表，涉及其中任一即可
+
+        before 条件不在这里求集合，见 _row_limit。
+        """
+        if not filters:
+            return None
+        sets = []
+        chapter = filters.get("chapter")
+        if chapter is not None:
+            low, high = chapter if isinstance(chapter, (list, tuple)) else (chapter, chapter)
+            sets.append(self._chapters_between(low, high))
+        for field in TAG_FIELDS:
+            names = filters.get(field)
+            if names:
+                names = [names] if isinstance(names, str) else names
+                sets.append(set().union(*(self._by_tag[field].get(name, set()) for name in names)))
+
+        if not sets:
+            return None
+        # 从最小的集合开始求交集
+        sets.sort(key=len)
+        result = set(sets[0])
+        for other in sets[1:]:
+            result &= other
+        return result
+
+    def _row_limit(self, before):
+        """
+        before=(章, 节) 过滤换算成文档下标上界：记忆按写作顺序追加，这一节之前写入的记忆就是前 limit 行，
+        检索时只需切片，不必构造候选集。上界取该节及之后任一小节记忆的最小下标（每章的下标列表按写入顺序排列，
+        只看各章第一条）；没有这样的记忆时过滤覆盖全部记忆，返回 None。
+        """
+        chapter, section = before
+        limit = None
+        for doc_id in self._by_chapter.get(chapter, []):
+            if (self.documents[doc_id]["metadata"].get("section") or 0) >= section:
+                limit = doc_id
+                break
+        for key in self._chapter_keys[bisect.bisect_right(self._chapter_keys, chapter):]:
+            first = self._by_chapter[key][0]
+            if limit is None or first < limit:
+                limit = first
+        return limit
+
+    def _summary_rows_below(self, n):
+        """前 n 行中摘要节点的下标数组。"""
+        if self._summary_array is None:
+            self._summary_array = np.asarray(self._summary_rows, dtype=np.int64)
+        return self._summary_array[:bisect.bisect_left(self._summary_rows, n)]
+
+    def get_vector(self, index):
+        """返回第 index 条记忆的（已归一化）向量。"""
+        if self._matrix is not None:
+            return self._matrix[index].tolist()
+        return list(self._py_vectors[index])
+
+    def summary_node(self, level, key):
+        """章级 (key=章号) 或卷级 (key=起始章号) 摘要节点的文档下标，不存在时返回 None。"""
+        return self._nodes[level].get(key)
+
+    def section_ids(self, chapter):
+        """某一章已写入的小节记忆下标。"""
+        return list(self._by_chapter.get(chapter, []))
 
-    def search(self, query_vector, top_k=3):
-        if not self.documents or not query_vector:
+    def search(self, query_vector=None, top_k=3, exact=False, query_text=None, filters=None, hierarchical=False):
+        """
+        检索最相关的 top_k 条记忆。
+
+        :param exact: 为 True 时跳过 ANN 索引，强制精确检索。
+        :param query_text: 查询原文。与 query_vector 同时给出时做混合检索：BM25 关键词结果与向量结果
+                           按倒数排名融合 (RRF)；只给出 query_text（嵌入失败或未启用）时退回纯关键词检索，
+                           不产生任何网络请求。
+        :param filters: 元数据过滤条件，见 _candidates 与 _row_limit。先由二级索引缩小候选集，只对候选记忆打分；
+                        before 条件只是下标上界，不影响 ANN 索引的使用。
+        :param hierarchical: 沿记忆树由粗到细检索：先在卷级节点中选出最相关的几个，再只在其下的章级节点中选，
+                             最后只给这些章的小节记忆打分；尚未归并的最近章节/小节始终参与对应层的比较。
+                             不使用时摘要节点不参与检索（从 ANN 结果与打分中剔除，不构造候选集）。
+        """
+        if not self.documents:
+            return []
+        limit = self._row_limit(filters["before"]) if filters and filters.get("before") is not None else None
+        candidates = self._candidates(filters)
+        if candidates is not None and limit is not None:
+            candidates = {doc_id for doc_id in candidates if doc_id < limit}
+        if limit == 0 or (candidates is not None and not candidates):
+            return []
+        if hierarchical:
+            ids = self._tree_search(query_vector, query_text, top_k, exact, candidates, limit)
+        else:
+            # 平铺检索只看小节记忆
+            ids = self._rank(query_vector, query_text, top_k, exact, candidates, limit, skip_summaries=True)
+        return [self.documents[i] for i in ids]
+
+    def _tree_search(self, query_vector, query_text, top_k, exact, candidates, limit=None):
+        """逐层检索，每层只对上一层选中节点的子节点（以及本层未归并的尾部）打分。"""
+        chapters = set(self._unparented[LEVEL_CHAPTER])
+        arcs = set(self._nodes[LEVEL_ARC].values())
+        for arc in self._rank(query_vector, query_text, self.TREE_BEAM, exact, arcs) if arcs else []:
+            chapters.update(self._children[arc])
+
+        sections = set(self._unparented[LEVEL_SECTION])
+        for chapter in self._rank(query_vector, query_text, self.TREE_BEAM, exact, chapters) if chapters else []:
+            sections.update(self._children[chapter])
+        if candidates is not None:
+            sections &= candidates
+        if limit is not None:
+            sections = {doc_id for doc_id in sections if doc_id < limit}
+        return self._rank(query_vector, query_text, top_k, exact, sections) if sections else []
+
+    def _rank(self, query_vector, query_text, top_k, exact=False, candidates=None, limit=None, skip_summaries=False):
+        """
+        在候选集（None 为全部）中下标小于 limit（None 为不限）的记忆上做向量 / 关键词 / 混合检索，返回文档下标。
+        skip_summaries 为 True 时不返回摘要节点。
+        """
+        if candidates is not None and not candidates:
             return []
+        skip_summaries = skip_summaries and bool(self._children)
+        if not query_text:
+            return self._vector_search(query_vector, top_k, exact, candidates, limit, skip_summaries)
+
+        depth = max(top_k, self.HYBRID_CANDIDATES)
+        exclude = self._children if skip_summaries else None
+        lexical_ids = [doc_id for _, doc_id in self.lexical.search(query_text, depth, candidates, limit, exclude)]
+        vector_ids = (self._vector_search(query_vector, depth, exact, candidates, limit, skip_summaries)
+                      if query_vector and self.dim else [])
+        if not vector_ids:
+            return lexical_ids[:top_k]
+        return reciprocal_rank_fusion([vector_ids, lexical_ids])[:top_k]
+
+    def _vector_search(self, query_vector, top_k, exact=False, candidates=None, limit=None, skip_summaries=False):
+        """
+        向量检索，返回按相似度降序排列的文档下标；给出 candidates 时只在这些下标中精确检索，
+        给出 limit 时只检索前 limit 行，skip_summaries 为 True 时跳过摘要节点。
+        """
+        if not query_vector or not self._count:
+            return []
+        if len(query_vector) != self.dim:
+            print(f"⚠️ 查询向量维度 ({len(query_vector)}) 与记忆库 ({self.dim}) 不一致，跳过检索。")
+            return []
+
+        n = self._count if limit is None else min(limit, self._count)
+        if self._matrix is not None and candidates is None:
+            return self._search_numpy(query_vector, top_k, exact, n, skip_summaries)
+        ids = range(n) if candidates is None else sorted(i for i in candidates if i < n)
+        if skip_summaries:
+            ids = [i for i in ids if i not in self._children]
+        if self._matrix is not None:
+            query = self._normalize(query_vector)
+            if query is None or not ids:
+                return []
+            # 只取出候选行参与计算（ANN 索引不支持过滤，候选集上直接精确检索）
+            scores = self._matrix[ids] @ query
+            order = np.argsort(-scores, kind="stable")[:top_k]
+            return [ids[i] for i in order]
 
         results = []
-        for doc in self.documents:
-            score = self._cosine_similarity(query_vector, doc['vector'])
-            results.append((score, doc))
-        
+        for i in ids:
+            score = self._cosine_similarity(query_vector, self._py_vectors[i])
+            results.append((score, i))
+
         # Sort by score descending
         results.sort(key=lambda x: x[0], reverse=True)
-        
+
         # Return top_k documents
         return [item[1] for item in results[:top_k]]
 
+    def _search_numpy(self, query_vector, top_k, exact=False, n=None, skip_summaries=False):
+        """
+        一次矩阵-向量乘法得到前 n 行（默认全部）的余弦相似度，再用 argpartition 取 top-k。
+        skip_summaries 为 True 时摘要节点的得分置为 -inf，不会被选中。
+        """
+        query = self._normalize(query_vector)
+        if query is None:
+            return []
+        n = self._count if n is None else n
+        excluded = self._summary_rows_below(n) if skip_summaries else None
+        eligible = n - (len(excluded) if excluded is not None else 0)
+        if eligible <= 0:
+            return []
+
+        if not exact and self.index is not None and n >= self.ann_min_size:
+            ids = self._search_index(query, top_k, n, eligible, skip_summaries)
+            if ids is not None:
+                return ids
+
+        scores = self._matrix[:n] @ query
+        if excluded is not None and len(excluded):
+            scores[excluded] = -np.inf
+        k = min(top_k, eligible)
+        if k < n:
+            idx = np.argpartition(-scores, k - 1)[:k]
+        else:
+            idx = np.arange(n)
+        # argpartition 不保证顺序，对候选集再排序（稳定排序保持原插入顺序）
+        idx = idx[np.argsort(-scores[idx], kind="stable")]
+        return [int(i) for i in idx]
+
+    def _search_index(self, query, top_k, n, eligible=None, skip_summaries=False):
+        """
+        用 ANN 索引检索前 n 行中的 eligible 条可用记忆：索引不支持过滤，按可用行的占比多取近邻，
+        再剔除越界的行与摘要节点，不够 top_k 时加倍重取；索引已给出全部结果仍不够时返回 None，
+        由调用方退回精确检索。
+        """
+        eligible = n if eligible is None else eligible
+        fetch = top_k if eligible == self._count else -(-top_k * self._count // eligible)
+        while True:
+            ids = self.index.search(self._matrix, query, fetch)
+            if ids is None:
+                return None
+            hits = [int(i) for i in ids if i < n and not (skip_summaries and int(i) in self._children)]
+            if eligible == self._count or len(hits) >= min(top_k, eligible):
+                return hits[:top_k]
+            if len(ids) < fetch or fetch >= self._count:
+                return None
+            fetch = min(fetch * 2, self._count)
+
+    def _normalize(self, vector):
+        v = np.asarray(vector, dtype=np.float32)
+        norm = float(np.linalg.norm(v))
+        if norm == 0:
+            return None
+        return v / norm
+
     def _cosine_similarity(self, v1, v2):
         """Pure Python implementation of cosine similarity."""
         if len(v1) != len(v2):
             return 0.0
-            
+
         dot_product = sum(a * b for a, b in zip(v1, v2))
         magnitude1 = math.sqrt(sum(a * a for a in v1))
         magnitude2 = math.sqrt(sum(b * b for b in v2))
-        
+
         if magnitude1 == 0 or magnitude2 == 0:
             return 0.0
-            
+
         return dot_product / (magnitude1 * magnitude2)
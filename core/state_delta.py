@@ -0,0 +1,136 @@
+import json
+import re
+
+# 增量状态更新的 JSON 结构（写入提示词，同时作为本地校验的依据）
+STATE_DELTA_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "operations": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "oneOf": [
+                    {"properties": {"op": {"const": "append_summary"}, "text": {"type": "string"}},
+                     "required": ["op", "text"]},
+                    {"properties": {"op": {"const": "set_character"}, "name": {"type": "string"},
+                                    "field": {"type": "string"}, "value": {"type": ["string", "null"]}},
+                     "required": ["op", "name", "field", "value"]},
+                    {"properties": {"op": {"const": "open_arc"}, "name": {"type": "string"},
+                                    "description": {"type": "string"}},
+                     "required": ["op", "name", "description"]},
+                    {"properties": {"op": {"const": "resolve_arc"}, "name": {"type": "string"},
+                                    "resolution": {"type": "string"}},
+                     "required": ["op", "name"]},
+                ],
+            },
+        },
+        "memory": {"type": "string"},
+    },
+    "required": ["operations", "memory"],
+}
+
+# op -> {字段: 允许的类型}，由 STATE_DELTA_SCHEMA 展开而来
+_OP_FIELDS = {
+    option["properties"]["op"]["const"]: (
+        {k: v["type"] for k, v in option["properties"].items() if k != "op"},
+        [k for k in option["required"] if k != "op"],
+    )
+    for option in STATE_DELTA_SCHEMA["properties"]["operations"]["items"]["oneOf"]
+}
+_JSON_TYPES = {"string": str, "null": type(None)}
+
+# 融合模式下正文与状态增量块之间的分隔行
+STATE_DELTA_MARKER = "===STATE_DELTA==="
+
+# 各操作的说明，状态更新提示词与融合模式的起草提示词共用
+DELTA_INSTRUCTIONS = """只输出本节内容引起的变化，不要重复没有变化的状态。可用的操作：
+- {"op": "append_summary", "text": "..."}：本节新增的剧情摘要（一两句话），会接在全局摘要之后。
+- {"op": "set_character", "name": "角色名", "field": "字段（如 状态/位置/物品）", "value": "新值"}：
+  更新角色的某个字段，value 为 null 表示删除该字段。新角色直接 set 即可。
+- {"op": "open_arc", "name": "剧情线名", "description": "..."}：新挖的坑，或已有剧情线的新进展。
+- {"op": "resolve_arc", "name": "剧情线名", "resolution": "..."}：已经填上的坑。
+另外在 memory 中输出一段 100 字左右的本节关键情节摘要，用于存入长期记忆库。"""
+
+# 剧情线收束后写入的标记，ContextAssembler 据此跳过已收束的剧情线
+RESOLVED_PREFIX = "[已解决]"
+INITIAL_SUMMARY = "故事刚刚开始。"
+
+
+def _type_ok(value, allowed):
+    allowed = allowed if isinstance(allowed, list) else [allowed]
+    return any(isinstance(value, _JSON_TYPES[t]) for t in allowed)
+
+def parse_delta(text):
+    """
+    解析并校验模型返回的增量 JSON。
+
+    :return: (operations, memory, errors)。整体无法解析时 operations 为 None；
+             单条操作不合法时跳过该条并把原因记入 errors，其余操作照常应用。
+    """
+    text = (text or "").strip()
+    # 兼容模型仍然输出 ```json 代码块或在 JSON 前后附带说明文字的情况
+    match = re.search(r"\{.*\}", text, re.S)
+    if not match:
+        return None, "", ["响应中没有 JSON 对象"]
+    try:
+        data = json.loads(match.group(0))
+    except json.JSONDecodeError as e:
+        return None, "", [f"JSON 解析失败: {e}"]
+    if not isinstance(data, dict) or not isinstance(data.get("operations"), list):
+        return None, "", ["缺少 operations 列表"]
+
+    memory = data.get("memory")
+    memory = memory.strip() if isinstance(memory, str) else ""
+    operations, errors = [], []
+    for i, op in enumerate(data["operations"]):
+        if not isinstance(op, dict) or op.get("op") not in _OP_FIELDS:
+            errors.append(f"第 {i + 1} 条操作类型未知: {op}")
+            continue
+        fields, required = _OP_FIELDS[op["op"]]
+        missing = [k for k in required if k not in op]
+        wrong = [k for k in fields if k in op and not _type_ok(op[k], fields[k])]
+        if missing or wrong:
+            errors.append(f"第 {i + 1} 条 {op['op']} 缺少字段 {missing} 或类型错误 {wrong}")
+            continue
+        if any(not op[k].strip() for k in ("name", "field") if k in op):
+            errors.append(f"第 {i + 1} 条 {op['op']} 名称为空")
+            continue
+        operations.append({k: op[k] for k in ["op", *fields] if k in op})
+    return operations, memory, errors
+
+def apply_delta(summary, characters, arcs, operations):
+    """
+    把操作应用到状态副本上，返回新的 (summary, characters, arcs)，不修改传入的对象。
+    characters / arcs 为 {名字: 内容} 映射。
+    """
+    characters = dict(characters)
+    arcs = dict(arcs)
+    summary_parts = [] if summary.strip() == INITIAL_SUMMARY else [summary.strip()]
+
+    for op in operations:
+        kind = op["op"]
+        if kind == "append_summary":
+            if op["text"].strip():
+                summary_parts.append(op["text"].strip())
+        elif kind == "set_character":
+            body = characters.get(op["name"])
+            # 原来是一句话描述的角色，转成字段映射，原描述保留在“状态”字段
+            if not isinstance(body, dict):
+                body = {"状态": body} if body not in (None, "") else {}
+            else:
+                body = dict(body)
+            if op["value"] is None:
+                body.pop(op["field"], None)
+            else:
+                body[op["field"]] = op["value"]
+            characters[op["name"]] = body
+        elif kind == "open_arc":
+            arcs[op["name"]] = op["description"]
+        elif kind == "resolve_arc":
+            resolution = str(op.get("resolution") or arcs.get(op["name"]) or "").strip()
+            # 重复解决同一条剧情线（或模型自己带上了前缀）时不叠加“[已解决]”
+            while resolution.startswith(RESOLVED_PREFIX):
+                resolution = resolution[len(RESOLVED_PREFIX):].strip()
+            arcs[op["name"]] = f"{RESOLVED_PREFIX} {resolution}".strip()
+
+    return "\n".join(summary_parts) or summary, characters, arcs
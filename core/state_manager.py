@@ -1,17 +1,76 @@
+import json
 import os
+import threading
 import yaml
-from core.rag_engine import RAGEngine
+from core import metrics
+from core.context_assembler import ContextAssembler, format_context, parse_mapping
+from core.journal import MEMORY_INDEXED, STATE_APPLIED, section_key
+from core.rag_engine import LEVEL_ARC, LEVEL_CHAPTER, RAGEngine
+from core.state_delta import DELTA_INSTRUCTIONS, STATE_DELTA_SCHEMA, apply_delta, parse_delta
+
+# 记忆检索方式：vector 只用向量；hybrid 向量与 BM25 关键词融合；lexical 只用关键词（不调用嵌入接口）
+RETRIEVAL_MODES = ("vector", "hybrid", "lexical")
+
+# update_mode 可选值：full 让模型重写整份状态；delta 让模型只返回增量操作 (JSON)，在本地应用
+STATE_UPDATE_MODES = ("full", "delta")
 
 class StateManager:
-    def __init__(self, novel_dir):
+    """
+    小说的世界状态：全局摘要、角色状态与剧情线。
+
+    状态在构造时从磁盘读入一次后常驻内存，更新只改内存并标记为脏；
+    每 flush_every 次更新（以及调用 flush 时）才把有改动的文件以“临时文件 + os.replace”原子写回，
+    因此读取上下文不再触碰磁盘，中途崩溃也不会留下写了一半的状态文件。
+
+    给出 journal (SectionJournal) 时，带章节信息的更新在状态真正写回磁盘后记为 state_applied，
+    本节记忆入库后记为 memory_indexed，崩溃后由 recover_section 补做缺失的步骤。
+    """
+
+    def __init__(self, novel_dir, rag_config=None, flush_every=1, update_mode="full", journal=None):
+        if update_mode not in STATE_UPDATE_MODES:
+            raise ValueError(f"不支持的状态更新模式: {update_mode}")
         self.novel_dir = novel_dir
         self.global_summary_path = os.path.join(novel_dir, "global_summary.txt")
         self.character_state_path = os.path.join(novel_dir, "character_state.yaml")
         self.plot_arcs_path = os.path.join(novel_dir, "plot_arcs.yaml")
+        self._paths = {
+            "summary": self.global_summary_path,
+            "characters": self.character_state_path,
+            "arcs": self.plot_arcs_path,
+        }
+        self.flush_every = max(1, int(flush_every or 1))
+        self.update_mode = update_mode
+        self.journal = journal
+        # 已应用到内存、尚未随 flush 写回磁盘的小节 [((章, 节), 本节记忆)]
+        self._unjournaled = []
         
-        self.rag = RAGEngine(novel_dir)
+        rag_config = rag_config or {}
+        self.retrieval = rag_config.get("retrieval", "vector")
+        # 记忆树：章写完后把小节记忆归并为章级摘要，每 arc_chapters 章再归并为卷级摘要，检索时由粗到细
+        self.memory_tree = bool(rag_config.get("memory_tree", False))
+        self.arc_chapters = max(1, int(rag_config.get("arc_chapters", 10) or 10))
+        if self.retrieval not in RETRIEVAL_MODES:
+            raise ValueError(f"不支持的记忆检索方式: {self.retrieval}")
+        # 流水线模式下状态更新在后台线程执行，读写状态文件与记忆库时需持有该锁
+        self._lock = threading.RLock()
+        self.rag = RAGEngine(
+            novel_dir,
+            index_backend=rag_config.get("index_backend", "exact"),
+            index_params=rag_config.get("index_params"),
+            ann_min_size=rag_config.get("ann_min_size", 1024)
+        )
+        # 最近一次按预算拼装上下文时的报告（省略/截断了哪些内容）
+        self.last_context_report = None
         self._init_files()
 
+        self._state = {}
+        for name, path in self._paths.items():
+            with open(path, "r", encoding="utf-8") as f:
+                self._state[name] = f.read()
+        self._parsed = {} # 角色/剧情线 YAML 的解析缓存，内容改变时失效
+        self._dirty = set()
+        self._updates_since_flush = 0
+
     def _init_files(self):
         """Initialize state files if they don't exist."""
         if not os.path.exists(self.novel_dir):
@@ -29,54 +88,79 @@ class StateManager:
             with open(self.plot_arcs_path, "w", encoding="utf-8") as f:
                 yaml.dump({}, f, allow_unicode=True)
 
-    def get_context_prompt(self, llm=None, current_query=None):
-        """Build the context string for the generation prompt."""
-        try:
-            with open(self.global_summary_path, "r", encoding="utf-8") as f:
-                summary = f.read()
-                
-            with open(self.character_state_path, "r", encoding="utf-8") as f:
-                chars = f.read()
-                
-            with open(self.plot_arcs_path, "r", encoding="utf-8") as f:
-                arcs = f.read()
+    def get_context_prompt(self, llm=None, current_query=None, token_budget=None, filters=None):
+        """
+        Build the context string for the generation prompt.
+
+        :param filters: 记忆检索的元数据过滤条件（如 {"before": (章, 节)}），见 RAGEngine.search。
 
-            rag_context = ""
-            if llm and current_query:
-                # 尝试检索相关历史
+        :param token_budget: 上下文 token 预算。给出时按与 current_query 的相关度筛选角色、剧情线与记忆，
+                             并把省略的内容记录在 last_context_report 中；为空时注入完整状态（状态更新时使用）。
+        """
+        try:
+            # 网络请求（查询向量）放在锁外，避免与后台状态更新互相阻塞
+            query_vec = None
+            if llm and current_query and self.retrieval != "lexical":
                 try:
+                    if not self.rag.check_embedding_model(self._embedding_id(llm)):
+                        raise RuntimeError(
+                            f"嵌入模型已由 {self.rag.embedding_model} 切换为 {self._embedding_id(llm)}，"
+                            f"请先运行 python tools/reembed_memory.py \"{self.novel_dir}\" 重建记忆向量"
+                        )
                     query_vec = llm.embed_content(current_query)
-                    if query_vec:
-                        results = self.rag.search(query_vec, top_k=3)
-                        if results:
-                            rag_context = "\n【历史相关事件回溯】："
-                            for i, doc in enumerate(results, 1):
-                                rag_context += f"\n{i}. {doc['text']}"
                 except Exception as e:
                     print(f"⚠️ RAG 检索失败 (非致命): {e}")
-                
-            context = f"""
-【全局剧情摘要】：
-{summary}
 
-【角色当前状态】：
-{chars}
+            with self._lock:
+                summary, chars, arcs = self._state["summary"], self._state["characters"], self._state["arcs"]
+                parsed_chars, parsed_arcs = self._parsed_state("characters"), self._parsed_state("arcs")
+
+                memories = []
+                # 嵌入失败时 hybrid 模式退回纯关键词检索
+                query_text = current_query if self.retrieval != "vector" else None
+                if query_vec or query_text:
+                    # 尝试检索相关历史
+                    try:
+                        memories = [doc['text'] for doc in self.rag.search(
+                            query_vec, top_k=3, query_text=query_text, filters=filters, hierarchical=self.memory_tree
+                        )]
+                    except Exception as e:
+                        print(f"⚠️ RAG 检索失败 (非致命): {e}")
+
+            if not token_budget:
+                return format_context(summary, chars, arcs, memories)
 
-【当前未解伏笔/剧情线】：
-{arcs}
-{rag_context}
-            """
+            context, report = ContextAssembler(token_budget).assemble(
+                summary, chars, arcs, memories, current_query, characters=parsed_chars, arcs=parsed_arcs
+            )
+            self.last_context_report = report
+            if report["dropped"] or report["truncated"]:
+                dropped = "、".join(f"{d['name']}" for d in report["dropped"] if d["reason"] == "budget")
+                resolved = sum(1 for d in report["dropped"] if d["reason"] == "resolved")
+                print(f"  - 上下文预算 {report['used']}/{token_budget}：" +
+                      ("摘要已截断；" if report["truncated"] else "") +
+                      (f"省略 {dropped}；" if dropped else "") +
+                      (f"跳过已收束剧情线 {resolved} 条" if resolved else ""))
             return context
         except Exception as e:
-            print(f"⚠️ 读取状态文件出错: {e}")
+            print(f"⚠️ 读取状态出错: {e}")
             return "（状态读取失败，请根据上文继续创作）"
 
-    def update_state(self, llm, new_content):
-        """Update all states based on the newly generated content."""
+    def update_state(self, llm, new_content, metadata=None):
+        """
+        Update all states based on the newly generated content.
+
+        :param metadata: 本节的章节信息（如 {"chapter": 3, "section": 2}），随本节记忆一起存入记忆库。
+        """
         print("  - 正在更新世界状态 (Summary/Characters/Arcs/Memory)...")
+
+        # 增量模式无法进行（当前状态不是合法映射或响应无法解析）时退回整体重写
+        if self.update_mode == "delta" and self._update_state_delta(llm, new_content, metadata):
+            return
         
-        # Read current states first
-        current_context = self.get_context_prompt()
+        # 直接使用内存中的当前状态，无需重新读盘
+        with self._lock:
+            current_context = format_context(self._state["summary"], self._state["characters"], self._state["arcs"], [])
         
         prompt = f"""
         你是一个专业的网文辅助系统。请根据【最新生成的小说内容】，更新小说的状态数据库。
@@ -113,12 +197,222 @@ class StateManager:
         """
         
         try:
-            response = llm.generate_content(prompt)
-            self._parse_and_save_updates(llm, response)
+            with metrics.stage("state_update"):
+                response = llm.generate_content(prompt)
+                if response.startswith("⚠️"):
+                    # 不记为已应用：预写日志会在下次启动时重做本节的状态更新
+                    print(f"⚠️ 状态更新失败: {response}")
+                    return
+                self._parse_and_save_updates(llm, response, metadata)
         except Exception as e:
             print(f"⚠️ 状态更新失败: {e}")
 
-    def _parse_and_save_updates(self, llm, response):
+    def _update_state_delta(self, llm, new_content, metadata=None):
+        """
+        让模型只返回本节引起的状态变化（JSON 操作列表），在本地校验后应用。
+        输出长度只与本节内容有关，不再随故事变长。返回 False 表示需要退回整体重写。
+        """
+        with self._lock:
+            summary = self._state["summary"]
+            characters, arcs = self._parsed_state("characters"), self._parsed_state("arcs")
+            current_context = format_context(summary, self._state["characters"], self._state["arcs"], [])
+        if characters is None or arcs is None:
+            print("⚠️ 当前角色状态/剧情线不是合法的 YAML 映射，本次改用整体更新。")
+            return False
+
+        prompt = f"""
+        你是一个专业的网文辅助系统。请根据【最新生成的小说内容】，给出状态数据库需要做的【状态增量】修改。
+
+        【当前状态数据库】：
+        {current_context}
+
+        【最新生成的内容】：
+        {new_content}
+
+        【任务】：
+        {DELTA_INSTRUCTIONS}
+
+        【输出格式要求】：
+        只输出一个符合以下 JSON Schema 的 JSON 对象，不要输出多余的解释：
+        {json.dumps(STATE_DELTA_SCHEMA, ensure_ascii=False)}
+        """
+
+        try:
+            with metrics.stage("state_update"):
+                generate = llm.generate_json if hasattr(llm, "generate_json") else llm.generate_content
+                response = generate(prompt)
+                if response.startswith("⚠️"):
+                    print(f"⚠️ 状态更新失败: {response}")
+                    return True
+                return self._apply_delta_response(llm, response, metadata)
+        except Exception as e:
+            print(f"⚠️ 状态更新失败: {e}")
+        return True
+
+    def apply_fused_update(self, llm, delta_block, new_content, metadata=None):
+        """
+        融合模式：起草调用已在正文之后附带了状态增量块，直接在本地应用，省去一次状态更新请求
+        （以及把整节正文再发送一遍的输入 token）。块缺失或无法解析时退回普通的 update_state。
+        """
+        print("  - 正在应用正文附带的状态增量 (Summary/Characters/Arcs/Memory)...")
+        try:
+            with self._lock:
+                parsed = self._parsed_state("characters") is not None and self._parsed_state("arcs") is not None
+            if delta_block and parsed:
+                with metrics.stage("state_update"):
+                    if self._apply_delta_response(llm, delta_block, metadata):
+                        return
+            elif not delta_block:
+                print("⚠️ 正文后没有附带状态增量，改用单独的状态更新请求。")
+        except Exception as e:
+            print(f"⚠️ 状态增量应用失败: {e}")
+        self.update_state(llm, new_content, metadata)
+
+    def _apply_delta_response(self, llm, response, metadata=None):
+        """解析、校验并应用增量 JSON，然后存入本节记忆。整体无法解析时返回 False。"""
+        operations, memory_content, errors = parse_delta(response)
+        if operations is None:
+            print(f"⚠️ 状态增量解析失败，改用整体更新: {errors[0]}")
+            return False
+        for error in errors:
+            print(f"⚠️ 已跳过不合法的状态操作: {error}")
+
+        with self._lock:
+            # 以应用时的最新状态为准（单个后台线程按顺序更新，这里与读取时一致）
+            new_summary, new_chars, new_arcs = apply_delta(
+                self._state["summary"], self._parsed_state("characters") or {},
+                self._parsed_state("arcs") or {}, operations
+            )
+            kinds = {op["op"] for op in operations}
+            if "append_summary" in kinds:
+                self._set_state("summary", new_summary)
+            if "set_character" in kinds:
+                self._set_state("characters", self._dump_yaml(new_chars), new_chars)
+            if kinds & {"open_arc", "resolve_arc"}:
+                self._set_state("arcs", self._dump_yaml(new_arcs), new_arcs)
+            self._mark_updated(metadata, memory_content)
+        print(f"  * 已应用 {len(operations)} 条状态增量操作。")
+        self._store_memory(llm, memory_content, metadata,
+                           characters=[op["name"] for op in operations if op["op"] == "set_character"],
+                           arcs=[op["name"] for op in operations if op["op"] in ("open_arc", "resolve_arc")])
+        return True
+
+    @staticmethod
+    def _dump_yaml(data):
+        return yaml.safe_dump(data, allow_unicode=True, sort_keys=False) if data else "{}\n"
+
+    def _mark_updated(self, metadata=None, memory_content=""):
+        """记一次状态更新，达到 flush_every 次时写回磁盘。调用方需持有锁。"""
+        key = section_key(metadata)
+        if self.journal and key:
+            self._unjournaled.append((key, memory_content))
+        self._updates_since_flush += 1
+        if self._updates_since_flush >= self.flush_every:
+            self.flush()
+
+    def _memory_metadata(self, metadata, memory_content, characters=(), arcs=()):
+        """记忆的元数据：章节信息，加上本节涉及的角色与剧情线（增量操作中的名字及摘要里提到的已知名字）。"""
+        metadata = dict(metadata or {})
+        with self._lock:
+            known = {"characters": self._parsed_state("characters") or {}, "arcs": self._parsed_state("arcs") or {}}
+        for field, names in (("characters", characters), ("arcs", arcs)):
+            mentioned = set(names) | {str(name) for name in known[field] if str(name) in memory_content}
+            if mentioned:
+                metadata[field] = sorted(mentioned)
+        return metadata
+
+    def _store_memory(self, llm, memory_content, metadata=None, characters=(), arcs=()):
+        """把本节独立摘要嵌入后存入 RAG 长期记忆库。"""
+        key = section_key(metadata) if self.journal else None
+        if key and self.journal.has(*key, MEMORY_INDEXED):
+            # 崩溃恢复时重做状态更新：本节记忆此前已经入库，不再重复存入
+            return
+        if not memory_content:
+            if key:
+                self.journal.record(*key, MEMORY_INDEXED)
+            return
+        try:
+            metadata = self._memory_metadata(metadata, memory_content, characters, arcs)
+            stored = self._add_memory(llm, memory_content, metadata)
+            if stored == "vector":
+                print("  * 已将本节摘要存入 RAG 长期记忆库。")
+            elif stored == "lexical":
+                print("  * 已将本节摘要存入 RAG 长期记忆库（仅关键词检索）。")
+            if stored and key:
+                self.journal.record(*key, MEMORY_INDEXED)
+        except Exception as e:
+            print(f"⚠️ RAG 记忆存储失败: {e}")
+
+    def _add_memory(self, llm, text, metadata):
+        """
+        嵌入并写入一条记忆。返回 "vector"；嵌入失败或未启用时只保存原文并返回 "lexical"
+        （vector 检索模式下不保存，返回 None）。
+        """
+        vec = None
+        if self.retrieval != "lexical":
+            if not self.rag.check_embedding_model(self._embedding_id(llm)):
+                raise RuntimeError("嵌入模型与记忆库不一致，请先运行 tools/reembed_memory.py 重建记忆向量")
+            with metrics.stage("memory_embedding"):
+                vec = llm.embed_content(text)
+        if vec:
+            with self._lock:
+                self.rag.add_document(text=text, vector=vec, metadata=metadata)
+            return "vector"
+        if self.retrieval != "vector":
+            with self._lock:
+                self.rag.add_document(text=text, vector=None, metadata=metadata)
+            return "lexical"
+        return None
+
+    def consolidate_chapter(self, llm, chapter):
+        """
+        记忆树归并（在后台线程执行）：把第 chapter 章的小节记忆合并成一个章级摘要节点；
+        所在的 arc_chapters 章都有了章级节点后，再合并成一个卷级摘要节点。已归并过的直接跳过，可重复调用。
+        """
+        if not self.memory_tree:
+            return
+        try:
+            with metrics.stage("memory_consolidation"):
+                with self._lock:
+                    done = self.rag.summary_node(LEVEL_CHAPTER, chapter) is not None
+                    section_ids = self.rag.section_ids(chapter)
+                    texts = [self.rag.documents[i]["text"] for i in section_ids]
+                if not done and texts:
+                    summary = self._summarize_memories(llm, f"第 {chapter} 章", texts, 150)
+                    if summary:
+                        self._add_memory(llm, summary, {"level": LEVEL_CHAPTER, "chapter": chapter, "children": section_ids})
+                        print(f"  * 已将第 {chapter} 章的 {len(texts)} 条记忆归并为章级摘要。")
+
+                start = (chapter - 1) // self.arc_chapters * self.arc_chapters + 1
+                end = start + self.arc_chapters - 1
+                with self._lock:
+                    if self.rag.summary_node(LEVEL_ARC, start) is not None:
+                        return
+                    node_ids = [self.rag.summary_node(LEVEL_CHAPTER, c) for c in range(start, end + 1)]
+                    if None in node_ids:
+                        return
+                    texts = [self.rag.documents[i]["text"] for i in node_ids]
+                summary = self._summarize_memories(llm, f"第 {start}-{end} 章", texts, 200)
+                if summary:
+                    self._add_memory(llm, summary, {"level": LEVEL_ARC, "chapters": [start, end], "children": node_ids})
+                    print(f"  * 已将第 {start}-{end} 章归并为卷级摘要。")
+        except Exception as e:
+            print(f"⚠️ 记忆归并失败 (非致命): {e}")
+
+    def _summarize_memories(self, llm, label, texts, length):
+        items = "\n".join(f"{i}. {text}" for i, text in enumerate(texts, 1))
+        prompt = f"""
+        【记忆归并】请把以下{label}的各条情节摘要合并成一段约 {length} 字的摘要，
+        保留关键人物、地点、物品与事件因果，只输出摘要本身：
+        {items}
+        """
+        summary = llm.generate_content(prompt)
+        if not summary or summary.startswith("⚠️"):
+            print(f"⚠️ {label}记忆归并失败: {summary}")
+            return None
+        return summary.strip()
+
+    def _parse_and_save_updates(self, llm, response, metadata=None):
         """Parse the LLM response and save to files."""
         try:
             summary_content = ""
@@ -144,49 +438,106 @@ class StateManager:
                 else:
                     chars_content = temp.strip()
             
-            # Save Summary
-            if summary_content:
-                with open(self.global_summary_path, "w", encoding="utf-8") as f:
-                    f.write(summary_content)
+            with self._lock:
+                # Save Summary
+                if summary_content:
+                    self._set_state("summary", summary_content)
             
-            # Save Characters
-            if chars_content:
-                try:
-                    clean_chars = self._sanitize_yaml(chars_content)
-                    _ = yaml.safe_load(clean_chars) 
-                    with open(self.character_state_path, "w", encoding="utf-8") as f:
-                        f.write(clean_chars)
-                except Exception as e:
-                    print(f"⚠️ 角色状态YAML解析失败，已保存原始内容: {e}")
-                    # 即使解析失败保存下来也比丢失好
-                    with open(self.character_state_path, "w", encoding="utf-8") as f:
-                        f.write(chars_content)
+                # Save Characters
+                if chars_content:
+                    try:
+                        clean_chars = self._sanitize_yaml(chars_content)
+                        parsed = yaml.safe_load(clean_chars)
+                        self._set_state("characters", clean_chars, parsed)
+                    except Exception as e:
+                        print(f"⚠️ 角色状态YAML解析失败，已保存原始内容: {e}")
+                        # 即使解析失败保存下来也比丢失好
+                        self._set_state("characters", chars_content)
 
-            # Save Arcs
-            if arcs_content:
-                try:
-                    clean_arcs = self._sanitize_yaml(arcs_content)
-                    _ = yaml.safe_load(clean_arcs)
-                    with open(self.plot_arcs_path, "w", encoding="utf-8") as f:
-                        f.write(clean_arcs)
-                except Exception as e:
-                    print(f"⚠️ 剧情线YAML解析失败，已保存原始内容: {e}")
-                    with open(self.plot_arcs_path, "w", encoding="utf-8") as f:
-                        f.write(arcs_content)
+                # Save Arcs
+                if arcs_content:
+                    try:
+                        clean_arcs = self._sanitize_yaml(arcs_content)
+                        parsed = yaml.safe_load(clean_arcs)
+                        self._set_state("arcs", clean_arcs, parsed)
+                    except Exception as e:
+                        print(f"⚠️ 剧情线YAML解析失败，已保存原始内容: {e}")
+                        self._set_state("arcs", arcs_content)
+
+                self._mark_updated(metadata, memory_content)
             
             # Save RAG Memory
-            if memory_content:
-                try:
-                    vec = llm.embed_content(memory_content)
-                    if vec:
-                        self.rag.add_document(text=memory_content, vector=vec)
-                        print("  * 已将本节摘要存入 RAG 长期记忆库。")
-                except Exception as e:
-                     print(f"⚠️ RAG 记忆存储失败: {e}")
+            self._store_memory(llm, memory_content, metadata)
                     
         except Exception as e:
             print(f"⚠️ 解析状态响应时发生错误: {e}")
 
+    def _parsed_state(self, name):
+        """角色/剧情线的解析结果（{名字: 内容}，不是映射时为 None），同一版本的文本只解析一次。"""
+        if name not in self._parsed:
+            self._parsed[name] = parse_mapping(self._state[name])
+        return self._parsed[name]
+
+    def _set_state(self, name, text, parsed=None):
+        """只更新内存并标记为脏；parsed 为调用方已解析好的结果，可省去再次解析。"""
+        self._state[name] = text
+        self._dirty.add(name)
+        if isinstance(parsed, dict):
+            self._parsed[name] = parsed
+        else:
+            self._parsed.pop(name, None)
+
+    def flush(self):
+        """把内存中有改动的状态写回磁盘：先写临时文件再 os.replace，保证文件要么是旧版本要么是新版本。"""
+        with self._lock:
+            for name in sorted(self._dirty):
+                path = self._paths[name]
+                tmp_path = path + ".tmp"
+                try:
+                    with open(tmp_path, "w", encoding="utf-8") as f:
+                        f.write(self._state[name])
+                        # 内容落盘后再替换：否则断电后可能留下替换成功但内容为空的文件
+                        f.flush()
+                        os.fsync(f.fileno())
+                    os.replace(tmp_path, path)
+                    self._dirty.discard(name)
+                except OSError as e:
+                    print(f"⚠️ 状态文件写入失败 ({os.path.basename(path)})，将在下次保存时重试: {e}")
+            self._updates_since_flush = 0
+            # 状态文件全部写回之后才在预写日志中记为已应用
+            if not self._dirty:
+                for (chapter, section), memory_content in self._unjournaled:
+                    self.journal.record(chapter, section, STATE_APPLIED, memory=memory_content or None)
+                self._unjournaled = []
+
+    def save_memory_index(self):
+        """检查点：把记忆库的 ANN 索引写入磁盘，避免下次启动时从头重建（应在后台更新全部完成后调用）。"""
+        with self._lock:
+            self.rag.save_index()
+
+    def recover_section(self, llm, content, metadata, delta_block=None):
+        """
+        崩溃恢复：对正文已写完的小节只补做预写日志中缺失的步骤。
+        状态未落盘时重新执行状态更新（已入库的记忆不会重复存入）；只缺记忆时用日志中保存的记忆文本入库。
+        """
+        key = section_key(metadata)
+        if not self.journal or not key:
+            return
+        applied = self.journal.get(*key, STATE_APPLIED)
+        if applied is None:
+            print(f"🔄 第 {key[0]} 章第 {key[1]} 节的状态更新未完成，正在补做...")
+            if delta_block:
+                self.apply_fused_update(llm, delta_block, content, metadata)
+            else:
+                self.update_state(llm, content, metadata)
+        elif not self.journal.has(*key, MEMORY_INDEXED):
+            print(f"🔄 第 {key[0]} 章第 {key[1]} 节的记忆未入库，正在补做...")
+            self._store_memory(llm, applied.get("memory", ""), metadata)
+
+    def _embedding_id(self, llm):
+        """驱动的嵌入模型标识；不支持的驱动返回 None，跳过一致性检查。"""
+        return llm.embedding_id() if hasattr(llm, "embedding_id") else None
+
     def _sanitize_yaml(self, text):
         """
         Attempts to clean and fix common YAML formatting errors from LLM output.
@@ -0,0 +1,62 @@
+import asyncio
+import weakref
+from abc import ABC, abstractmethod
+
+# 每个事件循环一个共享的异步 HTTP 客户端（连接池），所有异步驱动共用，
+# 事件循环被回收时客户端随之释放
+_shared_http_clients = weakref.WeakKeyDictionary()
+
+def shared_http_client(builder):
+    """
+    返回当前事件循环上共享的异步 HTTP 客户端，不存在时调用 builder() 创建。
+    必须在协程中调用。
+    """
+    loop = asyncio.get_running_loop()
+    client = _shared_http_clients.get(loop)
+    if client is None:
+        client = builder()
+        _shared_http_clients[loop] = client
+    return client
+
+async def aclose_shared_http_client():
+    """关闭当前事件循环上的共享客户端，通常在 asyncio.run 的主协程结束前调用。"""
+    client = _shared_http_clients.pop(asyncio.get_running_loop(), None)
+    if client is not None:
+        await client.aclose()
+
+
+class AsyncBaseDriver(ABC):
+    """
+    异步驱动接口。实现类同时继承对应的同步驱动，因此同一个对象既能在协程中
+    并发调用 agenerate_content / aembed_content，也能被现有同步代码直接使用。
+    """
+    # 单个驱动同时在途的请求上限
+    max_concurrency = 8
+
+    @abstractmethod
+    async def agenerate_content(self, prompt: str, system_instruction: str = None) -> str:
+        """异步生成文本内容的接口"""
+        pass
+
+    @abstractmethod
+    async def aembed_content(self, text: str) -> list[float]:
+        """异步生成文本嵌入向量的接口"""
+        pass
+
+    async def aembed_contents(self, texts: list[str]) -> list[list[float]]:
+        """异步批量嵌入，默认并发调用 aembed_content。"""
+        return list(await asyncio.gather(*(self.aembed_content(text) for text in texts)))
+
+    async def aclose(self):
+        """释放当前事件循环上的共享 HTTP 客户端，在 asyncio.run 的主协程结束前调用一次即可。"""
+        await aclose_shared_http_client()
+
+    def _request_slot(self):
+        """当前事件循环上的并发信号量，用法: async with self._request_slot(): ..."""
+        slots = self.__dict__.setdefault("_request_slots", weakref.WeakKeyDictionary())
+        loop = asyncio.get_running_loop()
+        semaphore = slots.get(loop)
+        if semaphore is None:
+            semaphore = asyncio.Semaphore(self.max_concurrency)
+            slots[loop] = semaphore
+        return semaphore
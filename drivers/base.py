@@ -1,6 +1,35 @@
 from abc import ABC, abstractmethod
 
+from core import metrics
+from core.ai_logger import usage_to_dict
+
+def innermost_driver(driver):
+    """
+    沿包装层（指标、限流、缓存、录制）的 .driver 链找到最内层的真实驱动。
+    包装层本身也是 BaseDriver，会继承类属性的默认值，因此读取真实驱动的配置时不能只靠属性透传。
+    """
+    while hasattr(driver, "driver"):
+        driver = driver.driver
+    return driver
+
+
+class FailedEmbedding(list):
+    """
+    嵌入失败时驱动返回的空向量，附带错误信息。它仍是空列表，调用方照旧按失败处理；
+    限流层据此识别 429/配额错误，触发并发减半与重试。
+    """
+
+    def __init__(self, error):
+        super().__init__()
+        self.error = str(error)
+
+
 class BaseDriver(ABC):
+    # 单次批量嵌入请求最多包含的文本条数
+    embedding_batch_size = 100
+    # 影响输出的生成参数（temperature 等），由具体驱动在构造时设置，参与响应录制/回放缓存的键
+    generation_params = None
+
     @abstractmethod
     def generate_content(self, prompt: str, system_instruction: str = None) -> str:
         """生成文本内容的接口"""
@@ -10,3 +39,37 @@ class BaseDriver(ABC):
     def embed_content(self, text: str) -> list[float]:
         """生成文本嵌入向量的接口"""
         pass
+
+    def generate_content_stream(self, prompt: str, system_instruction: str = None):
+        """
+        流式生成文本，逐块 yield 字符串。
+        请求一开始就失败时只 yield 一条以 ⚠️ 开头的错误信息；已输出部分内容后中断则抛出异常，
+        调用方可据此保留已生成的部分。默认实现一次性返回 generate_content 的结果。
+        """
+        yield self.generate_content(prompt, system_instruction)
+
+    def generate_json(self, prompt: str, system_instruction: str = None) -> str:
+        """
+        生成 JSON 文本（返回字符串，由调用方解析与校验）。
+        支持原生 JSON 输出模式的驱动应覆盖此方法；默认实现与 generate_content 相同，依靠提示词约束格式。
+        """
+        return self.generate_content(prompt, system_instruction)
+
+    def embed_contents(self, texts: list[str]) -> list[list[float]]:
+        """
+        批量生成嵌入向量，返回与 texts 一一对应的列表（失败的条目为空列表）。
+        默认逐条调用 embed_content，支持原生批量接口的驱动应覆盖此方法。
+        """
+        return [self.embed_content(text) for text in texts]
+
+    def _report_usage(self, usage, prompt=None, completion=None):
+        """上报 token 用量（带当前 stage / novel 标签）；接口未返回 usage 时按字符数估算。"""
+        usage = usage_to_dict(usage)
+        if usage is None and prompt is not None:
+            usage = {"prompt_tokens": len(prompt), "completion_tokens": len(completion or "")}
+        metrics.record_token_usage(usage, model=getattr(self, "model_name", None))
+
+    def embedding_id(self) -> str:
+        """嵌入模型标识 (provider/model)，用于判断记忆库向量是否由同一模型生成。"""
+        provider = getattr(self, "provider_name", type(self).__name__)
+        return f"{provider}/{getattr(self, 'embedding_model', '')}"
@@ -0,0 +1,183 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from array import array
+
+from .base import BaseDriver
+
+def default_cache_path():
+    root_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+    return os.path.join(root_dir, ".cache", "embeddings.sqlite3")
+
+class EmbeddingCache:
+    """
+    基于 SQLite 的持久化嵌入向量缓存，按内容寻址。
+
+    键为 (provider, 嵌入模型, task_type, sha256(text))，向量以 float32 二进制保存。
+    超过 max_bytes 时按最近使用时间 (LRU) 淘汰最旧的条目。
+    """
+
+    def __init__(self, path=None, max_bytes=256 * 1024 * 1024):
+        self.path = path or default_cache_path()
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        cache_dir = os.path.dirname(self.path)
+        if cache_dir and not os.path.exists(cache_dir):
+            os.makedirs(cache_dir)
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            " key TEXT PRIMARY KEY, vector BLOB NOT NULL, last_used REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_last_used ON embeddings(last_used)")
+        self._conn.commit()
+        self._total_bytes = self._conn.execute(
+            "SELECT COALESCE(SUM(LENGTH(vector)), 0) FROM embeddings"
+        ).fetchone()[0]
+        self._last_tick = 0.0
+
+    def _tick(self):
+        """单调递增的访问时间戳，避免时钟精度不足时 LRU 顺序相同。"""
+        self._last_tick = max(time.time(), self._last_tick + 1e-6)
+        return self._last_tick
+
+    @staticmethod
+    def make_key(provider, model, task_type, text):
+        digest = hashlib.sha256(text.encode("utf-8")).hexdigest()
+        return f"{provider}|{model}|{task_type}|{digest}"
+
+    def get(self, key):
+        with self._lock:
+            row = self._conn.execute("SELECT vector FROM embeddings WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            self._conn.execute("UPDATE embeddings SET last_used = ? WHERE key = ?", (self._tick(), key))
+            self._conn.commit()
+        vector = array("f")
+        vector.frombytes(row[0])
+        return vector.tolist()
+
+    def put(self, key, vector):
+        blob = array("f", vector).tobytes()
+        with self._lock:
+            old = self._conn.execute("SELECT LENGTH(vector) FROM embeddings WHERE key = ?", (key,)).fetchone()
+            self._conn.execute(
+                "INSERT OR REPLACE INTO embeddings (key, vector, last_used) VALUES (?, ?, ?)",
+                (key, blob, self._tick())
+            )
+            self._total_bytes += len(blob) - (old[0] if old else 0)
+            self._evict()
+            self._conn.commit()
+
+    def _evict(self):
+        while self._total_bytes > self.max_bytes:
+            rows = self._conn.execute(
+                "SELECT key, LENGTH(vector) FROM embeddings ORDER BY last_used LIMIT 64"
+            ).fetchall()
+            if not rows:
+                self._total_bytes = 0
+                return
+            for key, size in rows:
+                if self._total_bytes <= self.max_bytes:
+                    break
+                self._conn.execute("DELETE FROM embeddings WHERE key = ?", (key,))
+                self._total_bytes -= size
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+class CachedEmbeddingDriver(BaseDriver):
+    """
+    在任意驱动外包一层嵌入缓存。generate_content 及其他属性原样透传给内部驱动。
+    """
+
+    def __init__(self, driver, cache):
+        self.driver = driver
+        self.cache = cache
+
+    def __getattr__(self, name):
+        return getattr(self.driver, name)
+
+    def generate_content(self, prompt: str, system_instruction: str = None) -> str:
+        return self.driver.generate_content(prompt, system_instruction)
+
+    def generate_json(self, prompt: str, system_instruction: str = None) -> str:
+        return self.driver.generate_json(prompt, system_instruction)
+
+    def generate_content_stream(self, prompt: str, system_instruction: str = None):
+        return self.driver.generate_content_stream(prompt, system_instruction)
+
+    def _key(self, text):
+        return EmbeddingCache.make_key(
+            getattr(self.driver, "provider_name", type(self.driver).__name__),
+            getattr(self.driver, "embedding_model", ""),
+            getattr(self.driver, "embedding_task_type", ""),
+            text
+        )
+
+    def _lookup(self, key):
+        try:
+            return self.cache.get(key)
+        except Exception as e:
+            print(f"⚠️ 读取嵌入缓存失败: {e}")
+            return None
+
+    def _store(self, key, vector):
+        # 失败时驱动返回空列表，不缓存
+        if not vector:
+            return
+        try:
+            self.cache.put(key, vector)
+        except Exception as e:
+            print(f"⚠️ 写入嵌入缓存失败: {e}")
+
+    def embed_content(self, text: str) -> list[float]:
+        key = self._key(text)
+        cached = self._lookup(key)
+        if cached is not None:
+            return cached
+
+        vector = self.driver.embed_content(text)
+        self._store(key, vector)
+        return vector
+
+    def embed_contents(self, texts: list[str]) -> list[list[float]]:
+        keys = [self._key(text) for text in texts]
+        vectors = [self._lookup(key) for key in keys]
+        missing = [i for i, vec in enumerate(vectors) if vec is None]
+        if missing:
+            # 只把未命中的文本交给内部驱动批量嵌入
+            fresh = self.driver.embed_contents([texts[i] for i in missing])
+            for i, vec in zip(missing, fresh):
+                vectors[i] = vec
+                self._store(keys[i], vec)
+        return vectors
+
+    async def aembed_content(self, text: str) -> list[float]:
+        key = self._key(text)
+        cached = self._lookup(key)
+        if cached is not None:
+            return cached
+
+        vector = await self.driver.aembed_content(text)
+        self._store(key, vector)
+        return vector
+
+    async def aembed_contents(self, texts: list[str]) -> list[list[float]]:
+        keys = [self._key(text) for text in texts]
+        vectors = [self._lookup(key) for key in keys]
+        missing = [i for i, vec in enumerate(vectors) if vec is None]
+        if missing:
+            fresh = await self.driver.aembed_contents([texts[i] for i in missing])
+            for i, vec in zip(missing, fresh):
+                vectors[i] = vec
+                self._store(keys[i], vec)
+        return vectors
@@ -1,11 +1,121 @@
-from .gemini import GeminiDriver
-from .openai import OpenAIDriver
+import os
 
-def get_driver(provider, api_key, model_name, base_url=None):
+from .gemini import GeminiDriver, AsyncGeminiDriver
+from .openai import OpenAIDriver, AsyncOpenAIDriver
+from .fake import FakeDriver, AsyncFakeDriver
+from .embedding_cache import EmbeddingCache, CachedEmbeddingDriver
+from .rate_limiter import RateLimitedDriver
+from .metered import MeteredDriver
+from .response_cache import ResponseCache, RecordReplayDriver, RESPONSE_CACHE_MODES
+from .base import innermost_driver
+
+DRIVERS = {
+    "gemini": GeminiDriver,
+    "openai": OpenAIDriver,
+    "fake": FakeDriver,
+}
+
+ASYNC_DRIVERS = {
+    "gemini": AsyncGeminiDriver,
+    "openai": AsyncOpenAIDriver,
+    "fake": AsyncFakeDriver,
+}
+
+# 进程级共享限流器；设置后所有新建驱动（包括工具脚本内部创建的）都经过它
+_global_rate_limiter = None
+
+def set_rate_limiter(limiter):
+    """设置（或用 None 清除）所有驱动共享的全局 RateLimiter。"""
+    global _global_rate_limiter
+    _global_rate_limiter = limiter
+
+# 进程级响应录制/回放设置；首次使用时从环境变量 LLM_RESPONSE_CACHE 读取
+_global_response_cache = None
+_response_cache_configured = False
+
+def set_response_cache(cache, mode=None):
+    """
+    设置（或用 None 关闭）所有驱动共享的响应录制/回放缓存。
+
+    :param cache: ResponseCache 实例。
+    :param mode: record / replay / readthrough，默认 readthrough。
+    """
+    global _global_response_cache, _response_cache_configured
+    _global_response_cache = (cache, mode or "readthrough") if cache is not None else None
+    _response_cache_configured = True
+
+def _default_response_cache():
+    global _global_response_cache, _response_cache_configured
+    if not _response_cache_configured:
+        _response_cache_configured = True
+        mode = (os.getenv("LLM_RESPONSE_CACHE") or "").strip().lower()
+        if mode in RESPONSE_CACHE_MODES:
+            try:
+                cache = ResponseCache(os.getenv("LLM_RESPONSE_CACHE_PATH") or None)
+                _global_response_cache = (cache, mode)
+                print(f"🔄 LLM 响应缓存已启用 ({mode}): {cache.path}")
+            except Exception as e:
+                print(f"⚠️ 响应缓存初始化失败，将直接调用接口: {e}")
+        elif mode and mode != "off":
+            print(f"⚠️ 未知的 LLM_RESPONSE_CACHE 模式: {mode}，已忽略。")
+    return _global_response_cache
+
+def _build_driver(registry, provider, api_key, model_name, base_url, embedding_cache, rate_limiter=None,
+                  response_cache=None, driver_options=None):
     provider = provider.lower()
-    if provider == "gemini":
-        return GeminiDriver(api_key, model_name, base_url)
-    elif provider == "openai":
-        return OpenAIDriver(api_key, model_name, base_url)
-    else:
+    driver_cls = registry.get(provider)
+    if driver_cls is None:
         raise ValueError(f"不支持的 LLM 提供商 (Provider): {provider}")
+    # 指标层紧贴真实驱动，记录每一次实际的接口调用
+    driver = MeteredDriver(driver_cls(api_key, model_name, base_url, **(driver_options or {})))
+
+    # 限流层包在缓存层之内：命中嵌入缓存的请求不消耗配额
+    rate_limiter = rate_limiter or _global_rate_limiter
+    if rate_limiter is not None:
+        driver = RateLimitedDriver(driver, rate_limiter)
+
+    if embedding_cache is True:
+        try:
+            embedding_cache = EmbeddingCache()
+        except Exception as e:
+            print(f"⚠️ 嵌入缓存初始化失败，将直接调用嵌入接口: {e}")
+            embedding_cache = None
+    if isinstance(embedding_cache, EmbeddingCache):
+        driver = CachedEmbeddingDriver(driver, embedding_cache)
+
+    # 录制层在最外面：回放命中时既不消耗配额，也能覆盖已被嵌入缓存挡住的请求
+    if response_cache is None:
+        response_cache = _default_response_cache()
+    if response_cache:
+        cache, mode = response_cache
+        driver = RecordReplayDriver(driver, cache, mode)
+    return driver
+
+def get_driver(provider, api_key, model_name, base_url=None, embedding_cache=True, rate_limiter=None,
+               response_cache=None, driver_options=None):
+    """
+    :param embedding_cache: True 使用默认路径的持久化嵌入缓存；False/None 关闭；
+                            也可以直接传入 EmbeddingCache 实例。
+    :param rate_limiter: 本驱动使用的 RateLimiter，默认使用 set_rate_limiter 设置的全局限流器。
+    :param response_cache: (ResponseCache, mode) 元组；False 关闭；默认使用 set_response_cache
+                           或环境变量 LLM_RESPONSE_CACHE 的设置。
+    :param driver_options: 透传给驱动构造函数的额外参数，如 fake 驱动的 latency、failure_rate。
+    """
+    return _build_driver(DRIVERS, provider, api_key, model_name, base_url, embedding_cache, rate_limiter,
+                         response_cache, driver_options)
+
+def get_async_driver(provider, api_key, model_name, base_url=None, embedding_cache=True, max_concurrency=None,
+                     rate_limiter=None, response_cache=None, driver_options=None):
+    """
+    get_driver 的异步版本。返回的驱动同时提供 agenerate_content / aembed_content
+    以及原有的同步方法。同一事件循环上的驱动共用一个 HTTP 连接池，用完后在该事件循环中
+    await driver.aclose() 释放。
+
+    :param max_concurrency: 单个驱动同时在途的请求上限，默认见 AsyncBaseDriver.max_concurrency。
+    """
+    driver = _build_driver(ASYNC_DRIVERS, provider, api_key, model_name, base_url, embedding_cache, rate_limiter,
+                           response_cache, driver_options)
+    if max_concurrency:
+        # 设置到最内层的真正驱动对象上（信号量由它创建）
+        innermost_driver(driver).max_concurrency = max_concurrency
+    return driver
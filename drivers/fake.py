@@ -0,0 +1,304 @@
+import asyncio
+import hashlib
+import json
+import math
+import os
+import random
+import re
+import threading
+import time
+
+import yaml
+
+from .base import BaseDriver
+from .async_base import AsyncBaseDriver
+from core.ai_logger import log_ai_interaction
+
+# 生成伪正文用的字符池，保证输出是中文且长度可控
+_PROSE_POOL = "夜色沉沉风声过林少年握紧手中长剑心中暗想此番下山必有一场劫难远处钟声响起师父的话犹在耳边他深吸一口气迈步向前"
+
+def _env_float(name, default):
+    value = os.getenv(name)
+    try:
+        return float(value) if value not in (None, "") else default
+    except ValueError:
+        return default
+
+def _stable_seed(*parts):
+    digest = hashlib.sha256("\x1f".join(str(p) for p in parts).encode("utf-8")).digest()
+    return int.from_bytes(digest[:8], "little")
+
+
+class FakeDriver(BaseDriver):
+    """
+    进程内的合成驱动，不访问网络，用于基准测试和离线演练完整流程。
+
+    按提示词识别请求类型（路标 / 大纲批次 / 衔接修正 / 状态更新 / 正文 / 配置），
+    输出符合各环节解析格式的文本；相同提示词的输出固定不变。
+    延迟 = 首包延迟（按所选分布采样）+ 输出 token 数 / tokens_per_second。
+
+    所有参数都可通过 get_driver(..., driver_options={...}) 传入，未传入时读取
+    FAKE_LLM_* 环境变量（见 .env.example）。
+    """
+    provider_name = "fake"
+    embedding_task_type = ""
+
+    def __init__(self, api_key=None, model_name=None, base_url=None, latency=None, latency_distribution=None,
+                 latency_jitter=None, tokens_per_second=None, embedding_dim=None, failure_rate=None,
+                 rate_limit_rate=None, stream_interrupt_rate=None, seed=None, log_interactions=False,
+                 generation_params=None):
+        self.model_name = model_name or "fake-model"
+        # 合成输出不受生成参数影响，只记录下来，使不同配置的响应缓存互不混用
+        self.generation_params = dict(generation_params) if generation_params else None
+        self.latency = latency if latency is not None else _env_float("FAKE_LLM_LATENCY", 0.0)
+        self.latency_distribution = (latency_distribution or os.getenv("FAKE_LLM_LATENCY_DIST") or "constant").lower()
+        self.latency_jitter = latency_jitter if latency_jitter is not None else _env_float("FAKE_LLM_LATENCY_JITTER", 0.5)
+        self.tokens_per_second = tokens_per_second if tokens_per_second is not None else _env_float("FAKE_LLM_TOKENS_PER_SEC", 0.0)
+        self.embedding_dim = int(embedding_dim or _env_float("FAKE_LLM_EMBEDDING_DIM", 64))
+        self.failure_rate = failure_rate if failure_rate is not None else _env_float("FAKE_LLM_FAILURE_RATE", 0.0)
+        self.rate_limit_rate = rate_limit_rate if rate_limit_rate is not None else _env_float("FAKE_LLM_RATE_LIMIT_RATE", 0.0)
+        self.stream_interrupt_rate = (stream_interrupt_rate if stream_interrupt_rate is not None
+                                      else _env_float("FAKE_LLM_STREAM_INTERRUPT_RATE", 0.0))
+        self.log_interactions = log_interactions
+        self.embedding_model = f"hash-{self.embedding_dim}"
+        # 延迟与故障注入共用一个随机源；输出内容只由提示词决定，不受其影响
+        self._rng = random.Random(int(seed if seed is not None else _env_float("FAKE_LLM_SEED", 0)))
+        self._rng_lock = threading.Lock()
+        self.calls = 0
+
+    # ---------- 延迟与故障 ----------
+
+    def _count_call(self):
+        with self._rng_lock:
+            self.calls += 1
+
+    def _random(self):
+        with self._rng_lock:
+            return self._rng.random()
+
+    def _first_token_delay(self):
+        mean = self.latency
+        if mean <= 0:
+            return 0.0
+        with self._rng_lock:
+            rng = self._rng
+            if self.latency_distribution == "uniform":
+                return max(0.0, rng.uniform(mean * (1 - self.latency_jitter), mean * (1 + self.latency_jitter)))
+            if self.latency_distribution == "exponential":
+                return rng.expovariate(1.0 / mean)
+            if self.latency_distribution == "lognormal":
+                # 以 mean 为中位数、latency_jitter 为 sigma 的长尾分布
+                return rng.lognormvariate(math.log(mean), self.latency_jitter)
+        return mean
+
+    def _output_delay(self, text):
+        return len(text) / self.tokens_per_second if self.tokens_per_second > 0 else 0.0
+
+    def _injected_error(self):
+        """按配置的比例返回模拟的错误信息，未命中时返回 None。"""
+        roll = self._random()
+        if roll < self.rate_limit_rate:
+            return "⚠️ [LLM 错误] 429 Too Many Requests: 模拟限流"
+        if roll < self.rate_limit_rate + self.failure_rate:
+            return "⚠️ [LLM 错误] 内容被安全拦截或生成失败。原因: 模拟故障"
+        return None
+
+    def _log(self, prompt, system_instruction, text):
+        log_prompt = f"[System]: {system_instruction}\n[User]: {prompt}" if system_instruction else prompt
+        usage = {"prompt_tokens": len(log_prompt), "completion_tokens": len(text)}
+        if self.log_interactions:
+            log_ai_interaction(log_prompt, text, usage)
+        if not text.startswith("⚠️"):
+            self._report_usage(usage)
+
+    # ---------- 生成 ----------
+
+    def generate_content(self, prompt: str, system_instruction: str = None) -> str:
+        self._count_call()
+        error = self._injected_error()
+        text = error or self.compose(prompt, system_instruction)
+        time.sleep(self._first_token_delay() + (0 if error else self._output_delay(text)))
+        self._log(prompt, system_instruction, text)
+        return text
+
+    def generate_content_stream(self, prompt: str, system_instruction: str = None):
+        self._count_call()
+        error = self._injected_error()
+        time.sleep(self._first_token_delay())
+        if error:
+            self._log(prompt, system_instruction, error)
+            yield error
+            return
+
+        text = self.compose(prompt, system_instruction)
+        interrupt_at = len(text) // 2 if self._random() < self.stream_interrupt_rate else None
+        chunk_size = 32
+        for start in range(0, len(text), chunk_size):
+            if interrupt_at is not None and start >= interrupt_at:
+                raise ConnectionError("模拟流式连接中断")
+            chunk = text[start:start + chunk_size]
+            time.sleep(self._output_delay(chunk))
+            yield chunk
+        self._log(prompt, system_instruction, text)
+
+    def compose(self, prompt, system_instruction=None):
+        """根据提示词类型生成符合格式的确定性输出。"""
+        if "===SUMMARY===" in prompt:
+            return self._state_update(prompt)
+        if "【状态增量】" in prompt:
+            return self._state_delta(prompt)
+        if "只输出修正后的下一章" in prompt:
+            return self._reconciled_chapter(prompt)
+        if "【记忆归并】" in prompt:
+            return self._consolidated_memory(prompt)
+        match = re.search(r"第 (\d+) 章至第 (\d+) 章的详细大纲.*?每一章必须包含 (\d+) 节", prompt, re.S)
+        if match:
+            start, end, sections = (int(g) for g in match.groups())
+            return "\n".join(self._outline_chapter(n, sections, prompt) for n in range(start, end + 1))
+        if "制定一份《全局剧情路标》" in prompt:
+            return self._roadmap(prompt)
+        if "请重写这段大纲" in prompt:
+            match = re.search(r"【原大纲片段】：\s*(.*?)\s*【任务】", prompt, re.S)
+            return match.group(1) if match else prompt
+        if "生成一个完整的小说配置文件" in prompt:
+            return self._novel_config(prompt)
+        if "构思一个新颖" in prompt:
+            return f"一个关于失落古卷与{self._prose(prompt, 8)}的奇幻故事。"
+
+        match = re.search(r"创作约 (\d+) 字", prompt)
+        length = int(match.group(1)) if match else 500
+        if "【断点续写】" in prompt:
+            # 续写只补足剩余字数
+            existing = prompt.split("【断点续写】", 1)[1]
+            length = max(50, length - len(existing))
+        prose = self._prose(prompt, length)
+        match = re.search(r"另起一行输出 (=+\w+=+)", prompt)
+        if match:
+            # 融合模式：正文之后附带状态增量块
+            return f"{prose}\n{match.group(1)}\n{self._delta_json(prose)}"
+        return prose
+
+    def _prose(self, prompt, length):
+        rng = random.Random(_stable_seed(self.model_name, prompt))
+        return "".join(rng.choice(_PROSE_POOL) for _ in range(length))
+
+    def _roadmap(self, prompt):
+        lines = [
+            "核心故事曲线：起——少年下山；承——卷入宗门之争；转——身世揭晓；合——终局决战。",
+            "全书终极悬念：古卷的真正主人是谁。",
+            "关键伏笔：神秘玉佩（前期埋下，终局揭秘）；师父的旧伤（中期埋下，转折处揭秘）。",
+        ]
+        for start, end in re.findall(r"第(\d+)-(\d+)章", prompt.split("区间：", 1)[1] if "区间：" in prompt else ""):
+            lines.append(f"第{start}-{end}章：{self._prose(prompt + start, 20)}")
+        return "\n".join(lines)
+
+    def _outline_chapter(self, number, sections, prompt):
+        lines = [f"第{number}章：{self._prose(f'{prompt}{number}', 6)}",
+                 f"  【本章伏笔/悬念任务】：{self._prose(f'{prompt}{number}伏笔', 15)}"]
+        for m in range(1, sections + 1):
+            lines.append(f"  第{m}节：{self._prose(f'{prompt}{number}-{m}', 30)}")
+        return "\n".join(lines)
+
+    def _reconciled_chapter(self, prompt):
+        number = re.search(r"以“第(\d+)章：”开头", prompt)
+        sections = re.search(r"和 (\d+) 个“第M节：”", prompt)
+        return self._outline_chapter(int(number.group(1)) if number else 1,
+                                     int(sections.group(1)) if sections else 1, prompt)
+
+    def _state_update(self, prompt):
+        match = re.search(r"【最新生成的内容】：\s*(.*?)\s*【任务】", prompt, re.S)
+        content = match.group(1) if match else prompt
+        digest = hashlib.sha256(content.encode("utf-8")).hexdigest()[:8]
+        return "\n".join([
+            "===SUMMARY===",
+            f"故事推进至片段 {digest}：{content[:60]}",
+            "===CHARACTERS===",
+            "主角:",
+            f"  状态: \"{self._prose(content + '状态', 10)}\"",
+            f"  位置: \"{self._prose(content + '位置', 4)}\"",
+            "===ARCS===",
+            f"神秘玉佩: \"未解决，线索 {digest}\"",
+            "===MEMORY===",
+            content[:100],
+        ])
+
+    def _state_delta(self, prompt):
+        match = re.search(r"【最新生成的内容】：\s*(.*?)\s*【任务】", prompt, re.S)
+        return self._delta_json(match.group(1) if match else prompt)
+
+    def _delta_json(self, content):
+        digest = hashlib.sha256(content.encode("utf-8")).hexdigest()[:8]
+        return json.dumps({
+            "operations": [
+                {"op": "append_summary", "text": f"故事推进至片段 {digest}：{content[:60]}"},
+                {"op": "set_character", "name": "主角", "field": "状态", "value": self._prose(content + "状态", 10)},
+                {"op": "set_character", "name": "主角", "field": "位置", "value": self._prose(content + "位置", 4)},
+                {"op": "open_arc", "name": "神秘玉佩", "description": f"未解决，线索 {digest}"},
+            ],
+            "memory": content[:100],
+        }, ensure_ascii=False)
+
+    def _consolidated_memory(self, prompt):
+        # 每条记忆取开头几个字拼接，截到要求的长度
+        match = re.search(r"约 (\d+) 字", prompt)
+        length = int(match.group(1)) if match else 150
+        items = re.findall(r"^\s*\d+\. (.*)$", prompt, re.M)
+        return "；".join(item[:20] for item in items)[:length] or self._prose(prompt, length)
+
+    def _novel_config(self, prompt):
+        match = re.search(r"【YAML 模板】:\s*(.*?)\s*【要求】", prompt, re.S)
+        try:
+            config = yaml.safe_load(match.group(1)) if match else None
+        except yaml.YAMLError:
+            config = None
+        if not isinstance(config, dict):
+            config = {}
+        novel = config.setdefault("novel", {})
+        idea = re.search(r"【小说创意】:\s*(.*?)\s*【YAML 模板】", prompt, re.S)
+        novel["title"] = f"合成小说_{hashlib.sha256(prompt.encode('utf-8')).hexdigest()[:6]}"
+        novel["idea"] = idea.group(1) if idea else novel.get("idea", "")
+        return yaml.safe_dump(config, allow_unicode=True, sort_keys=False)
+
+    # ---------- 嵌入 ----------
+
+    def _hash_embedding(self, text):
+        """字符二元组特征哈希得到的伪嵌入：确定性，且字面相近的文本向量也相近。"""
+        vector = [0.0] * self.embedding_dim
+        for i in range(max(1, len(text) - 1)):
+            h = _stable_seed(text[i:i + 2])
+            vector[h % self.embedding_dim] += 1.0 if (h >> 32) & 1 else -1.0
+        norm = math.sqrt(sum(v * v for v in vector)) or 1.0
+        return [v / norm for v in vector]
+
+    def _embed_failed(self):
+        return bool(self.failure_rate) and self._random() < self.failure_rate
+
+    def embed_content(self, text: str) -> list[float]:
+        self._count_call()
+        time.sleep(self._first_token_delay())
+        return [] if self._embed_failed() else self._hash_embedding(text)
+
+    def embed_contents(self, texts: list[str]) -> list[list[float]]:
+        # 批量请求只计一次首包延迟
+        self._count_call()
+        time.sleep(self._first_token_delay())
+        return [[] if self._embed_failed() else self._hash_embedding(text) for text in texts]
+
+
+class AsyncFakeDriver(FakeDriver, AsyncBaseDriver):
+    """FakeDriver 的异步版本，延迟通过 asyncio.sleep 模拟，不占用线程。"""
+
+    async def agenerate_content(self, prompt: str, system_instruction: str = None) -> str:
+        async with self._request_slot():
+            self._count_call()
+            error = self._injected_error()
+            text = error or self.compose(prompt, system_instruction)
+            await asyncio.sleep(self._first_token_delay() + (0 if error else self._output_delay(text)))
+            self._log(prompt, system_instruction, text)
+            return text
+
+    async def aembed_content(self, text: str) -> list[float]:
+        async with self._request_slot():
+            self._count_call()
+            await asyncio.sleep(self._first_token_delay())
+            return [] if self._embed_failed() else self._hash_embedding(text)
@@ -1,10 +1,25 @@
-from .base import BaseDriver
+from .base import BaseDriver, FailedEmbedding
+from .async_base import AsyncBaseDriver
 import sys
+import threading
+from collections import OrderedDict
 from core.ai_logger import log_ai_interaction
 
 class GeminiDriver(BaseDriver):
-    def __init__(self, api_key, model_name, base_url=None):
+    provider_name = "gemini"
+    # 使用 text-embedding-004 作为默认模型，这是一个很好的通用模型
+    embedding_model = "models/text-embedding-004"
+    embedding_task_type = "retrieval_document" # 或者 retrieval_query，但在我们场景下 document 通用性更好
+    model_cache_size = 32
+
+    def __init__(self, api_key, model_name, base_url=None, generation_params=None):
+        """
+        :param generation_params: 作为 generation_config 传给 GenerativeModel，如 temperature、top_p、max_output_tokens。
+        """
         self.model_name = model_name
+        self.generation_params = dict(generation_params) if generation_params else None
+        self._instruction_models = OrderedDict()
+        self._models_lock = threading.Lock()
         try:
             import google.generativeai as genai
             from google.generativeai.types import HarmCategory, HarmBlockThreshold
@@ -28,58 +43,186 @@ class GeminiDriver(BaseDriver):
             
             self.model = genai.GenerativeModel(
                 model_name=model_name,
-                safety_settings=self.safety_settings
+                safety_settings=self.safety_settings,
+                generation_config=self.generation_params
             )
         except ImportError:
             print("错误: 缺少 google-generativeai 库。请运行 'pip install google-generativeai' 进行安装。")
             sys.exit(1)
 
-    def generate_content(self, prompt: str, system_instruction: str = None) -> str:
-        try:
-            # 如果提供了 system_instruction，我们需要重新实例化一个带有 instruction 的轻量级模型对象
-            # 这是一个客户端操作，开销很小
-            if system_instruction:
+    def _get_model(self, system_instruction=None):
+        """
+        按 system_instruction 缓存 GenerativeModel 对象，避免每次调用都重新实例化。
+        写作阶段的 system_instruction 只有少数几种，缓存上限足够覆盖。
+        """
+        if not system_instruction:
+            return self.model
+        models = self._instruction_models
+        with self._models_lock:
+            model = models.get(system_instruction)
+            if model is None:
                 import google.generativeai as genai
-                current_model = genai.GenerativeModel(
+                model = genai.GenerativeModel(
                     model_name=self.model_name,
                     safety_settings=self.safety_settings,
+                    generation_config=self.generation_params,
                     system_instruction=system_instruction
                 )
+                models[system_instruction] = model
+                if len(models) > self.model_cache_size:
+                    models.popitem(last=False)
             else:
-                current_model = self.model
-            
-            response = current_model.generate_content(prompt)
-            # 检查响应是否包含结果（有些情况下可能被安全过滤器完全拦截）
-            if not response.candidates:
-                error_msg = f"⚠️ [LLM 错误] 内容被安全拦截或生成失败。原因: {response.prompt_feedback}"
-                log_prompt = f"[System]: {system_instruction}\n[User]: {prompt}" if system_instruction else prompt
-                log_ai_interaction(log_prompt, error_msg, getattr(response, 'usage_metadata', None))
-                return error_msg
-            
-            text = response.text
-            log_prompt = f"[System]: {system_instruction}\n[User]: {prompt}" if system_instruction else prompt
-            log_ai_interaction(log_prompt, text, getattr(response, 'usage_metadata', None))
-            return text
-        except ValueError as e:
+                models.move_to_end(system_instruction)
+            return model
+
+    def _handle_response(self, response, prompt, system_instruction):
+        log_prompt = f"[System]: {system_instruction}\n[User]: {prompt}" if system_instruction else prompt
+        # 检查响应是否包含结果（有些情况下可能被安全过滤器完全拦截）
+        if not response.candidates:
+            error_msg = f"⚠️ [LLM 错误] 内容被安全拦截或生成失败。原因: {response.prompt_feedback}"
+            log_ai_interaction(log_prompt, error_msg, getattr(response, 'usage_metadata', None))
+            return error_msg
+
+        text = response.text
+        log_ai_interaction(log_prompt, text, getattr(response, 'usage_metadata', None))
+        self._report_usage(getattr(response, 'usage_metadata', None), log_prompt, text)
+        return text
+
+    def _handle_error(self, e):
+        if isinstance(e, ValueError):
             # 处理 "The `response.parts` quick accessor requires a single candidate" 类似的错误
             # 翻译为中文提示
             return f"⚠️ [LLM 错误] 发生异常，可能是内容被拦截。原始错误: {str(e)}"
+        error_msg = str(e)
+        if "404" in error_msg:
+            return f"⚠️ [LLM 错误] 找不到模型 '{self.model_name}' (404)。请检查 config.yaml 中的 model_name 是否正确，或代理是否支持该模型。"
+        return f"⚠️ [LLM 错误] {error_msg}"
+
+    def generate_content(self, prompt: str, system_instruction: str = None) -> str:
+        try:
+            response = self._get_model(system_instruction).generate_content(prompt)
+            return self._handle_response(response, prompt, system_instruction)
+        except Exception as e:
+            return self._handle_error(e)
+
+    def generate_json(self, prompt: str, system_instruction: str = None) -> str:
+        try:
+            response = self._get_model(system_instruction).generate_content(
+                prompt,
+                generation_config={"response_mime_type": "application/json"}
+            )
+            return self._handle_response(response, prompt, system_instruction)
+        except Exception as e:
+            return self._handle_error(e)
+
+    def generate_content_stream(self, prompt: str, system_instruction: str = None):
+        log_prompt = f"[System]: {system_instruction}\n[User]: {prompt}" if system_instruction else prompt
+        chunks = []
+        response = None
+        try:
+            response = self._get_model(system_instruction).generate_content(prompt, stream=True)
+            for chunk in response:
+                if not chunk.candidates:
+                    break
+                text = chunk.text
+                if text:
+                    chunks.append(text)
+                    yield text
         except Exception as e:
-            error_msg = str(e)
-            if "404" in error_msg:
-                return f"⚠️ [LLM 错误] 找不到模型 '{self.model_name}' (404)。请检查 config.yaml 中的 model_name 是否正确，或代理是否支持该模型。"
+            if chunks:
+                log_ai_interaction(log_prompt, "".join(chunks) + f"\n[流式输出中断] {e}", None)
+                raise
+            yield self._handle_error(e)
+            return
+
+        if not chunks:
+            # 没有任何输出，多半是被安全过滤器完全拦截
+            feedback = getattr(response, 'prompt_feedback', None)
+            error_msg = f"⚠️ [LLM 错误] 内容被安全拦截或生成失败。原因: {feedback}"
+            log_ai_interaction(log_prompt, error_msg, getattr(response, 'usage_metadata', None))
+            yield error_msg
+            return
+        log_ai_interaction(log_prompt, "".join(chunks), getattr(response, 'usage_metadata', None))
+        self._report_usage(getattr(response, 'usage_metadata', None), log_prompt, "".join(chunks))
+
     def embed_content(self, text: str) -> list[float]:
         try:
             import google.generativeai as genai
-            # 使用 text-embedding-004 作为默认模型，这是一个很好的通用模型
-            model = "models/text-embedding-004"
             result = genai.embed_content(
-                model=model,
+                model=self.embedding_model,
                 content=text,
-                task_type="retrieval_document", # 或者 retrieval_query，但在我们场景下 document 通用性更好
+                task_type=self.embedding_task_type,
                 title="Novel Context"
             )
             return result['embedding']
         except Exception as e:
             print(f"⚠️ [Embedding Error] Gemini 嵌入生成失败: {e}")
-            return []
+            return FailedEmbedding(e)
+
+    def embed_contents(self, texts: list[str]) -> list[list[float]]:
+        import google.generativeai as genai
+        vectors = []
+        for start in range(0, len(texts), self.embedding_batch_size):
+            chunk = texts[start:start + self.embedding_batch_size]
+            try:
+                # content 传入列表时走 batchEmbedContents，一次请求返回整批向量
+                result = genai.embed_content(
+                    model=self.embedding_model,
+                    content=chunk,
+                    task_type=self.embedding_task_type,
+                    title="Novel Context"
+                )
+                vectors.extend(result['embedding'])
+            except Exception as e:
+                print(f"⚠️ [Embedding Error] Gemini 批量嵌入失败 ({start}-{start + len(chunk)}): {e}")
+                vectors.extend(FailedEmbedding(e) for _ in chunk)
+        return vectors
+
+
+class AsyncGeminiDriver(GeminiDriver, AsyncBaseDriver):
+    """
+    Gemini 异步驱动。google-generativeai 的异步接口基于 gRPC aio，
+    同一进程内的请求复用库内部的单个 aio 通道（HTTP/2 多路复用），无需额外的连接池。
+    """
+
+    async def agenerate_content(self, prompt: str, system_instruction: str = None) -> str:
+        async with self._request_slot():
+            try:
+                response = await self._get_model(system_instruction).generate_content_async(prompt)
+                return self._handle_response(response, prompt, system_instruction)
+            except Exception as e:
+                return self._handle_error(e)
+
+    async def aembed_content(self, text: str) -> list[float]:
+        import google.generativeai as genai
+        async with self._request_slot():
+            try:
+                result = await genai.embed_content_async(
+                    model=self.embedding_model,
+                    content=text,
+                    task_type=self.embedding_task_type,
+                    title="Novel Context"
+                )
+                return result['embedding']
+            except Exception as e:
+                print(f"⚠️ [Embedding Error] Gemini 嵌入生成失败: {e}")
+                return FailedEmbedding(e)
+
+    async def aembed_contents(self, texts: list[str]) -> list[list[float]]:
+        import google.generativeai as genai
+        vectors = []
+        for start in range(0, len(texts), self.embedding_batch_size):
+            chunk = texts[start:start + self.embedding_batch_size]
+            async with self._request_slot():
+                try:
+                    result = await genai.embed_content_async(
+                        model=self.embedding_model,
+                        content=chunk,
+                        task_type=self.embedding_task_type,
+                        title="Novel Context"
+                    )
+                    vectors.extend(result['embedding'])
+                except Exception as e:
+                    print(f"⚠️ [Embedding Error] Gemini 批量嵌入失败 ({start}-{start + len(chunk)}): {e}")
+                    vectors.extend(FailedEmbedding(e) for _ in chunk)
+        return vectors
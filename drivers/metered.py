@@ -0,0 +1,102 @@
+import time
+
+from .base import BaseDriver
+from core import metrics
+
+class MeteredDriver(BaseDriver):
+    """
+    紧贴真实驱动的指标层：记录每次接口调用（包括被限流后重试的每一次）的耗时与成败，
+    标签为当前上下文的 stage / novel 加上模型名与调用类型 (generate / embed)。
+    token 用量由驱动在拿到 usage 时通过 BaseDriver._report_usage 上报。
+    """
+
+    def __init__(self, driver):
+        self.driver = driver
+
+    def __getattr__(self, name):
+        return getattr(self.driver, name)
+
+    def _record(self, kind, started, ok):
+        labels = {"model": getattr(self.driver, "model_name", None), "kind": kind}
+        metrics.observe("pynovel_llm_request_seconds", time.perf_counter() - started, **labels)
+        metrics.inc("pynovel_llm_requests_total", outcome="ok" if ok else "error", **labels)
+
+    @staticmethod
+    def _text_ok(text):
+        return isinstance(text, str) and bool(text) and not text.startswith("⚠️")
+
+    def generate_content(self, prompt: str, system_instruction: str = None) -> str:
+        started = time.perf_counter()
+        text = None
+        try:
+            text = self.driver.generate_content(prompt, system_instruction)
+            return text
+        finally:
+            self._record("generate", started, self._text_ok(text))
+
+    def generate_json(self, prompt: str, system_instruction: str = None) -> str:
+        started = time.perf_counter()
+        text = None
+        try:
+            text = self.driver.generate_json(prompt, system_instruction)
+            return text
+        finally:
+            self._record("generate", started, self._text_ok(text))
+
+    def generate_content_stream(self, prompt: str, system_instruction: str = None):
+        started = time.perf_counter()
+        ok = False
+        try:
+            for i, chunk in enumerate(self.driver.generate_content_stream(prompt, system_instruction)):
+                ok = i > 0 or self._text_ok(chunk)
+                yield chunk
+        except Exception:
+            ok = False
+            raise
+        finally:
+            self._record("generate", started, ok)
+
+    def embed_content(self, text: str) -> list[float]:
+        started = time.perf_counter()
+        vector = None
+        try:
+            vector = self.driver.embed_content(text)
+            return vector
+        finally:
+            self._record("embed", started, bool(vector))
+
+    def embed_contents(self, texts: list[str]) -> list[list[float]]:
+        started = time.perf_counter()
+        vectors = None
+        try:
+            vectors = self.driver.embed_contents(texts)
+            return vectors
+        finally:
+            self._record("embed", started, bool(vectors) and all(vectors))
+
+    async def agenerate_content(self, prompt: str, system_instruction: str = None) -> str:
+        started = time.perf_counter()
+        text = None
+        try:
+            text = await self.driver.agenerate_content(prompt, system_instruction)
+            return text
+        finally:
+            self._record("generate", started, self._text_ok(text))
+
+    async def aembed_content(self, text: str) -> list[float]:
+        started = time.perf_counter()
+        vector = None
+        try:
+            vector = await self.driver.aembed_content(text)
+            return vector
+        finally:
+            self._record("embed", started, bool(vector))
+
+    async def aembed_contents(self, texts: list[str]) -> list[list[float]]:
+        started = time.perf_counter()
+        vectors = None
+        try:
+            vectors = await self.driver.aembed_contents(texts)
+            return vectors
+        finally:
+            self._record("embed", started, bool(vectors) and all(vectors))
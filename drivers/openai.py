@@ -1,10 +1,22 @@
-from .base import BaseDriver
+from .base import BaseDriver, FailedEmbedding
+from .async_base import AsyncBaseDriver, shared_http_client
 import sys
+import asyncio
+import weakref
 from core.ai_logger import log_ai_interaction
 
 class OpenAIDriver(BaseDriver):
-    def __init__(self, api_key, model_name, base_url=None):
+    provider_name = "openai"
+    # 默认使用 text-embedding-3-small
+    embedding_model = "text-embedding-3-small"
+    embedding_task_type = ""
+
+    def __init__(self, api_key, model_name, base_url=None, generation_params=None):
+        """
+        :param generation_params: 透传给 chat.completions.create 的生成参数，如 temperature、top_p、max_tokens。
+        """
         self.model_name = model_name
+        self.generation_params = dict(generation_params) if generation_params else None
         try:
             import openai
             self.client = openai.OpenAI(api_key=api_key, base_url=base_url)
@@ -12,33 +24,168 @@ class OpenAIDriver(BaseDriver):
             print("错误: 缺少 openai 库。请运行 'pip install openai' 进行安装。")
             sys.exit(1)
 
+    def _build_messages(self, prompt, system_instruction):
+        messages = []
+        if system_instruction:
+            messages.append({"role": "system", "content": system_instruction})
+        messages.append({"role": "user", "content": prompt})
+        return messages
+
+    def _handle_response(self, response, prompt, system_instruction):
+        content = response.choices[0].message.content
+        # Log with system instruction if present
+        log_prompt = f"[System]: {system_instruction}\n[User]: {prompt}" if system_instruction else prompt
+        log_ai_interaction(log_prompt, content, response.usage)
+        self._report_usage(response.usage, log_prompt, content)
+        return content
+
+    def _handle_error(self, e, prompt):
+        error_msg = f"⚠️ [OpenAI 错误] {str(e)}"
+        log_ai_interaction(prompt, error_msg, None)
+        return error_msg
+
     def generate_content(self, prompt: str, system_instruction: str = None) -> str:
         try:
-            messages = []
-            if system_instruction:
-                messages.append({"role": "system", "content": system_instruction})
-            messages.append({"role": "user", "content": prompt})
+            response = self.client.chat.completions.create(
+                model=self.model_name,
+                messages=self._build_messages(prompt, system_instruction),
+                **(self.generation_params or {})
+            )
+            return self._handle_response(response, prompt, system_instruction)
+        except Exception as e:
+            return self._handle_error(e, prompt)
 
+    def generate_json(self, prompt: str, system_instruction: str = None) -> str:
+        try:
             response = self.client.chat.completions.create(
                 model=self.model_name,
-                messages=messages
+                messages=self._build_messages(prompt, system_instruction),
+                **(self.generation_params or {}),
+                response_format={"type": "json_object"}
             )
-            content = response.choices[0].message.content
-            # Log with system instruction if present
-            log_prompt = f"[System]: {system_instruction}\n[User]: {prompt}" if system_instruction else prompt
-            log_ai_interaction(log_prompt, content, response.usage)
-            return content
+            return self._handle_response(response, prompt, system_instruction)
         except Exception as e:
-            error_msg = f"⚠️ [OpenAI 错误] {str(e)}"
-            log_ai_interaction(prompt, error_msg, None)
+            # 部分兼容接口不支持 response_format，退回普通生成，由提示词约束格式
+            if "response_format" in str(e):
+                return self.generate_content(prompt, system_instruction)
+            return self._handle_error(e, prompt)
+
+    def generate_content_stream(self, prompt: str, system_instruction: str = None):
+        log_prompt = f"[System]: {system_instruction}\n[User]: {prompt}" if system_instruction else prompt
+        chunks = []
+        usage = None
+        try:
+            stream = self.client.chat.completions.create(
+                model=self.model_name,
+                messages=self._build_messages(prompt, system_instruction),
+                **(self.generation_params or {}),
+                stream=True
+            )
+            for chunk in stream:
+                if getattr(chunk, "usage", None):
+                    usage = chunk.usage
+                if not chunk.choices:
+                    continue
+                text = chunk.choices[0].delta.content
+                if text:
+                    chunks.append(text)
+                    yield text
+        except Exception as e:
+            if chunks:
+                log_ai_interaction(log_prompt, "".join(chunks) + f"\n[流式输出中断] {e}", None)
+                raise
+            yield self._handle_error(e, prompt)
+            return
+        log_ai_interaction(log_prompt, "".join(chunks), usage)
+        self._report_usage(usage, log_prompt, "".join(chunks))
+
     def embed_content(self, text: str) -> list[float]:
         try:
-            # 默认使用 text-embedding-3-small
             response = self.client.embeddings.create(
                 input=text,
-                model="text-embedding-3-small"
+                model=self.embedding_model
             )
             return response.data[0].embedding
         except Exception as e:
             print(f"⚠️ [Embedding Error] OpenAI 嵌入生成失败: {e}")
-            return []
+            return FailedEmbedding(e)
+
+    def embed_contents(self, texts: list[str]) -> list[list[float]]:
+        vectors = []
+        for start in range(0, len(texts), self.embedding_batch_size):
+            chunk = texts[start:start + self.embedding_batch_size]
+            try:
+                response = self.client.embeddings.create(
+                    input=chunk,
+                    model=self.embedding_model
+                )
+                # 按 index 排序，保证与输入顺序一致
+                vectors.extend(item.embedding for item in sorted(response.data, key=lambda d: d.index))
+            except Exception as e:
+                print(f"⚠️ [Embedding Error] OpenAI 批量嵌入失败 ({start}-{start + len(chunk)}): {e}")
+                vectors.extend(FailedEmbedding(e) for _ in chunk)
+        return vectors
+
+
+class AsyncOpenAIDriver(OpenAIDriver, AsyncBaseDriver):
+    """
+    OpenAI 异步驱动。所有 AsyncOpenAIDriver 实例在同一事件循环上共用一个
+    httpx 连接池 (shared_http_client)，AsyncOpenAI 客户端本身按事件循环缓存；
+    aclose() 关闭的是整个事件循环上的共享连接池。
+    """
+
+    def __init__(self, api_key, model_name, base_url=None, generation_params=None):
+        super().__init__(api_key, model_name, base_url, generation_params)
+        self._client_options = {"api_key": api_key, "base_url": base_url}
+        self._async_clients = weakref.WeakKeyDictionary()
+
+    def _async_client(self):
+        import openai
+        loop = asyncio.get_running_loop()
+        http_client = shared_http_client(openai.DefaultAsyncHttpxClient)
+        cached = self._async_clients.get(loop)
+        # 共享连接池被 aclose 关闭并重建后，AsyncOpenAI 客户端也随之重建
+        if cached is None or cached[0] is not http_client:
+            cached = (http_client, openai.AsyncOpenAI(http_client=http_client, **self._client_options))
+            self._async_clients[loop] = cached
+        return cached[1]
+
+    async def agenerate_content(self, prompt: str, system_instruction: str = None) -> str:
+        async with self._request_slot():
+            try:
+                response = await self._async_client().chat.completions.create(
+                    model=self.model_name,
+                    messages=self._build_messages(prompt, system_instruction),
+                    **(self.generation_params or {})
+                )
+                return self._handle_response(response, prompt, system_instruction)
+            except Exception as e:
+                return self._handle_error(e, prompt)
+
+    async def aembed_content(self, text: str) -> list[float]:
+        async with self._request_slot():
+            try:
+                response = await self._async_client().embeddings.create(
+                    input=text,
+                    model=self.embedding_model
+                )
+                return response.data[0].embedding
+            except Exception as e:
+                print(f"⚠️ [Embedding Error] OpenAI 嵌入生成失败: {e}")
+                return FailedEmbedding(e)
+
+    async def aembed_contents(self, texts: list[str]) -> list[list[float]]:
+        vectors = []
+        for start in range(0, len(texts), self.embedding_batch_size):
+            chunk = texts[start:start + self.embedding_batch_size]
+            async with self._request_slot():
+                try:
+                    response = await self._async_client().embeddings.create(
+                        input=chunk,
+                        model=self.embedding_model
+                    )
+                    vectors.extend(item.embedding for item in sorted(response.data, key=lambda d: d.index))
+                except Exception as e:
+                    print(f"⚠️ [Embedding Error] OpenAI 批量嵌入失败 ({start}-{start + len(chunk)}): {e}")
+                    vectors.extend(FailedEmbedding(e) for _ in chunk)
+        return vectors
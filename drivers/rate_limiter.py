@@ -0,0 +1,256 @@
+import asyncio
+import random
+import threading
+import time
+
+from .base import BaseDriver, FailedEmbedding
+from core import metrics
+
+# 返回的错误信息或异常中出现这些关键词时视为限流/配额错误
+RATE_LIMIT_MARKERS = ("429", "rate limit", "ratelimit", "quota", "resource_exhausted", "resource has been exhausted", "too many requests")
+
+def is_rate_limit_error(message):
+    message = str(message).lower()
+    return any(marker in message for marker in RATE_LIMIT_MARKERS)
+
+def is_rate_limited_embedding(vector):
+    """驱动吞掉了异常、以 FailedEmbedding 返回的限流/配额错误。"""
+    return isinstance(vector, FailedEmbedding) and is_rate_limit_error(vector.error)
+
+def estimate_tokens(text):
+    """粗略估算 token 数：中文约 1 字 1 token，英文约 4 字符 1 token，这里按字符数保守估计。"""
+    return len(text or "")
+
+
+class TokenBucket:
+    """按分钟配额匀速补充的令牌桶。rate_per_minute 为空或 0 时不限制。"""
+
+    def __init__(self, rate_per_minute):
+        self.capacity = float(rate_per_minute or 0)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.capacity / 60.0)
+        self.updated = now
+
+    def wait_time(self, amount, now):
+        """取出 amount 个令牌还需等待的秒数（不实际扣减）。"""
+        if not self.capacity:
+            return 0.0
+        self._refill(now)
+        # 单次请求超过桶容量时按满桶处理，否则永远等不到
+        amount = min(amount, self.capacity)
+        if self.tokens >= amount:
+            return 0.0
+        return (amount - self.tokens) * 60.0 / self.capacity
+
+    def take(self, amount):
+        if self.capacity:
+            self.tokens -= min(amount, self.capacity)
+
+    def give_back(self, amount):
+        if self.capacity:
+            self.tokens = min(self.capacity, self.tokens + amount)
+
+
+class RateLimiter:
+    """
+    进程内全局共享的自适应限流器。
+
+    - 两个令牌桶分别限制每分钟请求数 (RPM) 与每分钟 token 数 (TPM)；
+    - 同时在途的请求数按 AIMD 调整：出现 429/配额错误时减半，
+      连续成功的次数达到当前并发上限时加一，最多恢复到 max_concurrency。
+    """
+
+    def __init__(self, requests_per_minute=None, tokens_per_minute=None, max_concurrency=8, min_concurrency=1):
+        self.request_bucket = TokenBucket(requests_per_minute)
+        self.token_bucket = TokenBucket(tokens_per_minute)
+        self.max_concurrency = max_concurrency
+        self.min_concurrency = min_concurrency
+        self.concurrency = max_concurrency
+        self.in_flight = 0
+        self._successes = 0
+        self._cond = threading.Condition()
+
+    def acquire(self, tokens=0):
+        """阻塞直到获得一个并发名额且两个令牌桶都足够。"""
+        with self._cond:
+            while True:
+                if self.in_flight < self.concurrency:
+                    now = time.monotonic()
+                    wait = max(self.request_bucket.wait_time(1, now), self.token_bucket.wait_time(tokens, now))
+                    if wait <= 0:
+                        self.request_bucket.take(1)
+                        self.token_bucket.take(tokens)
+                        self.in_flight += 1
+                        return
+                    self._cond.wait(timeout=wait)
+                else:
+                    self._cond.wait()
+
+    def release(self, rate_limited=False, token_adjustment=0):
+        """
+        :param rate_limited: 本次请求是否遇到限流，决定并发上限的增减。
+        :param token_adjustment: 实际消耗与预估之差（正数为多用，负数退回）。
+        """
+        with self._cond:
+            self.in_flight -= 1
+            if token_adjustment > 0:
+                self.token_bucket.take(token_adjustment)
+            elif token_adjustment < 0:
+                self.token_bucket.give_back(-token_adjustment)
+
+            if rate_limited:
+                # 乘性减
+                self._successes = 0
+                new_limit = max(self.min_concurrency, self.concurrency // 2)
+                if new_limit < self.concurrency:
+                    print(f"⚠️ 触发限流，全局并发上限 {self.concurrency} -> {new_limit}")
+                self.concurrency = new_limit
+            else:
+                # 加性增：每成功一个“窗口”（等于当前并发上限的请求数）加一
+                self._successes += 1
+                if self._successes >= self.concurrency and self.concurrency < self.max_concurrency:
+                    self.concurrency += 1
+                    self._successes = 0
+            self._cond.notify_all()
+
+
+class RateLimitedDriver(BaseDriver):
+    """
+    通过共享 RateLimiter 调用内部驱动。遇到限流错误时按指数退避重试，
+    不把 429 当作普通错误交给上层（上层会误以为是安全拦截而改写大纲）。
+    """
+
+    def __init__(self, driver, limiter, max_retries=5, base_delay=2.0):
+        self.driver = driver
+        self.limiter = limiter
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+
+    def __getattr__(self, name):
+        return getattr(self.driver, name)
+
+    def _backoff(self, attempt):
+        """记录一次限流重试，并返回重试前应等待的秒数（带抖动的指数退避）。"""
+        metrics.inc("pynovel_llm_retries_total", reason="rate_limit", model=getattr(self.driver, "model_name", None))
+        return self.base_delay * (2 ** attempt) * (0.5 + random.random())
+
+    def _call(self, fn, prompt_tokens, output_tokens_of, is_failure):
+        for attempt in range(self.max_retries + 1):
+            self.limiter.acquire(prompt_tokens)
+            rate_limited = False
+            result = None
+            try:
+                result = fn()
+                rate_limited = is_failure(result)
+            except Exception as e:
+                rate_limited = is_rate_limit_error(e)
+                if not rate_limited or attempt == self.max_retries:
+                    raise
+            finally:
+                self.limiter.release(
+                    rate_limited=rate_limited,
+                    token_adjustment=0 if rate_limited else output_tokens_of(result)
+                )
+            if not rate_limited or attempt == self.max_retries:
+                return result
+            time.sleep(self._backoff(attempt))
+        return result
+
+    def generate_content(self, prompt: str, system_instruction: str = None) -> str:
+        return self._call(
+            lambda: self.driver.generate_content(prompt, system_instruction),
+            estimate_tokens(prompt) + estimate_tokens(system_instruction),
+            lambda text: estimate_tokens(text) if isinstance(text, str) else 0,
+            lambda text: isinstance(text, str) and text.startswith("⚠️") and is_rate_limit_error(text)
+        )
+
+    def generate_json(self, prompt: str, system_instruction: str = None) -> str:
+        return self._call(
+            lambda: self.driver.generate_json(prompt, system_instruction),
+            estimate_tokens(prompt) + estimate_tokens(system_instruction),
+            lambda text: estimate_tokens(text) if isinstance(text, str) else 0,
+            lambda text: isinstance(text, str) and text.startswith("⚠️") and is_rate_limit_error(text)
+        )
+
+    def generate_content_stream(self, prompt: str, system_instruction: str = None):
+        tokens = estimate_tokens(prompt) + estimate_tokens(system_instruction)
+        for attempt in range(self.max_retries + 1):
+            self.limiter.acquire(tokens)
+            emitted = 0
+            rate_limited = False
+            try:
+                for chunk in self.driver.generate_content_stream(prompt, system_instruction):
+                    # 只有在尚未输出任何内容时遇到的限流错误才能安全重试
+                    if not emitted and chunk.startswith("⚠️") and is_rate_limit_error(chunk):
+                        rate_limited = True
+                        if attempt < self.max_retries:
+                            break
+                    emitted += estimate_tokens(chunk)
+                    yield chunk
+            except Exception as e:
+                rate_limited = is_rate_limit_error(e)
+                raise
+            finally:
+                self.limiter.release(rate_limited=rate_limited, token_adjustment=0 if rate_limited else emitted)
+            if not rate_limited or attempt == self.max_retries:
+                return
+            time.sleep(self._backoff(attempt))
+
+    def embed_content(self, text: str) -> list[float]:
+        # 嵌入失败时驱动打印错误并返回 FailedEmbedding（空列表），据其中的错误信息判断限流
+        return self._call(
+            lambda: self.driver.embed_content(text),
+            estimate_tokens(text),
+            lambda _: 0,
+            is_rate_limited_embedding
+        )
+
+    def embed_contents(self, texts: list[str]) -> list[list[float]]:
+        # 任一批次被限流时整批重试（已成功的批次也会重新请求，限流本就少见）
+        return self._call(
+            lambda: self.driver.embed_contents(texts),
+            sum(estimate_tokens(t) for t in texts),
+            lambda _: 0,
+            lambda vectors: any(is_rate_limited_embedding(v) for v in vectors or [])
+        )
+
+    async def agenerate_content(self, prompt: str, system_instruction: str = None) -> str:
+        tokens = estimate_tokens(prompt) + estimate_tokens(system_instruction)
+        for attempt in range(self.max_retries + 1):
+            # 限流器基于线程条件变量，放到线程池中等待，避免阻塞事件循环
+            await asyncio.to_thread(self.limiter.acquire, tokens)
+            text = None
+            rate_limited = False
+            try:
+                text = await self.driver.agenerate_content(prompt, system_instruction)
+                rate_limited = isinstance(text, str) and text.startswith("⚠️") and is_rate_limit_error(text)
+            finally:
+                self.limiter.release(
+                    rate_limited=rate_limited,
+                    token_adjustment=0 if rate_limited or text is None else estimate_tokens(text)
+                )
+            if not rate_limited or attempt == self.max_retries:
+                return text
+            await asyncio.sleep(self._backoff(attempt))
+        return text
+
+    async def aembed_content(self, text: str) -> list[float]:
+        await asyncio.to_thread(self.limiter.acquire, estimate_tokens(text))
+        vector = None
+        try:
+            vector = await self.driver.aembed_content(text)
+            return vector
+        finally:
+            self.limiter.release(rate_limited=is_rate_limited_embedding(vector))
+
+    async def aembed_contents(self, texts: list[str]) -> list[list[float]]:
+        await asyncio.to_thread(self.limiter.acquire, sum(estimate_tokens(t) for t in texts))
+        vectors = None
+        try:
+            vectors = await self.driver.aembed_contents(texts)
+            return vectors
+        finally:
+            self.limiter.release(rate_limited=any(is_rate_limited_embedding(v) for v in vectors or []))
@@ -0,0 +1,223 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+from .base import BaseDriver, innermost_driver
+
+# 录制/回放模式
+MODE_RECORD = "record"           # 总是调用真实接口，并记录（覆盖）响应
+MODE_REPLAY = "replay"           # 只从记录中读取，未命中直接报错，不访问网络
+MODE_READTHROUGH = "readthrough" # 优先读取记录，未命中时调用接口并记录
+RESPONSE_CACHE_MODES = (MODE_RECORD, MODE_REPLAY, MODE_READTHROUGH)
+
+def default_response_cache_path():
+    root_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+    return os.path.join(root_dir, ".cache", "responses.sqlite3")
+
+class ResponseCacheMiss(LookupError):
+    """回放模式下请求不在记录中。"""
+
+
+class ResponseCache:
+    """
+    基于 SQLite 的 LLM 响应记录库。
+
+    键为 sha256(请求类型, provider, 模型, system_instruction, prompt, 生成参数)，
+    值为响应文本（嵌入请求为向量的 JSON）。记录只增不删，便于整轮流程离线回放。
+    """
+
+    def __init__(self, path=None):
+        self.path = path or default_response_cache_path()
+        self._lock = threading.Lock()
+        cache_dir = os.path.dirname(self.path)
+        if cache_dir and not os.path.exists(cache_dir):
+            os.makedirs(cache_dir)
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            " key TEXT PRIMARY KEY, kind TEXT NOT NULL, response TEXT NOT NULL, created REAL NOT NULL)"
+        )
+        self._conn.commit()
+
+    @staticmethod
+    def make_key(kind, provider, model, system_instruction, prompt, params=None):
+        payload = json.dumps(
+            [kind, provider, model, system_instruction or "", prompt, params or {}],
+            ensure_ascii=False, sort_keys=True
+        )
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def get(self, key):
+        with self._lock:
+            row = self._conn.execute("SELECT response FROM responses WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def put(self, key, kind, response):
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses (key, kind, response, created) VALUES (?, ?, ?, ?)",
+                (key, kind, response, time.time())
+            )
+            self._conn.commit()
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+class RecordReplayDriver(BaseDriver):
+    """
+    在任意驱动外包一层响应录制/回放，生成与嵌入请求都会被记录。
+
+    以 ⚠️ 开头的错误响应和空向量不记录，避免把临时故障固化下来；
+    流式请求记录拼接后的完整文本，回放时一次性作为单个分块返回。
+    """
+
+    def __init__(self, driver, cache, mode=MODE_READTHROUGH):
+        if mode not in RESPONSE_CACHE_MODES:
+            raise ValueError(f"不支持的响应缓存模式: {mode}")
+        self.driver = driver
+        self.cache = cache
+        self.mode = mode
+
+    def __getattr__(self, name):
+        return getattr(self.driver, name)
+
+    def _generate_key(self, prompt, system_instruction, kind="generate"):
+        return ResponseCache.make_key(
+            kind,
+            getattr(self.driver, "provider_name", type(self.driver).__name__),
+            getattr(self.driver, "model_name", ""),
+            system_instruction,
+            prompt,
+            # 包装层继承了 BaseDriver.generation_params 的默认值 None，必须读取最内层真实驱动的设置
+            getattr(innermost_driver(self.driver), "generation_params", None)
+        )
+
+    def _embed_key(self, text):
+        return ResponseCache.make_key(
+            "embed",
+            getattr(self.driver, "provider_name", type(self.driver).__name__),
+            getattr(self.driver, "embedding_model", ""),
+            getattr(self.driver, "embedding_task_type", ""),
+            text
+        )
+
+    def _lookup(self, key, kind):
+        if self.mode == MODE_RECORD:
+            return None
+        response = self.cache.get(key)
+        if response is None and self.mode == MODE_REPLAY:
+            raise ResponseCacheMiss(f"回放缓存未命中 ({kind}, key={key[:12]})")
+        return response
+
+    def _store(self, key, kind, response):
+        try:
+            self.cache.put(key, kind, response)
+        except Exception as e:
+            print(f"⚠️ 写入响应缓存失败: {e}")
+
+    def generate_content(self, prompt: str, system_instruction: str = None) -> str:
+        key = self._generate_key(prompt, system_instruction)
+        cached = self._lookup(key, "generate")
+        if cached is not None:
+            return cached
+
+        text = self.driver.generate_content(prompt, system_instruction)
+        if isinstance(text, str) and text and not text.startswith("⚠️"):
+            self._store(key, "generate", text)
+        return text
+
+    def generate_json(self, prompt: str, system_instruction: str = None) -> str:
+        # JSON 模式的输出与普通生成不同，单独成键
+        key = self._generate_key(prompt, system_instruction, "generate_json")
+        cached = self._lookup(key, "generate_json")
+        if cached is not None:
+            return cached
+
+        text = self.driver.generate_json(prompt, system_instruction)
+        if isinstance(text, str) and text and not text.startswith("⚠️"):
+            self._store(key, "generate_json", text)
+        return text
+
+    def generate_content_stream(self, prompt: str, system_instruction: str = None):
+        key = self._generate_key(prompt, system_instruction)
+        cached = self._lookup(key, "generate")
+        if cached is not None:
+            yield cached
+            return
+
+        chunks = []
+        for chunk in self.driver.generate_content_stream(prompt, system_instruction):
+            chunks.append(chunk)
+            yield chunk
+        # 中途断开时异常已经抛出，走到这里说明流完整结束
+        text = "".join(chunks)
+        if text and not text.startswith("⚠️"):
+            self._store(key, "generate", text)
+
+    def embed_content(self, text: str) -> list[float]:
+        key = self._embed_key(text)
+        cached = self._lookup(key, "embed")
+        if cached is not None:
+            return json.loads(cached)
+
+        vector = self.driver.embed_content(text)
+        if vector:
+            self._store(key, "embed", json.dumps(vector))
+        return vector
+
+    def embed_contents(self, texts: list[str]) -> list[list[float]]:
+        keys = [self._embed_key(text) for text in texts]
+        cached = [self._lookup(key, "embed") for key in keys]
+        vectors = [json.loads(c) if c is not None else None for c in cached]
+        missing = [i for i, vec in enumerate(vectors) if vec is None]
+        if missing:
+            fresh = self.driver.embed_contents([texts[i] for i in missing])
+            for i, vec in zip(missing, fresh):
+                vectors[i] = vec
+                if vec:
+                    self._store(keys[i], "embed", json.dumps(vec))
+        return vectors
+
+    async def agenerate_content(self, prompt: str, system_instruction: str = None) -> str:
+        key = self._generate_key(prompt, system_instruction)
+        cached = self._lookup(key, "generate")
+        if cached is not None:
+            return cached
+
+        text = await self.driver.agenerate_content(prompt, system_instruction)
+        if isinstance(text, str) and text and not text.startswith("⚠️"):
+            self._store(key, "generate", text)
+        return text
+
+    async def aembed_content(self, text: str) -> list[float]:
+        key = self._embed_key(text)
+        cached = self._lookup(key, "embed")
+        if cached is not None:
+            return json.loads(cached)
+
+        vector = await self.driver.aembed_content(text)
+        if vector:
+            self._store(key, "embed", json.dumps(vector))
+        return vector
+
+    async def aembed_contents(self, texts: list[str]) -> list[list[float]]:
+        keys = [self._embed_key(text) for text in texts]
+        cached = [self._lookup(key, "embed") for key in keys]
+        vectors = [json.loads(c) if c is not None else None for c in cached]
+        missing = [i for i, vec in enumerate(vectors) if vec is None]
+        if missing:
+            fresh = await self.driver.aembed_contents([texts[i] for i in missing])
+            for i, vec in zip(missing, fresh):
+                vectors[i] = vec
+                if vec:
+                    self._store(keys[i], "embed", json.dumps(vec))
+        return vectors
@@ -25,7 +25,8 @@ def main():
 
     # 3. 初始化 LLM 驱动
     try:
-        llm = get_driver(provider, api_key, model_name, base_url)
+        llm = get_driver(provider, api_key, model_name, base_url,
+                         driver_options={"generation_params": llm_config["generation_params"]})
     except Exception as e:
         print(f"初始化驱动失败: {e}")
         sys.exit(1)
@@ -50,7 +51,7 @@ def main():
         confirm = input("\n大纲已生成，是否根据此大纲开始创作正文？(y/n): ")
     
     if confirm.lower() == 'y':
-        write_chapters_from_outline(llm, title, outline, meta, words_per_section)
+        write_chapters_from_outline(llm, title, outline, meta, words_per_section, novel_config)
     else:
         print("程序已停止，你可以修改大纲文件后再运行。")
 
@@ -0,0 +1,84 @@
+import gzip
+import json
+import os
+import sys
+import tempfile
+import threading
+
+# Ensure we can import from core
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from core.ai_logger import AILogWriter, usage_to_dict
+
+def _read_records(log_dir):
+    records = []
+    for name in sorted(os.listdir(log_dir)):
+        path = os.path.join(log_dir, name)
+        opener = gzip.open if name.endswith(".gz") else open
+        with opener(path, "rt", encoding="utf-8") as f:
+            records.extend(json.loads(line) for line in f)
+    return records
+
+def test_concurrent_submit_and_flush():
+    with tempfile.TemporaryDirectory() as tmp:
+        writer = AILogWriter(log_dir=tmp)
+
+        def worker(n):
+            for i in range(50):
+                writer.submit({"prompt": f"{n}-{i}", "response": "好"})
+
+        threads = [threading.Thread(target=worker, args=(n,)) for n in range(4)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        assert writer.flush(timeout=5)
+        records = _read_records(tmp)
+        assert len(records) == 200, "并发提交的记录应全部落盘"
+        assert {r["prompt"] for r in records} == {f"{n}-{i}" for n in range(4) for i in range(50)}
+        writer.close()
+
+def test_dropped_records_are_counted_exactly():
+    with tempfile.TemporaryDirectory() as tmp:
+        writer = AILogWriter(log_dir=tmp, queue_size=2)
+
+        def worker(n):
+            for i in range(200):
+                writer.submit({"prompt": f"{n}-{i}", "response": "好"})
+
+        threads = [threading.Thread(target=worker, args=(n,)) for n in range(4)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        writer.close()
+        records = _read_records(tmp)
+        written = sum(1 for r in records if "prompt" in r)
+        dropped = sum(r["count"] for r in records if r.get("event") == "dropped")
+        assert written + dropped == 800, "写入数与丢弃计数之和应等于提交总数"
+
+def test_rotation_compresses_old_files():
+    with tempfile.TemporaryDirectory() as tmp:
+        writer = AILogWriter(log_dir=tmp, max_bytes=200)
+        for i in range(20):
+            writer.submit({"prompt": "长提示词" * 10, "response": str(i)})
+            writer.flush(timeout=5)
+        writer.close()
+
+        names = os.listdir(tmp)
+        assert any(name.endswith(".jsonl.gz") for name in names), "超过大小上限的文件应被轮转并压缩"
+        assert sorted(int(r["response"]) for r in _read_records(tmp)) == list(range(20)), "轮转不应丢失记录"
+
+def test_close_flushes_pending_records():
+    with tempfile.TemporaryDirectory() as tmp:
+        writer = AILogWriter(log_dir=tmp)
+        for i in range(10):
+            writer.submit({"prompt": "p", "response": str(i)})
+        writer.close()
+        assert len(_read_records(tmp)) == 10
+
+def test_usage_normalization():
+    class GeminiUsage:
+        prompt_token_count, candidates_token_count, total_token_count = 3, 4, 7
+    assert usage_to_dict(GeminiUsage()) == {"prompt_tokens": 3, "completion_tokens": 4, "total_tokens": 7}
+    assert usage_to_dict(None) is None
@@ -0,0 +1,135 @@
+import os
+import sys
+import tempfile
+
+# Ensure we can import from core
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import numpy as np
+
+from core.ann_index import IVFIndex, VectorIndex, create_index
+from core.rag_engine import RAGEngine
+
+def _fill(rag, n, dim, seed=0, sections_per_chapter=None):
+    rng = np.random.default_rng(seed)
+    # 构造有聚类结构的数据，接近真实语义向量的分布
+    centers = rng.normal(size=(20, dim))
+    for i in range(n):
+        vec = centers[i % 20] + 0.3 * rng.normal(size=dim)
+        metadata = None
+        if sections_per_chapter:
+            metadata = {"chapter": i // sections_per_chapter + 1, "section": i % sections_per_chapter + 1}
+        rag.add_document(text=f"记忆{i}", vector=vec.tolist(), metadata=metadata)
+
+def test_ivf_recall_and_exact_fallback():
+    with tempfile.TemporaryDirectory() as novel_dir:
+        rag = RAGEngine(novel_dir, index_backend="ivf",
+                        index_params={"nprobe": 4, "min_train": 200}, ann_min_size=200)
+        _fill(rag, 600, 32)
+        assert rag.index is not None and rag.index.count == 600
+
+        rng = np.random.default_rng(1)
+        hits = 0
+        for _ in range(20):
+            query = rng.normal(size=32).tolist()
+            approx = {d["text"] for d in rag.search(query, top_k=5)}
+            exact = {d["text"] for d in rag.search(query, top_k=5, exact=True)}
+            hits += len(approx & exact)
+        recall = hits / 100
+        assert recall >= 0.8, f"IVF 召回率过低: {recall}"
+
+        # 探查全部簇时应与精确检索完全一致
+        rag.index.nprobe = len(rag.index.centroids)
+        query = rng.normal(size=32).tolist()
+        assert rag.search(query, top_k=5) == rag.search(query, top_k=5, exact=True)
+
+def test_before_filter_still_uses_index():
+    with tempfile.TemporaryDirectory() as novel_dir:
+        rag = RAGEngine(novel_dir, index_backend="ivf",
+                        index_params={"nprobe": 4, "min_train": 200}, ann_min_size=200)
+        _fill(rag, 600, 32, sections_per_chapter=10)
+        calls = []
+        original_search = rag.index.search
+        def counting_search(matrix, query, top_k):
+            calls.append(top_k)
+            return original_search(matrix, query, top_k)
+        rag.index.search = counting_search
+
+        rag.index.nprobe = len(rag.index.centroids)
+        query = np.random.default_rng(2).normal(size=32).tolist()
+        filtered = rag.search(query, top_k=5, filters={"before": (50, 1)})
+        assert calls, "带 before 过滤的检索仍应走 ANN 索引"
+        assert filtered == rag.search(query, top_k=5, exact=True, filters={"before": (50, 1)})
+        assert all(d["metadata"]["chapter"] < 50 for d in filtered)
+
+        # 过滤条件覆盖全部记忆时直接跳过过滤，不多取近邻
+        calls.clear()
+        assert rag.search(query, top_k=5, filters={"before": (61, 1)}) == rag.search(query, top_k=5)
+        assert calls == [5, 5]
+
+def test_flat_search_skips_summaries_through_index():
+    with tempfile.TemporaryDirectory() as novel_dir:
+        rag = RAGEngine(novel_dir, index_backend="ivf",
+                        index_params={"nprobe": 4, "min_train": 200}, ann_min_size=200)
+        _fill(rag, 400, 32, sections_per_chapter=4)
+        # 每章一个摘要节点，向量取本章小节的均值，与查询的相似度往往高于小节本身
+        for chapter in range(1, 101):
+            ids = rag.section_ids(chapter)
+            vec = np.mean([rag.get_vector(i) for i in ids], axis=0)
+            rag.add_document(text=f"第{chapter}章摘要", vector=vec.tolist(),
+                             metadata={"level": "chapter", "chapter": chapter, "children": ids})
+        calls = []
+        original_search = rag.index.search
+        def counting_search(matrix, query, top_k):
+            calls.append(top_k)
+            return original_search(matrix, query, top_k)
+        rag.index.search = counting_search
+
+        rag.index.nprobe = len(rag.index.centroids)
+        query = np.random.default_rng(3).normal(size=32).tolist()
+        flat = rag.search(query, top_k=5)
+        assert calls, "存在摘要节点时平铺检索仍应走 ANN 索引"
+        assert not any("摘要" in d["text"] for d in flat), "平铺检索不应返回摘要节点"
+        assert flat == rag.search(query, top_k=5, exact=True)
+
+def test_ivf_index_persists_and_catches_up():
+    with tempfile.TemporaryDirectory() as novel_dir:
+        params = {"min_train": 100}
+        rag = RAGEngine(novel_dir, index_backend="ivf", index_params=params, ann_min_size=100)
+        _fill(rag, 150, 16)
+        rag.compact()
+        centroids = rag.index.centroids.copy()
+        rag.add_document(text="新记忆", vector=[1.0] * 16)
+
+        reloaded = RAGEngine(novel_dir, index_backend="ivf", index_params=params, ann_min_size=100)
+        assert np.array_equal(reloaded.index.centroids, centroids), "应加载持久化索引而不是重新训练"
+        assert reloaded.index.count == 151
+
+def test_checkpoint_saves_index_for_next_start(monkeypatch):
+    from core.state_manager import StateManager
+
+    with tempfile.TemporaryDirectory() as novel_dir:
+        rag_config = {"index_backend": "ivf", "index_params": {"min_train": 100}, "ann_min_size": 100}
+        manager = StateManager(novel_dir, rag_config=rag_config)
+        _fill(manager.rag, 150, 16)
+        manager.save_memory_index()
+        assert os.path.exists(manager.rag.index.file_path), "检查点应把索引写入磁盘（未触发 compact）"
+
+        trained = []
+        original_train = IVFIndex._train
+        monkeypatch.setattr(IVFIndex, "_train", lambda self, matrix, n: trained.append(n) or original_train(self, matrix, n))
+        reloaded = RAGEngine(novel_dir, index_backend="ivf", index_params={"min_train": 100}, ann_min_size=100)
+        assert reloaded.index.count == 150
+        assert trained == [], "重新打开时应直接加载保存的索引，不重新训练"
+        assert np.array_equal(reloaded.index.centroids, manager.rag.index.centroids)
+
+def test_create_index_passes_only_constructor_parameters():
+    with tempfile.TemporaryDirectory() as tmp:
+        index = create_index("ivf", 4, os.path.join(tmp, "memory"), nprobe=2, ef=64, self=None)
+        assert isinstance(index, IVFIndex) and index.nprobe == 2, "其他后端的参数应被忽略"
+    try:
+        VectorIndex(4, "memory")
+    except TypeError:
+        pass
+    else:
+        raise AssertionError("接口基类不应能直接实例化")
@@ -0,0 +1,64 @@
+import asyncio
+import os
+import sys
+
+# Ensure we can import from drivers
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from drivers.fake import AsyncFakeDriver
+from drivers.factory import get_async_driver
+from drivers.openai import AsyncOpenAIDriver
+
+class TrackingFakeDriver(AsyncFakeDriver):
+    """记录同时在途请求数的异步假驱动。"""
+
+    def __init__(self, **options):
+        super().__init__(**options)
+        self.active = 0
+        self.peak = 0
+
+    def _count_call(self):
+        super()._count_call()
+        self.active += 1
+        self.peak = max(self.peak, self.active)
+
+    def _log(self, *args):
+        self.active -= 1
+        super()._log(*args)
+
+def test_semaphore_caps_in_flight_requests():
+    llm = TrackingFakeDriver(latency=0.02, latency_jitter=0)
+    llm.max_concurrency = 2
+
+    async def run():
+        return await asyncio.gather(*(llm.agenerate_content(f"请求{i}") for i in range(6)))
+
+    results = asyncio.run(run())
+    assert len(results) == 6 and all(results)
+    assert llm.peak == 2, f"同时在途的请求不应超过 max_concurrency: {llm.peak}"
+
+def test_max_concurrency_reaches_inner_driver():
+    llm = get_async_driver("fake", None, "fake-model", embedding_cache=False, response_cache=False,
+                           max_concurrency=3)
+    inner = llm
+    while hasattr(inner, "driver"):
+        inner = inner.driver
+    assert isinstance(inner, AsyncFakeDriver) and inner.max_concurrency == 3
+
+def test_openai_drivers_share_and_close_http_client():
+    first = AsyncOpenAIDriver("key-1", "model-a")
+    second = AsyncOpenAIDriver("key-2", "model-b", base_url="http://localhost:1/v1")
+
+    async def run():
+        shared = first._async_client()._client
+        assert second._async_client()._client is shared, "同一事件循环上的驱动应共用连接池"
+        assert first._async_client() is first._async_client(), "AsyncOpenAI 客户端按事件循环缓存"
+        await first.aclose()
+        assert shared.is_closed, "aclose 应关闭共享连接池"
+        reopened = first._async_client()._client
+        assert reopened is not shared and not reopened.is_closed, "关闭后再次调用应创建新的连接池"
+        assert second._async_client()._client is reopened, "其他驱动也应改用新的连接池"
+        await second.aclose()
+        assert reopened.is_closed
+
+    asyncio.run(run())
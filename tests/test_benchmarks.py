@@ -0,0 +1,33 @@
+import json
+import os
+import sys
+import tempfile
+
+# Ensure we can import from benchmarks
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from benchmarks.bench_pipeline import run_case
+from benchmarks.bench_rag import run_backend
+from benchmarks.common import write_results
+
+def test_pipeline_case_reports_metrics():
+    case = run_case(2, 2, 50, words_per_section=40, driver_options={"embedding_dim": 8})
+    assert case["sections_written"] == 4
+    assert case["llm_calls"]["draft"]["seconds"]["count"] == 4
+    assert case["llm_calls"]["state_update"]["seconds"]["count"] == 4
+    assert len(case["prompt_bytes_per_section"]["draft_series"]) == 4
+    assert case["rag_search_seconds"]["count"] == 4, "每节起草前应检索一次记忆库"
+    # 每节完成时原子改名一次，状态写回时三个状态文件各原子替换一次，每章结束时完成清单写回一次，
+    # 结束时压缩预写日志一次
+    assert case["file_io"]["chapters"]["replace"] == 4 + 4 * 3 + 2 + 1, "每节完成与状态写回都应原子改名"
+
+def test_rag_checkpoints_and_json_output():
+    checkpoints = run_backend("exact", [10, 30], dim=4, queries=3)
+    assert [c["size"] for c in checkpoints] == [10, 30]
+    assert checkpoints[1]["add_seconds"]["count"] == 20
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = write_results("rag", {"dim": 4}, {"exact": checkpoints}, os.path.join(tmp, "out.json"))
+        with open(path, "r", encoding="utf-8") as f:
+            payload = json.load(f)
+    assert payload["benchmark"] == "rag" and payload["results"]["exact"][0]["size"] == 10
@@ -0,0 +1,74 @@
+import os
+import sys
+
+# Ensure we can import from core
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from core.context_assembler import ContextAssembler, estimate_tokens
+
+CHARACTERS = """
+林风:
+  状态: "重伤，藏身山洞"
+  位置: "青云山"
+苏晴:
+  状态: "在京城调查案件"
+路人甲:
+  状态: "在酒馆喝酒"
+"""
+
+ARCS = """
+神秘玉佩: "未解，玉佩在林风身上"
+灭门真相: "已解决"
+京城案件: "苏晴正在追查"
+"""
+
+def test_ranks_by_mission_and_reports_drops():
+    mission = "第3节：林风在青云山山洞中疗伤，发现玉佩发光"
+    budget = 120
+    context, report = ContextAssembler(budget).assemble("故事刚刚开始。", CHARACTERS, ARCS, ["林风曾在山洞中得到玉佩"], mission)
+
+    assert "重伤" in context and "玉佩在林风身上" in context, "与本节任务相关的角色和剧情线应完整保留"
+    assert "灭门真相" not in context, "已收束的剧情线不应注入"
+    assert "在酒馆喝酒" not in context, "无关角色的详细状态应被省略"
+    assert "路人甲" in context, "被省略的角色应以名字形式提示"
+    assert "林风曾在山洞中得到玉佩" in context, "最相关的记忆应保留"
+    dropped = {(d["kind"], d["name"], d["reason"]) for d in report["dropped"]}
+    assert ("arc", "灭门真相", "resolved") in dropped
+    assert ("character", "路人甲", "budget") in dropped
+    assert report["used"] <= budget
+
+def test_long_summary_keeps_latest_part():
+    summary = "开端" * 200 + "最新进展"
+    context, report = ContextAssembler(100).assemble(summary, "", "", [], "")
+    assert "最新进展" in context and report["truncated"][0]["kind"] == "summary"
+    assert estimate_tokens(context) < estimate_tokens(summary)
+
+def test_each_section_queries_context_with_its_own_mission():
+    import tempfile
+    from core.generator import write_chapters_from_outline
+
+    class QueryRecordingDriver:
+        def __init__(self):
+            self.embedded = []
+
+        def generate_content(self, prompt, system_instruction=None):
+            if "===SUMMARY===" in prompt:
+                return "===SUMMARY===\n摘要\n===CHARACTERS===\n主角: 健康\n===ARCS===\n{}\n===MEMORY===\n记忆"
+            return "正文内容"
+
+        def embed_content(self, text):
+            self.embedded.append(text)
+            return [1.0, 0.0]
+
+    outline = "第1章：开端\n  第1节：主角醒来\n  第2节：遇见师父\n"
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as tmp:
+        os.chdir(tmp)
+        try:
+            llm = QueryRecordingDriver()
+            write_chapters_from_outline(llm, "查询测试", outline, {}, 50, {"context_budget": 2000})
+        finally:
+            os.chdir(cwd)
+    queries = [text for text in llm.embedded if text.startswith("第1章：开端")]
+    assert len(queries) == 2 and "主角醒来" in queries[0] and "遇见师父" in queries[1], \
+        f"每节应以本节任务检索上下文: {queries}"
@@ -0,0 +1,90 @@
+import os
+import sys
+import tempfile
+
+# Ensure we can import from drivers
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from drivers.base import BaseDriver
+from drivers.embedding_cache import EmbeddingCache, CachedEmbeddingDriver
+
+class CountingDriver(BaseDriver):
+    provider_name = "counting"
+    embedding_model = "test-embedding"
+    embedding_task_type = "retrieval_document"
+
+    def __init__(self):
+        self.embed_calls = 0
+
+    def generate_content(self, prompt, system_instruction=None):
+        return prompt
+
+    def embed_content(self, text):
+        self.embed_calls += 1
+        return [float(len(text)), 1.0, 0.5]
+
+def test_cache_hit_survives_restart():
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "embeddings.sqlite3")
+        inner = CountingDriver()
+        llm = CachedEmbeddingDriver(inner, EmbeddingCache(path))
+
+        first = llm.embed_content("第一章大纲")
+        assert llm.embed_content("第一章大纲") == first
+        assert inner.embed_calls == 1, "相同文本应命中缓存"
+        assert llm.generate_content("透传") == "透传"
+        llm.cache.close()
+
+        reopened = CachedEmbeddingDriver(inner, EmbeddingCache(path))
+        assert reopened.embed_content("第一章大纲") == first
+        assert inner.embed_calls == 1, "重启后仍应命中磁盘缓存"
+        reopened.cache.close()
+
+def test_key_includes_model():
+    with tempfile.TemporaryDirectory() as tmp:
+        cache = EmbeddingCache(os.path.join(tmp, "embeddings.sqlite3"))
+        inner = CountingDriver()
+        llm = CachedEmbeddingDriver(inner, cache)
+        llm.embed_content("同一段文本")
+        inner.embedding_model = "another-model"
+        llm.embed_content("同一段文本")
+        assert inner.embed_calls == 2, "切换嵌入模型后不应复用旧向量"
+        cache.close()
+
+def test_lru_eviction_respects_size_cap():
+    with tempfile.TemporaryDirectory() as tmp:
+        # 每条向量 3 个 float32 = 12 字节，上限只容纳 2 条
+        cache = EmbeddingCache(os.path.join(tmp, "embeddings.sqlite3"), max_bytes=24)
+        cache.put("a", [1.0, 2.0, 3.0])
+        cache.put("b", [1.0, 2.0, 3.0])
+        assert cache.get("a") is not None # a 变为最近使用
+        cache.put("c", [1.0, 2.0, 3.0])
+
+        assert len(cache) == 2
+        assert cache.get("b") is None, "最久未使用的条目应被淘汰"
+        assert cache.get("a") is not None and cache.get("c") is not None
+        cache.close()
+
+def test_async_embeddings_share_cache():
+    import asyncio
+
+    class AsyncCountingDriver(CountingDriver):
+        async def aembed_content(self, text):
+            return self.embed_content(text)
+
+        async def aembed_contents(self, texts):
+            return [self.embed_content(t) for t in texts]
+
+    with tempfile.TemporaryDirectory() as tmp:
+        cache = EmbeddingCache(os.path.join(tmp, "embeddings.sqlite3"))
+        inner = AsyncCountingDriver()
+        llm = CachedEmbeddingDriver(inner, cache)
+        llm.embed_content("甲")
+
+        async def run():
+            return await llm.aembed_contents(["甲", "乙"]), await llm.aembed_content("乙")
+
+        batch, single = asyncio.run(run())
+        assert batch[1] == single
+        assert inner.embed_calls == 2, "同步与异步调用应共用同一份缓存"
+        cache.close()
@@ -0,0 +1,56 @@
+import os
+import sys
+import tempfile
+
+# Ensure we can import from core and drivers
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from core.generator import generate_outline, write_chapters_from_outline
+from core.outline_model import split_chapters
+from drivers.factory import get_driver
+
+def _fake(**options):
+    return get_driver("fake", None, "fake-model", embedding_cache=False, response_cache=False,
+                      driver_options=options)
+
+def test_full_pipeline_runs_offline():
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as tmp:
+        os.chdir(tmp)
+        try:
+            llm = _fake(embedding_dim=16)
+            novel_config = {"batch_size": 2, "outline_concurrency": 2}
+            outline = generate_outline(llm, "合成测试", "测试创意", 3, 2, {}, novel_config)
+            chapters = split_chapters(outline)
+            assert [title.split("：")[0] for title, _ in chapters] == ["第1章", "第2章", "第3章"]
+
+            write_chapters_from_outline(llm, "合成测试", outline, {}, 50, novel_config)
+            for chapter in ("第01章", "第02章", "第03章"):
+                for section in ("第01节.txt", "第02节.txt"):
+                    with open(os.path.join("合成测试", chapter, section), "r", encoding="utf-8") as f:
+                        assert len(f.read()) == 50
+            with open(os.path.join("合成测试", "global_summary.txt"), "r", encoding="utf-8") as f:
+                assert f.read().startswith("故事推进至片段")
+            assert os.path.getsize(os.path.join("合成测试", "memory.log.jsonl")) > 0, "状态更新应写入 RAG 记忆"
+
+            # 增量模式：摘要按节追加，角色状态由本地应用操作得到
+            write_chapters_from_outline(llm, "增量合成测试", outline, {}, 50, dict(novel_config, state_update_mode="delta"))
+            with open(os.path.join("增量合成测试", "global_summary.txt"), "r", encoding="utf-8") as f:
+                assert f.read().count("故事推进至片段") == 6, "每节的摘要增量都应追加到全局摘要"
+            with open(os.path.join("增量合成测试", "character_state.yaml"), "r", encoding="utf-8") as f:
+                assert "位置" in f.read()
+        finally:
+            os.chdir(cwd)
+
+def test_embeddings_are_deterministic_and_normalized():
+    llm = _fake(embedding_dim=32)
+    a = llm.embed_content("少年下山")
+    assert len(a) == 32
+    assert a == _fake(embedding_dim=32).embed_contents(["少年下山"])[0]
+    assert abs(sum(v * v for v in a) - 1.0) < 1e-9
+
+def test_failure_injection():
+    llm = _fake(failure_rate=1.0)
+    assert llm.generate_content("任意提示").startswith("⚠️")
+    assert llm.embed_content("任意文本") == []
+    assert _fake(rate_limit_rate=1.0).generate_content("任意提示").startswith("⚠️ [LLM 错误] 429")
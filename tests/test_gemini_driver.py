@@ -0,0 +1,55 @@
+import os
+import sys
+import types
+
+# Ensure we can import from drivers
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from drivers.gemini import GeminiDriver
+
+class FakeModel:
+    created = []
+
+    def __init__(self, model_name, safety_settings=None, generation_config=None, system_instruction=None):
+        self.system_instruction = system_instruction
+        self.generation_config = generation_config
+        FakeModel.created.append(system_instruction)
+
+def _stub_genai(monkeypatch):
+    """用假的 google.generativeai 模块替换真实 SDK，不访问网络。"""
+    genai = types.ModuleType("google.generativeai")
+    genai.configure = lambda **kwargs: None
+    genai.GenerativeModel = FakeModel
+    genai_types = types.ModuleType("google.generativeai.types")
+    genai_types.HarmCategory = types.SimpleNamespace(
+        HARM_CATEGORY_HARASSMENT=1, HARM_CATEGORY_HATE_SPEECH=2,
+        HARM_CATEGORY_SEXUALLY_EXPLICIT=3, HARM_CATEGORY_DANGEROUS_CONTENT=4)
+    genai_types.HarmBlockThreshold = types.SimpleNamespace(BLOCK_NONE=0)
+    genai.types = genai_types
+    google = types.ModuleType("google")
+    google.generativeai = genai
+    monkeypatch.setitem(sys.modules, "google", google)
+    monkeypatch.setitem(sys.modules, "google.generativeai", genai)
+    monkeypatch.setitem(sys.modules, "google.generativeai.types", genai_types)
+
+def test_models_are_cached_per_system_instruction(monkeypatch):
+    _stub_genai(monkeypatch)
+    FakeModel.created = []
+    driver = GeminiDriver("key", "gemini-test")
+    driver.model_cache_size = 2
+
+    assert driver._get_model() is driver.model, "没有 system_instruction 时使用默认模型"
+    first = driver._get_model("写作")
+    assert driver._get_model("写作") is first, "相同的 system_instruction 应复用模型对象"
+    driver._get_model("编辑")
+    driver._get_model("写作") # 写作变为最近使用
+    driver._get_model("审校") # 超出上限，淘汰最久未使用的“编辑”
+
+    assert list(driver._instruction_models) == ["写作", "审校"]
+    assert FakeModel.created == [None, "写作", "编辑", "审校"]
+
+def test_generation_params_reach_every_model(monkeypatch):
+    _stub_genai(monkeypatch)
+    driver = GeminiDriver("key", "gemini-test", generation_params={"temperature": 0.2})
+    assert driver.model.generation_config == {"temperature": 0.2}
+    assert driver._get_model("写作").generation_config == {"temperature": 0.2}
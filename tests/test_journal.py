@@ -0,0 +1,103 @@
+import os
+import sys
+import tempfile
+
+# Ensure we can import from core
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from core.generator import write_chapters_from_outline
+from core.journal import DRAFT_WRITTEN, MEMORY_INDEXED, STATE_APPLIED, SectionJournal
+from core.rag_engine import RAGEngine
+
+OUTLINE = """
+第1章：开端
+  第1节：主角醒来
+  第2节：遇见师父
+"""
+
+class Crash(BaseException):
+    """模拟进程在状态更新途中退出（不会被流水线的异常处理吞掉）。"""
+
+class JournalDriver:
+    """记录状态更新次数的假驱动；crash_on 指定第几次状态更新时模拟进程退出。"""
+
+    def __init__(self, crash_on=None):
+        self.crash_on = crash_on
+        self.updates = 0
+
+    def generate_content(self, prompt, system_instruction=None):
+        if "===SUMMARY===" in prompt:
+            self.updates += 1
+            if self.updates == self.crash_on:
+                raise Crash()
+            return f"===SUMMARY===\n第{self.updates}次摘要\n===CHARACTERS===\n主角: 健康\n===ARCS===\n{{}}\n===MEMORY===\n第{self.updates}条记忆"
+        return "正文内容"
+
+    def embed_content(self, text):
+        return [1.0, 0.0]
+
+def test_journal_survives_torn_last_line_and_compacts():
+    with tempfile.TemporaryDirectory() as tmp:
+        journal = SectionJournal(tmp)
+        journal.record(1, 1, DRAFT_WRITTEN)
+        journal.record(1, 1, STATE_APPLIED, memory="记忆")
+        journal.record(1, 2, DRAFT_WRITTEN, delta=None)
+        with open(journal.path, "a", encoding="utf-8") as f:
+            f.write('{"chapter": 1, "section": 2, "st')
+
+        reopened = SectionJournal(tmp)
+        assert reopened.incomplete() == [(1, 1), (1, 2)], "写了一半的最后一行应被忽略"
+        assert reopened.get(1, 1, STATE_APPLIED)["memory"] == "记忆"
+        assert "delta" not in reopened.get(1, 2, DRAFT_WRITTEN)
+
+        reopened.record(1, 1, MEMORY_INDEXED)
+        assert SectionJournal(tmp).has(1, 1, MEMORY_INDEXED), "半行截掉后追加的记录在重新加载时不应丢失"
+        reopened.compact()
+        assert SectionJournal(tmp).incomplete() == [(1, 2)], "全部完成的小节应在压缩时移除"
+
+def test_crash_between_draft_and_state_update_is_recovered():
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as tmp:
+        os.chdir(tmp)
+        try:
+            # 第 2 节正文已改名为正式文件，状态更新时进程退出
+            try:
+                write_chapters_from_outline(JournalDriver(crash_on=2), "日志测试", OUTLINE, {}, 50)
+            except Crash:
+                pass
+            assert os.path.exists(os.path.join("日志测试", "第01章", "第02节.txt"))
+            assert SectionJournal("日志测试").incomplete() == [(1, 2)]
+
+            # 重新启动：不重写正文，只补做第 2 节的状态更新与记忆入库
+            llm = JournalDriver()
+            write_chapters_from_outline(llm, "日志测试", OUTLINE, {}, 50)
+            assert llm.updates == 1, "只应补做缺失的那一次状态更新"
+            with open(os.path.join("日志测试", "global_summary.txt"), "r", encoding="utf-8") as f:
+                assert f.read() == "第1次摘要"
+            memories = [d["text"] for d in RAGEngine("日志测试").documents]
+            assert memories == ["第1条记忆", "第1条记忆"], "两节的记忆都应入库"
+            assert SectionJournal("日志测试").incomplete() == []
+        finally:
+            os.chdir(cwd)
+
+def test_missing_memory_is_indexed_without_redoing_state():
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as tmp:
+        os.chdir(tmp)
+        try:
+            llm = JournalDriver()
+            write_chapters_from_outline(llm, "日志测试", OUTLINE, {}, 50)
+            # 模拟状态已落盘、记忆入库前退出：日志中只有前两个步骤
+            journal = SectionJournal("日志测试")
+            journal.record(1, 3, DRAFT_WRITTEN)
+            journal.record(1, 3, STATE_APPLIED, memory="补做的记忆")
+            os.makedirs(os.path.join("日志测试", "第01章"), exist_ok=True)
+            with open(os.path.join("日志测试", "第01章", "第03节.txt"), "w", encoding="utf-8") as f:
+                f.write("正文内容")
+
+            write_chapters_from_outline(llm, "日志测试", OUTLINE, {}, 50)
+            assert llm.updates == 2, "状态已应用的小节不应再请求状态更新"
+            assert RAGEngine("日志测试").documents[-1]["text"] == "补做的记忆"
+            assert SectionJournal("日志测试").incomplete() == []
+        finally:
+            os.chdir(cwd)
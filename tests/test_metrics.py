@@ -0,0 +1,57 @@
+import os
+import sys
+import tempfile
+
+# Ensure we can import from core and drivers
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from core import metrics
+from core.generator import generate_outline, write_chapters_from_outline
+from drivers.factory import get_driver
+
+def _value(summary, name, **labels):
+    return sum(
+        item.get("value", item.get("count"))
+        for item in summary["counters"] + summary["histograms"]
+        if item["name"] == name and all(item["labels"].get(k) == v for k, v in labels.items())
+    )
+
+def test_pipeline_metrics_are_labeled_by_stage_and_novel():
+    metrics.registry.reset()
+    llm = get_driver("fake", None, "fake-model", embedding_cache=False, response_cache=False,
+                     driver_options={"embedding_dim": 8})
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as tmp:
+        os.chdir(tmp)
+        try:
+            novel_config = {"batch_size": 1, "outline_concurrency": 2, "state_lag": 1}
+            outline = generate_outline(llm, "指标测试", "创意", 2, 1, {}, novel_config)
+            write_chapters_from_outline(llm, "指标测试", outline, {}, 30, novel_config)
+
+            summary = metrics.registry.summary(novel="指标测试")
+            assert _value(summary, "pynovel_llm_requests_total", stage="roadmap", model="fake-model") == 1
+            assert _value(summary, "pynovel_llm_requests_total", stage="outline_batch") == 2, "并行批次也应带上小说标签"
+            assert _value(summary, "pynovel_llm_requests_total", stage="draft", outcome="ok") == 2
+            assert _value(summary, "pynovel_llm_requests_total", stage="state_update") == 2, "后台状态更新应带上标签"
+            assert _value(summary, "pynovel_llm_requests_total", stage="memory_embedding", kind="embed") == 2
+            assert _value(summary, "pynovel_llm_completion_tokens_total", stage="draft") == 60
+            assert _value(summary, "pynovel_stage_seconds", stage="draft") == 2
+
+            path = os.path.join(tmp, "metrics", "pynovel.prom")
+            metrics.registry.write_prometheus(path)
+            with open(path, "r", encoding="utf-8") as f:
+                text = f.read()
+            assert "# TYPE pynovel_llm_request_seconds histogram" in text
+            assert 'stage="draft"' in text and 'le="+Inf"' in text
+        finally:
+            os.chdir(cwd)
+    metrics.registry.reset()
+
+def test_errors_are_counted():
+    metrics.registry.reset()
+    llm = get_driver("fake", None, "fake-model", embedding_cache=False, response_cache=False,
+                     driver_options={"failure_rate": 1.0})
+    with metrics.stage("draft"):
+        llm.generate_content("任意")
+    assert _value(metrics.registry.summary(), "pynovel_llm_requests_total", outcome="error", stage="draft") == 1
+    metrics.registry.reset()
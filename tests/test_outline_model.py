@@ -0,0 +1,141 @@
+import json
+import os
+import sys
+import tempfile
+
+# Ensure we can import from core
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from core.generator import write_chapters_from_outline
+from core.outline_model import CompletionManifest, OutlineModel, load_outline, outline_model_path, split_chapters
+
+OUTLINE = """# 《测试》分集大纲
+
+## 全局剧情路标
+终局前会回到第9章：开头埋下的伏笔。
+
+第1章：开端
+  【本章伏笔/悬念任务】：神秘玉佩
+  第1节：主角醒来
+  第2节：遇见师父
+**第3章：风起**
+  第1节：宗门大比
+第4章：空章
+第3章：重复
+  第1节：不应出现
+"""
+
+class CountingDriver:
+    def __init__(self):
+        self.drafts = 0
+
+    def generate_content(self, prompt, system_instruction=None):
+        if "===SUMMARY===" in prompt:
+            return "===SUMMARY===\n摘要\n===CHARACTERS===\n主角: 健康\n===ARCS===\n{}\n===MEMORY===\n"
+        self.drafts += 1
+        return "正文内容"
+
+    def embed_content(self, text):
+        return [1.0, 0.0]
+
+def test_parse_uses_heading_numbers_and_ignores_stray_headings():
+    model = OutlineModel.parse(OUTLINE)
+    assert [(c.number, c.title) for c in model.chapters] == [(1, "第1章：开端"), (3, "第3章：风起")], \
+        "章号应取自标题，行内提及、空章与重复章号都应忽略"
+    assert [s.mission for s in model.chapters[0].sections] == ["主角醒来", "遇见师父"]
+    assert model.section_count == 3
+    assert "神秘玉佩" in model.chapters[0].plan
+
+    titles = [title for title, _ in split_chapters(OUTLINE)]
+    assert titles == ["第1章：开端", "第3章：风起", "第4章：空章", "第3章：重复"], "切分与解析使用同一条标题规则"
+
+    restored = OutlineModel.from_dict(model.to_dict())
+    assert restored.to_dict() == model.to_dict()
+
+def test_outline_model_is_cached_by_fingerprint():
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as tmp:
+        os.chdir(tmp)
+        try:
+            first = load_outline("缓存", OUTLINE)
+            assert os.path.exists(outline_model_path("缓存"))
+            assert load_outline("缓存", OUTLINE).to_dict() == first.to_dict()
+            changed = load_outline("缓存", OUTLINE.replace("宗门大比", "宗门决战"))
+            assert changed.chapters[1].sections[0].mission == "宗门决战", "大纲改动后应重新解析"
+
+            # 生成大纲时按纯章节大纲保存模型，续用时读到的是带书名和路标的大纲文件，两者应命中同一缓存
+            body = OUTLINE[OUTLINE.index("第1章：开端"):]
+            OutlineModel.parse(body).save(outline_model_path("续用"))
+            parsed = []
+            original_parse = OutlineModel.parse
+            OutlineModel.parse = classmethod(lambda cls, text: parsed.append(text) or original_parse(text))
+            try:
+                assert load_outline("续用", OUTLINE).fingerprint == original_parse(body).fingerprint
+            finally:
+                OutlineModel.parse = original_parse
+            assert not parsed, "续用已有大纲时应命中缓存，不重新解析"
+        finally:
+            os.chdir(cwd)
+
+def test_resume_uses_manifest_and_rebuilds_it_from_disk():
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as tmp:
+        os.chdir(tmp)
+        try:
+            llm = CountingDriver()
+            assert write_chapters_from_outline(llm, "续传", OUTLINE, {}, 50) == 3, "应返回本次新写完的小节数"
+            assert llm.drafts == 3
+            assert os.path.exists(os.path.join("续传", "第03章", "第01节.txt"))
+            manifest = CompletionManifest("续传")
+            assert manifest.completed == {1: {1, 2}, 3: {1}}
+
+            # 清单记为整章完成的章节直接跳过，不访问章节目录
+            checked = []
+            original_exists, original_listdir = os.path.exists, os.listdir
+            def tracking_exists(path):
+                checked.append(path)
+                return original_exists(path)
+            def tracking_listdir(path="."):
+                checked.append(path)
+                return original_listdir(path)
+            os.path.exists, os.listdir = tracking_exists, tracking_listdir
+            try:
+                assert write_chapters_from_outline(llm, "续传", OUTLINE, {}, 50) == 0
+            finally:
+                os.path.exists, os.listdir = original_exists, original_listdir
+            assert llm.drafts == 3
+            assert not [p for p in checked if "节.txt" in p or p.endswith("章")], "已完成的章节不应再检查文件"
+
+            # 部分完成的章节按目录核对：清单落后于磁盘的小节补记，文件已删除的小节重新创作
+            with open(manifest.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            data["completed"]["1"] = [1]
+            with open(manifest.path, "w", encoding="utf-8") as f:
+                json.dump(data, f)
+            os.remove(os.path.join("续传", "第01章", "第01节.txt"))
+            write_chapters_from_outline(llm, "续传", OUTLINE, {}, 50)
+            assert llm.drafts == 4, "只应重新生成被删除的第 1 节"
+            assert os.path.exists(os.path.join("续传", "第01章", "第01节.txt"))
+            assert CompletionManifest("续传").completed == {1: {1, 2}, 3: {1}}
+
+            # 整章完成的章节中删除了小节文件时，需连同清单一起删除才会重新创作
+            os.remove(os.path.join("续传", "第01章", "第02节.txt"))
+            os.remove(manifest.path)
+            write_chapters_from_outline(llm, "续传", OUTLINE, {}, 50)
+            assert llm.drafts == 5
+            assert os.path.exists(os.path.join("续传", "第01章", "第02节.txt"))
+
+            # 大纲改动后清单作废，按文件重新记录
+            changed = OUTLINE.replace("宗门大比", "宗门决战")
+            fingerprint = OutlineModel.parse(changed).fingerprint
+            assert CompletionManifest("续传", fingerprint).completed == {}
+            write_chapters_from_outline(llm, "续传", changed, {}, 50)
+            assert llm.drafts == 5
+            manifest = CompletionManifest("续传", fingerprint)
+            assert manifest.fingerprint == fingerprint and manifest.completed == {1: {1, 2}, 3: {1}}
+
+            # 清单丢失时按目录重建
+            os.remove(manifest.path)
+            assert CompletionManifest("续传").completed == {1: {1, 2}, 3: {1}}
+        finally:
+            os.chdir(cwd)
@@ -0,0 +1,62 @@
+import os
+import re
+import sys
+import tempfile
+import threading
+
+# Ensure we can import from core
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from core.generator import generate_outline
+
+class OutlineDriver:
+    """按提示词中的章节区间返回格式化大纲的假驱动，记录并发峰值。"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.in_flight = 0
+        self.peak = 0
+        self.prompts = []
+
+    def generate_content(self, prompt, system_instruction=None):
+        with self.lock:
+            self.in_flight += 1
+            self.peak = max(self.peak, self.in_flight)
+            self.prompts.append(prompt)
+        try:
+            import time
+            time.sleep(0.02)
+            if "全局剧情路标》" in prompt:
+                return "起承转合。\n第1-2章：主角出山\n第3-4章：初遇强敌\n第5-5章：真相揭晓"
+            if "衔接处" in prompt:
+                n = re.search(r"【下一章（需要修正）】\s*第(\d+)章", prompt).group(1)
+                return f"第{n}章：衔接修正\n  【本章伏笔/悬念任务】：承上启下\n  第1节：承接\n  第2节：推进\n"
+            start, end = map(int, re.search(r"创作第 (\d+) 章至第 (\d+) 章", prompt).groups())
+            return "".join(
+                f"第{n}章：标题{n}\n  【本章伏笔/悬念任务】：伏笔{n}\n  第1节：情节A\n  第2节：情节B\n"
+                for n in range(start, end + 1)
+            )
+        finally:
+            with self.lock:
+                self.in_flight -= 1
+
+def test_parallel_outline_batches():
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as tmp:
+        os.chdir(tmp)
+        try:
+            llm = OutlineDriver()
+            config = {"batch_size": 2, "outline_concurrency": 3}
+            outline = generate_outline(llm, "并行测试", "创意", 5, 2, {}, config)
+        finally:
+            os.chdir(cwd)
+
+    headings = re.findall(r"第(\d+)章：(.*)", outline)
+    assert [int(n) for n, _ in headings] == [1, 2, 3, 4, 5], f"章节顺序错误: {headings}"
+    # 批次交界处（第 3、5 章）的首章被衔接修正替换
+    assert dict(headings)["3"] == "衔接修正" and dict(headings)["5"] == "衔接修正"
+    assert dict(headings)["2"] == "标题2"
+    assert llm.peak >= 2, "批次应并发生成"
+
+    batch_prompts = [p for p in llm.prompts if "创作第 3 章至第 4 章" in p]
+    assert "第3-4章：初遇强敌" in batch_prompts[0], "批次提示词应包含对应的分段路标"
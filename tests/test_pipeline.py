@@ -0,0 +1,72 @@
+import os
+import sys
+import time
+import tempfile
+import threading
+
+# Ensure we can import from core
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from core.generator import write_chapters_from_outline
+
+OUTLINE = """
+第1章：开端
+  【本章伏笔/悬念任务】：神秘玉佩
+  第1节：主角醒来
+  第2节：遇见师父
+  第3节：离开村庄
+"""
+
+class PipelineDriver:
+    """状态更新较慢的假驱动，记录起草与状态更新的时间线。"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.events = []
+        self.updates = 0
+
+    def _log(self, event):
+        with self.lock:
+            self.events.append(event)
+
+    def generate_content(self, prompt, system_instruction=None):
+        if "===SUMMARY===" in prompt:
+            with self.lock:
+                self.updates += 1
+                n = self.updates
+            self._log(f"update{n}-start")
+            time.sleep(0.05)
+            self._log(f"update{n}-end")
+            return f"===SUMMARY===\n第{n}次摘要\n===CHARACTERS===\n主角: 健康\n===ARCS===\n玉佩: 未解\n===MEMORY===\n第{n}节记忆"
+        self._log("draft")
+        return "正文内容"
+
+    def embed_content(self, text):
+        return [1.0, float(len(text))]
+
+def _run(state_lag):
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as tmp:
+        os.chdir(tmp)
+        try:
+            llm = PipelineDriver()
+            write_chapters_from_outline(llm, "流水线测试", OUTLINE, {}, 100, {"state_lag": state_lag})
+            with open(os.path.join("流水线测试", "global_summary.txt"), "r", encoding="utf-8") as f:
+                summary = f.read()
+        finally:
+            os.chdir(cwd)
+    return llm, summary
+
+def test_serial_mode_waits_for_state_update():
+    llm, summary = _run(0)
+    assert llm.events.index("update1-end") < llm.events.index("draft", 1)
+    assert summary == "第3次摘要"
+
+def test_pipelined_mode_overlaps_and_keeps_order():
+    llm, summary = _run(1)
+    second_draft = [i for i, e in enumerate(llm.events) if e == "draft"][1]
+    assert second_draft < llm.events.index("update1-end"), "第 2 节应在第 1 节状态更新完成前开始起草"
+    # 单个后台线程保证状态更新按顺序、不重叠地应用
+    updates = [e for e in llm.events if e.startswith("update")]
+    assert updates == ["update1-start", "update1-end", "update2-start", "update2-end", "update3-start", "update3-end"]
+    assert summary == "第3次摘要", "所有状态更新都应在函数返回前完成"
@@ -0,0 +1,292 @@
+import os
+import sys
+import json
+import random
+import tempfile
+
+# Ensure we can import from core
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from core import rag_engine
+from core.rag_engine import RAGEngine
+
+def _random_vectors(n, dim, seed=42):
+    rng = random.Random(seed)
+    return [[rng.uniform(-1, 1) for _ in range(dim)] for _ in range(n)]
+
+def test_search_matches_pure_python():
+    with tempfile.TemporaryDirectory() as novel_dir:
+        rag = RAGEngine(novel_dir)
+        vectors = _random_vectors(50, 16)
+        for i, vec in enumerate(vectors):
+            rag.add_document(text=f"记忆{i}", vector=vec)
+
+        query = _random_vectors(1, 16, seed=7)[0]
+        fast = [doc["text"] for doc in rag.search(query, top_k=5)]
+
+        scored = sorted(
+            range(len(vectors)),
+            key=lambda i: rag._cosine_similarity(query, vectors[i]),
+            reverse=True
+        )
+        expected = [f"记忆{i}" for i in scored[:5]]
+        assert fast == expected, f"预期 {expected}, 实际得到 {fast}"
+
+def test_search_without_numpy():
+    with tempfile.TemporaryDirectory() as novel_dir:
+        original_np = rag_engine.np
+        rag_engine.np = None
+        try:
+            rag = RAGEngine(novel_dir)
+            rag.add_document(text="甲", vector=[1.0, 0.0])
+            rag.add_document(text="乙", vector=[0.0, 1.0])
+            results = rag.search([0.1, 0.9], top_k=1)
+            assert [doc["text"] for doc in results] == ["乙"]
+        finally:
+            rag_engine.np = original_np
+
+def test_reload_rebuilds_matrix():
+    with tempfile.TemporaryDirectory() as novel_dir:
+        rag = RAGEngine(novel_dir)
+        rag.add_document(text="甲", vector=[1.0, 0.0])
+        rag.add_document(text="乙", vector=[0.0, 1.0])
+
+        reloaded = RAGEngine(novel_dir)
+        results = reloaded.search([1.0, 0.1], top_k=2)
+        assert [doc["text"] for doc in results] == ["甲", "乙"]
+
+def test_append_log_replay_and_compact():
+    with tempfile.TemporaryDirectory() as novel_dir:
+        rag = RAGEngine(novel_dir)
+        rag.add_document(text="甲", vector=[1.0, 0.0])
+        rag.add_document(text="乙", vector=[0.0, 1.0])
+        assert not os.path.exists(rag.memory_file), "add_document 不应重写快照"
+
+        # 模拟写入途中崩溃留下的半行记录
+        with open(rag.memory_log_file, "a", encoding="utf-8") as f:
+            f.write('{"seq": 2, "text": "丙')
+
+        reloaded = RAGEngine(novel_dir)
+        assert [d["text"] for d in reloaded.documents] == ["甲", "乙"]
+
+        reloaded.compact()
+        assert os.path.getsize(reloaded.memory_log_file) == 0
+        reloaded.add_document(text="丁", vector=[1.0, 1.0])
+
+        final = RAGEngine(novel_dir)
+        assert [d["text"] for d in final.documents] == ["甲", "乙", "丁"]
+
+def test_append_after_torn_tail_keeps_later_memories():
+    with tempfile.TemporaryDirectory() as novel_dir:
+        rag = RAGEngine(novel_dir)
+        rag.add_document(text="甲", vector=[1.0, 0.0])
+        rag.add_document(text="乙", vector=[0.0, 1.0])
+        with open(rag.memory_log_file, "a", encoding="utf-8") as f:
+            f.write('{"seq": 2, "text": "丙')
+
+        # 不经过 compact 直接继续追加：半行应在加载时被截掉，而不是与新记录粘在一起
+        reloaded = RAGEngine(novel_dir)
+        reloaded.add_document(text="丁", vector=[1.0, 1.0])
+        reloaded.add_document(text="戊", vector=[1.0, -1.0])
+
+        final = RAGEngine(novel_dir)
+        assert [d["text"] for d in final.documents] == ["甲", "乙", "丁", "戊"]
+        assert [d["text"] for d in final.search([1.0, -1.0], top_k=1)] == ["戊"], "向量行不应被当作孤儿截掉"
+
+def test_replay_skips_records_already_compacted():
+    with tempfile.TemporaryDirectory() as novel_dir:
+        rag = RAGEngine(novel_dir)
+        rag.add_document(text="甲", vector=[1.0, 0.0])
+        with open(rag.memory_log_file, "r", encoding="utf-8") as f:
+            stale_log = f.read()
+        rag.compact()
+        # 模拟 compact 写完快照、截断日志之前崩溃
+        with open(rag.memory_log_file, "w", encoding="utf-8") as f:
+            f.write(stale_log)
+
+        reloaded = RAGEngine(novel_dir)
+        assert [d["text"] for d in reloaded.documents] == ["甲"]
+
+def test_migrates_legacy_inline_vectors():
+    with tempfile.TemporaryDirectory() as novel_dir:
+        legacy = [
+            {"text": "甲", "vector": [1.0, 0.0], "metadata": {}},
+            {"text": "乙", "vector": [0.0, 2.0], "metadata": {}},
+        ]
+        with open(os.path.join(novel_dir, "memory.json"), "w", encoding="utf-8") as f:
+            json.dump(legacy, f, ensure_ascii=False)
+
+        rag = RAGEngine(novel_dir)
+        assert os.path.exists(rag.vector_file)
+        assert [doc["text"] for doc in rag.search([0.0, 1.0], top_k=1)] == ["乙"]
+
+        with open(rag.memory_file, "r", encoding="utf-8") as f:
+            snapshot = json.load(f)
+        assert all("vector" not in doc for doc in snapshot), "快照中不应再内联向量"
+
+def test_truncates_orphan_vector_rows():
+    with tempfile.TemporaryDirectory() as novel_dir:
+        rag = RAGEngine(novel_dir)
+        rag.add_document(text="甲", vector=[1.0, 0.0])
+        # 模拟向量已追加、日志尚未写入时崩溃
+        rag._append_vector([0.0, 1.0])
+
+        reloaded = RAGEngine(novel_dir)
+        assert len(reloaded.documents) == 1
+        reloaded.add_document(text="乙", vector=[0.0, 1.0])
+        assert [doc["text"] for doc in RAGEngine(novel_dir).search([0.0, 1.0], top_k=1)] == ["乙"]
+
+def test_partial_vector_row_keeps_rows_aligned():
+    with tempfile.TemporaryDirectory() as novel_dir:
+        rag = RAGEngine(novel_dir)
+        rag.add_document(text="甲", vector=[1.0, 0.0])
+        # 模拟写向量行时中途失败：只落盘了半行
+        with open(rag.vector_file, "ab") as f:
+            f.write(b"\0" * 4)
+        rag.add_document(text="乙", vector=[0.0, 1.0])
+        assert os.path.getsize(rag.vector_file) == rag_engine.VECTOR_HEADER.size + 2 * 2 * 4, "残缺的半行应被覆盖"
+        assert RAGEngine(novel_dir).search([0.0, 1.0], top_k=1)[0]["text"] == "乙"
+
+def test_missing_vector_rows_keep_documents():
+    with tempfile.TemporaryDirectory() as novel_dir:
+        rag = RAGEngine(novel_dir)
+        rag.add_document(text="甲", vector=[1.0, 0.0])
+        rag.add_document(text="乙", vector=[0.0, 1.0])
+        # 模拟向量文件少了最后一行（外加半行残缺数据）
+        with open(rag.vector_file, "r+b") as f:
+            f.truncate(rag_engine.VECTOR_HEADER.size + 2 * 4 + 3)
+
+        reloaded = RAGEngine(novel_dir)
+        assert [d["text"] for d in reloaded.documents] == ["甲", "乙"], "缺少向量的记忆不应被丢弃"
+        assert reloaded.search(query_text="乙")[0]["text"] == "乙"
+        reloaded.add_document(text="丙", vector=[0.0, 1.0])
+        final = RAGEngine(novel_dir)
+        assert [d["text"] for d in final.search([0.0, 1.0], top_k=3)][0] == "丙", "补零行之后新向量应与文档对齐"
+
+def test_broken_vector_header_keeps_memory_text():
+    for header in (b"PNV", b"NOTAVEC!" + b"\0" * 8):
+        with tempfile.TemporaryDirectory() as novel_dir:
+            rag = RAGEngine(novel_dir)
+            rag.add_document(text="甲", vector=[1.0, 0.0])
+            rag.compact()
+            rag.add_document(text="乙", vector=[0.0, 1.0])
+            # 模拟首次写向量时崩溃留下的半个文件头 / 无法识别的文件
+            with open(rag.vector_file, "wb") as f:
+                f.write(header)
+
+            reloaded = RAGEngine(novel_dir)
+            assert [d["text"] for d in reloaded.documents] == ["甲", "乙"], "记忆原文不应丢失"
+            assert reloaded.search(query_text="乙")[0]["text"] == "乙"
+
+            # 下一条向量重建侧车文件，之后写入的日志记录在重新加载时不会被跳过
+            reloaded.add_document(text="丙", vector=[1.0, 1.0])
+            final = RAGEngine(novel_dir)
+            assert [d["text"] for d in final.documents] == ["甲", "乙", "丙"]
+            assert final.search([1.0, 1.0], top_k=1)[0]["text"] == "丙"
+
+def test_bm25_ranks_name_matches():
+    from core.lexical_index import BM25Index, char_bigrams
+    assert char_bigrams("林风，拔剑") == ["林风", "拔剑"]
+    index = BM25Index()
+    for text in ["苏晴在京城调查案件", "林风在青云山得到玉佩", "路人甲在酒馆喝酒"]:
+        index.add(text)
+    assert [doc_id for _, doc_id in index.search("玉佩现在在谁手上", top_k=3)] == [1]
+    assert index.search("玉佩", top_k=3, candidates={0, 2}) == []
+
+def test_hybrid_and_lexical_fallback():
+    with tempfile.TemporaryDirectory() as novel_dir:
+        rag = RAGEngine(novel_dir)
+        # 向量上“苏晴”一条最接近查询，但只有“玉佩”一条在字面上命中
+        rag.add_document(text="苏晴在京城调查案件", vector=[1.0, 0.0])
+        rag.add_document(text="林风在青云山得到玉佩", vector=[0.0, 1.0])
+        rag.add_document(text="路人甲在酒馆喝酒", vector=[0.9, 0.1])
+        # 嵌入失败时写入的记忆没有向量，但仍能按关键词检索
+        rag.add_document(text="玉佩上刻着古老的符文", vector=None)
+
+        assert [d["text"] for d in rag.search([1.0, 0.0], top_k=1)] == ["苏晴在京城调查案件"]
+        hybrid = [d["text"] for d in rag.search([1.0, 0.0], top_k=2, query_text="玉佩")]
+        assert set(hybrid) == {"林风在青云山得到玉佩", "玉佩上刻着古老的符文"}, "两路都命中的记忆应排在前面"
+        lexical = [d["text"] for d in rag.search(None, top_k=2, query_text="玉佩的符文")]
+        assert lexical[0] == "玉佩上刻着古老的符文"
+
+        reloaded = RAGEngine(novel_dir)
+        assert len(reloaded.documents) == 4 and len(reloaded.lexical) == 4, "重新加载后应重建关键词索引"
+        assert reloaded.search([0.0, 1.0], top_k=1) == [{"text": "林风在青云山得到玉佩", "metadata": {}}]
+
+def test_lexical_only_library_backfills_vectors():
+    with tempfile.TemporaryDirectory() as novel_dir:
+        rag = RAGEngine(novel_dir)
+        rag.add_document(text="只有原文的记忆", vector=None)
+        assert [d["text"] for d in RAGEngine(novel_dir).search(query_text="原文")] == ["只有原文的记忆"]
+
+        # 之后恢复嵌入：先前的记忆补零向量，行号保持对齐
+        rag.add_document(text="带向量的记忆", vector=[0.0, 1.0])
+        reloaded = RAGEngine(novel_dir)
+        assert reloaded.search([0.0, 1.0], top_k=1)[0]["text"] == "带向量的记忆"
+        assert reloaded.search(query_text="原文")[0]["text"] == "只有原文的记忆"
+
+def test_backfill_without_numpy():
+    with tempfile.TemporaryDirectory() as novel_dir:
+        original_np = rag_engine.np
+        rag_engine.np = None
+        try:
+            rag = RAGEngine(novel_dir)
+            rag.add_document(text="只有原文的记忆", vector=None)
+            rag.add_document(text="带向量的记忆", vector=[1.0, 0.0])
+            assert [d["text"] for d in rag.search([1.0, 0.0], top_k=2)] == ["带向量的记忆", "只有原文的记忆"], \
+                "补零向量的记忆也应在内存向量中占一行"
+            assert RAGEngine(novel_dir).search([1.0, 0.0], top_k=1)[0]["text"] == "带向量的记忆"
+        finally:
+            rag_engine.np = original_np
+
+def test_metadata_filters_narrow_candidates():
+    with tempfile.TemporaryDirectory() as novel_dir:
+        rag = RAGEngine(novel_dir)
+        rag.add_document(text="旧记忆", vector=[1.0, 0.0])
+        rag.add_document(text="第一章林风下山", vector=[1.0, 0.0], metadata={"chapter": 1, "section": 1, "characters": ["林风"]})
+        rag.add_document(text="第一章苏晴出场", vector=[0.9, 0.1], metadata={"chapter": 1, "section": 2, "characters": ["苏晴"]})
+        rag.add_document(text="第三章林风夺宝", vector=[1.0, 0.0],
+                         metadata={"chapter": 3, "section": 1, "characters": ["林风"], "arcs": ["神秘玉佩"]})
+
+        def texts(**kwargs):
+            return [d["text"] for d in rag.search([1.0, 0.0], top_k=5, **kwargs)]
+
+        assert texts(filters={"before": (1, 2)}) == ["旧记忆", "第一章林风下山"], "没有章节信息的旧记忆视为第 0 章"
+        assert texts(filters={"chapter": (2, 3)}) == ["第三章林风夺宝"]
+        assert texts(filters={"characters": "林风"}) == ["第一章林风下山", "第三章林风夺宝"]
+        assert texts(filters={"characters": ["苏晴"], "chapter": 3}) == []
+        assert texts(filters={"arcs": "神秘玉佩"}, query_text="夺宝") == ["第三章林风夺宝"]
+
+        # 二级索引在重新加载时由记忆日志重建
+        reloaded = RAGEngine(novel_dir)
+        assert [d["text"] for d in reloaded.search(query_text="林风", filters={"before": (3, 1)})] == ["第一章林风下山"]
+
+def test_memory_tree_descends_into_chosen_chapters():
+    with tempfile.TemporaryDirectory() as novel_dir:
+        rag = RAGEngine(novel_dir)
+        # 三章各两节：章向量与其小节一致，便于控制逐层选择的结果
+        chapter_vectors = {1: [1.0, 0.0, 0.0], 2: [0.0, 1.0, 0.0], 3: [0.0, 0.0, 1.0]}
+        for chapter, vec in chapter_vectors.items():
+            ids = []
+            for section in (1, 2):
+                rag.add_document(text=f"第{chapter}章第{section}节", vector=vec,
+                                 metadata={"chapter": chapter, "section": section})
+                ids.append(len(rag.documents) - 1)
+            rag.add_document(text=f"第{chapter}章摘要", vector=vec,
+                             metadata={"level": "chapter", "chapter": chapter, "children": ids})
+        # 尚未归并的新一章小节
+        rag.add_document(text="第4章第1节", vector=[0.0, 0.0, 1.0], metadata={"chapter": 4, "section": 1})
+
+        assert rag.section_ids(2) == [3, 4]
+        assert rag.summary_node("chapter", 2) == 5
+
+        flat = [d["text"] for d in rag.search([1.0, 0.0, 0.0], top_k=10)]
+        assert not any("摘要" in text for text in flat), "平铺检索不应返回摘要节点"
+
+        # 查询偏向第 1、3 章：只在这两章和未归并的尾部中打分，第 2 章的小节不参与
+        tree = [d["text"] for d in rag.search([0.7, 0.0, 0.7], top_k=10, hierarchical=True)]
+        assert set(tree) == {"第1章第1节", "第1章第2节", "第3章第1节", "第3章第2节", "第4章第1节"}
+
+        # 节点关系在重新加载时由记忆日志重建
+        reloaded = RAGEngine(novel_dir)
+        assert [d["text"] for d in reloaded.search([0.7, 0.0, 0.7], top_k=10, hierarchical=True)] == tree
@@ -0,0 +1,97 @@
+import os
+import sys
+import time
+import threading
+
+# Ensure we can import from drivers
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from drivers.rate_limiter import RateLimiter, RateLimitedDriver
+
+class FlakyDriver:
+    """前 failures 次调用返回 429 错误信息的假驱动。"""
+
+    def __init__(self, failures):
+        self.failures = failures
+        self.calls = 0
+
+    def generate_content(self, prompt, system_instruction=None):
+        self.calls += 1
+        if self.calls <= self.failures:
+            return "⚠️ [OpenAI 错误] Error code: 429 - Rate limit reached"
+        return "正文"
+
+def test_aimd_concurrency():
+    limiter = RateLimiter(max_concurrency=8)
+    for _ in range(2):
+        limiter.acquire()
+        limiter.release(rate_limited=True)
+    assert limiter.concurrency == 2, "每次限流并发上限减半"
+
+    for _ in range(2 + 3):
+        limiter.acquire()
+        limiter.release()
+    assert limiter.concurrency == 4, "成功一个窗口后并发上限加一"
+
+def test_concurrency_limit_blocks():
+    limiter = RateLimiter(max_concurrency=1)
+    limiter.acquire()
+    acquired = threading.Event()
+    worker = threading.Thread(target=lambda: (limiter.acquire(), acquired.set()))
+    worker.start()
+    assert not acquired.wait(0.1), "并发名额用尽时应阻塞"
+    limiter.release()
+    assert acquired.wait(1)
+    limiter.release()
+    worker.join()
+
+def test_request_bucket_paces_calls():
+    limiter = RateLimiter(requests_per_minute=600) # 每 0.1 秒补充一个
+    limiter.request_bucket.tokens = 0
+    start = time.monotonic()
+    limiter.acquire()
+    limiter.release()
+    assert time.monotonic() - start >= 0.08
+
+def test_driver_retries_rate_limited_calls():
+    limiter = RateLimiter(max_concurrency=4)
+    inner = FlakyDriver(failures=2)
+    llm = RateLimitedDriver(inner, limiter, base_delay=0.001)
+    assert llm.generate_content("写一节") == "正文"
+    assert inner.calls == 3
+    assert limiter.concurrency == 2, "两次限流减到 1，随后的成功调用恢复到 2"
+    assert limiter.in_flight == 0
+
+class FlakyEmbedder:
+    """前 failures 次嵌入请求像真实驱动一样吞掉 429 异常、返回空向量的假驱动。"""
+
+    def __init__(self, failures):
+        self.failures = failures
+        self.calls = 0
+
+    def embed_content(self, text):
+        from drivers.base import FailedEmbedding
+        self.calls += 1
+        if self.calls <= self.failures:
+            return FailedEmbedding("Error code: 429 - Rate limit reached")
+        return [1.0, 0.0]
+
+def test_embedding_rate_limits_reach_the_limiter():
+    limiter = RateLimiter(max_concurrency=4)
+    inner = FlakyEmbedder(failures=1)
+    llm = RateLimitedDriver(inner, limiter, base_delay=0.001)
+    assert llm.embed_content("记忆") == [1.0, 0.0], "被限流的嵌入请求应重试而不是返回空向量"
+    assert inner.calls == 2
+    assert limiter.concurrency == 2, "嵌入接口的限流也应让并发减半"
+
+def test_openai_embedding_error_keeps_message():
+    from drivers.openai import OpenAIDriver
+    from drivers.rate_limiter import is_rate_limited_embedding
+
+    driver = OpenAIDriver("key", "model")
+    def fail(**kwargs):
+        raise RuntimeError("Error code: 429 - You exceeded your current quota")
+    driver.client.embeddings.create = fail
+    vector = driver.embed_content("记忆")
+    assert vector == [] and is_rate_limited_embedding(vector), "失败时仍返回空列表，但保留限流错误信息"
+    assert all(is_rate_limited_embedding(v) for v in driver.embed_contents(["甲", "乙"]))
@@ -0,0 +1,53 @@
+import os
+import sys
+import tempfile
+
+# Ensure we can import from core and tools
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from core.rag_engine import RAGEngine
+from drivers.base import BaseDriver
+from tools.reembed_memory import reembed_memory
+
+class KeywordDriver(BaseDriver):
+    """按关键字生成 3 维向量的假驱动，可在指定批次注入失败。"""
+    provider_name = "fake"
+    embedding_model = "keyword-3d"
+
+    def __init__(self, fail_on_call=None):
+        self.calls = 0
+        self.fail_on_call = fail_on_call
+
+    def generate_content(self, prompt, system_instruction=None):
+        return ""
+
+    def embed_content(self, text):
+        return [1.0 if "剑" in text else 0.0, 1.0 if "火" in text else 0.0, 0.1]
+
+    def embed_contents(self, texts):
+        self.calls += 1
+        if self.calls == self.fail_on_call:
+            return [[] for _ in texts]
+        return [self.embed_content(t) for t in texts]
+
+def test_reembed_switches_model_and_resumes():
+    with tempfile.TemporaryDirectory() as novel_dir:
+        rag = RAGEngine(novel_dir)
+        rag.check_embedding_model("old/2d")
+        texts = ["主角拔剑", "山谷起火", "平静的一天", "剑与火"]
+        for text in texts:
+            rag.add_document(text=text, vector=[1.0, 0.0])
+
+        llm = KeywordDriver(fail_on_call=2)
+        assert not RAGEngine(novel_dir).check_embedding_model(llm.embedding_id())
+        assert reembed_memory(novel_dir, llm, batch_size=2) is False, "第二批失败时应中止"
+
+        llm.fail_on_call = None
+        calls_before = llm.calls
+        assert reembed_memory(novel_dir, llm, batch_size=2) is True
+        assert llm.calls - calls_before == 1, "续跑时只应重新嵌入未完成的批次"
+
+        rebuilt = RAGEngine(novel_dir)
+        assert rebuilt.dim == 3
+        assert rebuilt.check_embedding_model(llm.embedding_id())
+        assert [d["text"] for d in rebuilt.search(llm.embed_content("火"), top_k=1)] == ["山谷起火"]
@@ -0,0 +1,85 @@
+import os
+import sys
+import tempfile
+
+import pytest
+
+# Ensure we can import from drivers
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from drivers.base import BaseDriver
+from drivers.response_cache import ResponseCache, RecordReplayDriver, ResponseCacheMiss
+
+class CountingDriver(BaseDriver):
+    provider_name = "counting"
+    model_name = "test-model"
+    embedding_model = "test-embedding"
+
+    def __init__(self):
+        self.calls = 0
+
+    def generate_content(self, prompt, system_instruction=None):
+        self.calls += 1
+        if "出错" in prompt:
+            return "⚠️ [LLM 错误] 429 rate limit"
+        return f"{system_instruction}:{prompt}:{self.calls}"
+
+    def embed_content(self, text):
+        self.calls += 1
+        return [float(len(text)), 1.0]
+
+def test_record_then_replay_offline():
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "responses.sqlite3")
+        inner = CountingDriver()
+        recorder = RecordReplayDriver(inner, ResponseCache(path), "record")
+        first = recorder.generate_content("写大纲", "系统")
+        vector = recorder.embed_content("记忆")
+        streamed = "".join(recorder.generate_content_stream("写正文"))
+        assert inner.calls == 3
+        recorder.cache.close()
+
+        replayer = RecordReplayDriver(CountingDriver(), ResponseCache(path), "replay")
+        assert replayer.generate_content("写大纲", "系统") == first
+        assert replayer.embed_contents(["记忆"]) == [vector]
+        assert list(replayer.generate_content_stream("写正文")) == [streamed]
+        assert replayer.driver.calls == 0, "回放模式不应调用真实接口"
+
+        with pytest.raises(ResponseCacheMiss):
+            replayer.generate_content("写大纲", "另一个系统提示")
+        replayer.cache.close()
+
+def test_readthrough_skips_errors_and_record_overwrites():
+    with tempfile.TemporaryDirectory() as tmp:
+        cache = ResponseCache(os.path.join(tmp, "responses.sqlite3"))
+        inner = CountingDriver()
+        llm = RecordReplayDriver(inner, cache, "readthrough")
+
+        assert llm.generate_content("出错").startswith("⚠️")
+        llm.generate_content("出错")
+        assert inner.calls == 2, "错误响应不应被记录"
+
+        first = llm.generate_content("大纲")
+        assert llm.generate_content("大纲") == first
+        assert inner.calls == 3, "读穿模式应命中已有记录"
+
+        again = RecordReplayDriver(inner, cache, "record").generate_content("大纲")
+        assert again != first and llm.generate_content("大纲") == again, "录制模式应覆盖旧记录"
+        cache.close()
+
+def test_generation_params_are_part_of_the_key():
+    from drivers.factory import get_driver
+
+    with tempfile.TemporaryDirectory() as tmp:
+        cache = ResponseCache(os.path.join(tmp, "responses.sqlite3"))
+        def build(params):
+            # 真实驱动外面还有指标、嵌入缓存等包装层
+            return get_driver("fake", None, "fake-model", embedding_cache=False, response_cache=(cache, "readthrough"),
+                              driver_options={"generation_params": params})
+
+        cold, warm, cold_again = build({"temperature": 0.2}), build({"temperature": 0.9}), build({"temperature": 0.2})
+        assert cold._generate_key("写大纲", "系统") != warm._generate_key("写大纲", "系统"), \
+            "生成参数不同的请求不应共用缓存"
+        assert cold._generate_key("写大纲", "系统") == cold_again._generate_key("写大纲", "系统")
+        assert build(None)._generate_key("写大纲", "系统") != cold._generate_key("写大纲", "系统")
+        cache.close()
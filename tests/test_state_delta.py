@@ -0,0 +1,98 @@
+import json
+import os
+import sys
+import tempfile
+
+# Ensure we can import from core
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import yaml
+
+from core.state_delta import apply_delta, parse_delta
+from core.state_manager import StateManager
+
+DELTA = {
+    "operations": [
+        {"op": "append_summary", "text": "林风在山洞中疗伤。"},
+        {"op": "set_character", "name": "林风", "field": "状态", "value": "重伤"},
+        {"op": "set_character", "name": "林风", "field": "位置", "value": "青云山"},
+        {"op": "open_arc", "name": "神秘玉佩", "description": "玉佩开始发光"},
+        {"op": "resolve_arc", "name": "灭门真相", "resolution": "凶手伏诛"},
+        {"op": "set_character", "name": "苏晴"},
+        {"op": "fly_away"},
+    ],
+    "memory": "林风藏身山洞疗伤，玉佩发光。",
+}
+
+class DeltaDriver:
+    """只支持 generate_json 的假驱动，记录调用方式。"""
+
+    def __init__(self, response):
+        self.response = response
+        self.calls = []
+
+    def generate_json(self, prompt, system_instruction=None):
+        self.calls.append("generate_json")
+        return self.response
+
+    def generate_content(self, prompt, system_instruction=None):
+        self.calls.append("generate_content")
+        return "===SUMMARY===\n整体重写的摘要\n===CHARACTERS===\n林风: 健康\n===ARCS===\n{}\n===MEMORY===\n"
+
+    def embed_content(self, text):
+        return [1.0, 0.0]
+
+def test_parse_delta_validates_operations():
+    operations, memory, errors = parse_delta("```json\n" + json.dumps(DELTA, ensure_ascii=False) + "\n```")
+    assert [op["op"] for op in operations] == ["append_summary", "set_character", "set_character", "open_arc", "resolve_arc"]
+    assert memory == "林风藏身山洞疗伤，玉佩发光。"
+    assert len(errors) == 2, "缺字段与未知类型的操作应被跳过并报告"
+
+    assert parse_delta("这不是 JSON")[0] is None
+    assert parse_delta('{"memory": "缺少操作列表"}')[0] is None
+
+def test_apply_delta_does_not_mutate_inputs():
+    characters = {"林风": "健康"}
+    arcs = {"灭门真相": "未解"}
+    operations, _, _ = parse_delta(json.dumps(DELTA, ensure_ascii=False))
+    summary, new_chars, new_arcs = apply_delta("故事刚刚开始。", characters, arcs, operations)
+
+    assert summary == "林风在山洞中疗伤。", "初始占位摘要应被替换"
+    assert new_chars == {"林风": {"状态": "重伤", "位置": "青云山"}}
+    assert new_arcs == {"灭门真相": "[已解决] 凶手伏诛", "神秘玉佩": "玉佩开始发光"}
+    assert characters == {"林风": "健康"} and arcs == {"灭门真相": "未解"}
+
+def test_resolve_arc_is_idempotent():
+    resolve = [{"op": "resolve_arc", "name": "灭门真相"}]
+    _, _, arcs = apply_delta("摘要", {}, {"灭门真相": "未解"}, resolve)
+    _, _, arcs = apply_delta("摘要", {}, arcs, resolve)
+    assert arcs == {"灭门真相": "[已解决] 未解"}, "重复解决不应叠加前缀"
+
+    prefixed = [{"op": "resolve_arc", "name": "灭门真相", "resolution": "[已解决] 凶手伏诛"}]
+    _, _, arcs = apply_delta("摘要", {}, arcs, prefixed)
+    assert arcs == {"灭门真相": "[已解决] 凶手伏诛"}
+
+def test_state_manager_applies_delta_locally():
+    with tempfile.TemporaryDirectory() as tmp:
+        manager = StateManager(os.path.join(tmp, "增量测试"), update_mode="delta")
+        llm = DeltaDriver(json.dumps(DELTA, ensure_ascii=False))
+        manager.update_state(llm, "林风逃入山洞。", {"chapter": 2, "section": 1})
+
+        assert llm.calls == ["generate_json"], "支持原生 JSON 输出的驱动应走 generate_json"
+        assert manager.rag.documents[-1]["metadata"] == {
+            "chapter": 2, "section": 1, "characters": ["林风"], "arcs": ["灭门真相", "神秘玉佩"]
+        }, "记忆应带上章节与涉及的角色/剧情线"
+        with open(manager.character_state_path, "r", encoding="utf-8") as f:
+            assert yaml.safe_load(f) == {"林风": {"状态": "重伤", "位置": "青云山"}}
+        with open(manager.global_summary_path, "r", encoding="utf-8") as f:
+            assert f.read() == "林风在山洞中疗伤。"
+
+def test_unparseable_delta_falls_back_to_full_update():
+    with tempfile.TemporaryDirectory() as tmp:
+        manager = StateManager(os.path.join(tmp, "回退测试"), update_mode="delta")
+        llm = DeltaDriver("抱歉，我无法输出 JSON。")
+        manager.update_state(llm, "林风逃入山洞。")
+
+        assert llm.calls == ["generate_json", "generate_content"]
+        with open(manager.global_summary_path, "r", encoding="utf-8") as f:
+            assert f.read() == "整体重写的摘要"
@@ -0,0 +1,91 @@
+import os
+import sys
+import tempfile
+
+# Ensure we can import from core
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from core.state_manager import StateManager
+
+RESPONSE = """===SUMMARY===
+林风在山洞中疗伤。
+===CHARACTERS===
+林风:
+  状态: 重伤
+===ARCS===
+神秘玉佩: 未解
+===MEMORY===
+"""
+
+def _read(path):
+    with open(path, "r", encoding="utf-8") as f:
+        return f.read()
+
+def test_state_is_kept_in_memory_and_flushed_atomically():
+    with tempfile.TemporaryDirectory() as tmp:
+        novel_dir = os.path.join(tmp, "状态测试")
+        manager = StateManager(novel_dir, flush_every=2)
+
+        manager._parse_and_save_updates(None, RESPONSE)
+        # 未到写回间隔：磁盘上仍是旧状态，但上下文已是新状态
+        assert _read(manager.global_summary_path) == "故事刚刚开始。", "未到写回间隔时不应写盘"
+        context = manager.get_context_prompt()
+        assert "林风在山洞中疗伤" in context and "重伤" in context, "上下文应来自内存中的最新状态"
+
+        # 外部改动磁盘文件不影响内存状态（不再每节重新读盘）
+        with open(manager.character_state_path, "w", encoding="utf-8") as f:
+            f.write("被外部改写: 是")
+        assert "重伤" in manager.get_context_prompt()
+
+        manager._parse_and_save_updates(None, RESPONSE.replace("重伤", "痊愈"))
+        assert "痊愈" in _read(manager.character_state_path), "达到写回间隔后应写盘"
+        assert "林风在山洞中疗伤" in _read(manager.global_summary_path)
+        assert not any(name.endswith(".tmp") for name in os.listdir(novel_dir)), "不应残留临时文件"
+
+        # 重新打开时从磁盘恢复
+        reopened = StateManager(novel_dir)
+        assert "痊愈" in reopened.get_context_prompt()
+
+def test_parsed_yaml_is_cached_between_sections():
+    with tempfile.TemporaryDirectory() as tmp:
+        manager = StateManager(os.path.join(tmp, "缓存测试"))
+        manager._parse_and_save_updates(None, RESPONSE)
+        first = manager._parsed_state("characters")
+        manager.get_context_prompt(current_query="林风", token_budget=500)
+        assert manager._parsed_state("characters") is first, "状态未变化时不应重新解析 YAML"
+        assert first == {"林风": {"状态": "重伤"}}
+
+class ConsolidationDriver:
+    """记录归并提示词的假驱动。"""
+
+    def __init__(self):
+        self.prompts = []
+
+    def generate_content(self, prompt, system_instruction=None):
+        self.prompts.append(prompt)
+        return f"归并摘要{len(self.prompts)}"
+
+    def embed_content(self, text):
+        return [1.0, 0.0]
+
+def test_consolidate_chapter_builds_chapter_and_arc_nodes():
+    with tempfile.TemporaryDirectory() as tmp:
+        manager = StateManager(os.path.join(tmp, "记忆树测试"), rag_config={"memory_tree": True, "arc_chapters": 2})
+        llm = ConsolidationDriver()
+        for chapter in (1, 2):
+            for section in (1, 2):
+                manager._store_memory(llm, f"第{chapter}章第{section}节记忆", {"chapter": chapter, "section": section})
+
+        manager.consolidate_chapter(llm, 1)
+        assert len(llm.prompts) == 1 and "第1章第2节记忆" in llm.prompts[0]
+        node = manager.rag.summary_node("chapter", 1)
+        assert manager.rag.documents[node]["metadata"] == {"level": "chapter", "chapter": 1, "children": [0, 1]}
+        assert manager.rag.summary_node("arc", 1) is None, "卷内章节未全部归并前不应生成卷级节点"
+
+        manager.consolidate_chapter(llm, 1)
+        assert len(llm.prompts) == 1, "已归并的章节应直接跳过"
+
+        manager.consolidate_chapter(llm, 2)
+        arc = manager.rag.summary_node("arc", 1)
+        assert arc is not None and manager.rag.documents[arc]["metadata"]["chapters"] == [1, 2]
+        assert len(llm.prompts) == 3
@@ -0,0 +1,94 @@
+import os
+import sys
+import tempfile
+
+# Ensure we can import from core
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from core.generator import write_chapters_from_outline
+
+OUTLINE = """
+第1章：开端
+  第1节：主角醒来
+  第2节：遇见师父
+"""
+
+STATE_REPLY = "===SUMMARY===\n摘要\n===CHARACTERS===\n主角: 健康\n===ARCS===\n无\n===MEMORY===\n记忆"
+
+class StreamingDriver:
+    """流式假驱动：fail_after 不为 None 时，输出这么多块后模拟连接断开。"""
+
+    def __init__(self, fail_after=None):
+        self.fail_after = fail_after
+        self.prompts = []
+
+    def generate_content(self, prompt, system_instruction=None):
+        return STATE_REPLY
+
+    def generate_content_stream(self, prompt, system_instruction=None):
+        self.prompts.append(prompt)
+        for i, chunk in enumerate(["甲", "乙", "丙"]):
+            if self.fail_after is not None and i == self.fail_after:
+                raise ConnectionError("连接被重置")
+            yield chunk
+
+    def embed_content(self, text):
+        return [1.0, 0.0]
+
+def test_stream_interruption_resumes_from_partial():
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as tmp:
+        os.chdir(tmp)
+        try:
+            section = os.path.join("流式测试", "第01章", "第01节.txt")
+
+            write_chapters_from_outline(StreamingDriver(fail_after=2), "流式测试", OUTLINE, {}, 100)
+            assert not os.path.exists(section), "中断的小节不应生成正式文件"
+            with open(section + ".partial", "r", encoding="utf-8") as f:
+                assert f.read() == "甲乙", "已收到的内容应保存在 .partial 中"
+            assert not os.path.exists(os.path.join("流式测试", "第01章", "第02节.txt")), "中断后不应继续后续小节"
+
+            llm = StreamingDriver()
+            write_chapters_from_outline(llm, "流式测试", OUTLINE, {}, 100)
+            assert "【断点续写】" in llm.prompts[0] and "甲乙" in llm.prompts[0], "续写时应把已有内容交给模型"
+            assert not os.path.exists(section + ".partial")
+            with open(section, "r", encoding="utf-8") as f:
+                assert f.read() == "甲乙甲乙丙"
+            with open(os.path.join("流式测试", "第01章", "第02节.txt"), "r", encoding="utf-8") as f:
+                assert f.read() == "甲乙丙"
+        finally:
+            os.chdir(cwd)
+
+class FusedDriver:
+    """融合模式假驱动：正文之后附带状态增量块，且分隔行被拆在两个分块里。"""
+
+    def __init__(self):
+        self.calls = []
+
+    def generate_content(self, prompt, system_instruction=None):
+        self.calls.append("generate")
+        return STATE_REPLY
+
+    def generate_content_stream(self, prompt, system_instruction=None):
+        self.calls.append("stream")
+        delta = '{"operations": [{"op": "append_summary", "text": "主角醒来。"}], "memory": "本节记忆"}'
+        for chunk in ["甲乙", "丙\n===STATE", "_DELTA===\n", delta]:
+            yield chunk
+
+    def embed_content(self, text):
+        return [1.0, 0.0]
+
+def test_fused_mode_keeps_delta_out_of_section_file():
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as tmp:
+        os.chdir(tmp)
+        try:
+            llm = FusedDriver()
+            write_chapters_from_outline(llm, "融合测试", OUTLINE, {}, 100, {"fused_state_update": True})
+            with open(os.path.join("融合测试", "第01章", "第01节.txt"), "r", encoding="utf-8") as f:
+                assert f.read() == "甲乙丙", "状态增量块不应写入正文文件"
+            assert llm.calls == ["stream", "stream"], "融合模式下每节只需一次生成请求"
+            with open(os.path.join("融合测试", "global_summary.txt"), "r", encoding="utf-8") as f:
+                assert f.read() == "主角醒来。\n主角醒来。"
+        finally:
+            os.chdir(cwd)
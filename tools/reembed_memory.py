@@ -0,0 +1,94 @@
+import sys
+import os
+import json
+
+# 将项目根目录添加到 sys.path，确保可以导入 core 和 drivers 模块
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from core.config import load_config, get_llm_config
+from core.rag_engine import RAGEngine, VECTOR_HEADER, pack_vector_header, pack_vector_row
+from drivers.factory import get_driver
+
+def reembed_memory(novel_dir, llm, batch_size=None):
+    """
+    使用当前嵌入模型重新生成整个记忆库的向量。
+
+    进度写入 memory.vectors.f32.reembed 与 memory.reembed.json，中途失败或中断后
+    再次运行会从已完成的位置继续；全部完成后原子替换旧向量文件并重建 ANN 索引。
+    """
+    rag = RAGEngine(novel_dir)
+    texts = [doc["text"] for doc in rag.documents]
+    embedding_id = llm.embedding_id()
+    batch_size = batch_size or getattr(llm, "embedding_batch_size", 100)
+
+    if not texts:
+        print("记忆库为空，无需重建。")
+        return True
+
+    progress_vectors = rag.vector_file + ".reembed"
+    progress_file = os.path.join(novel_dir, "memory.reembed.json")
+
+    done, dim = 0, 0
+    if os.path.exists(progress_file) and os.path.exists(progress_vectors):
+        with open(progress_file, "r", encoding="utf-8") as f:
+            progress = json.load(f)
+        if progress.get("embedding_model") == embedding_id and progress.get("total") == len(texts):
+            dim = progress["dim"]
+            # 以文件中完整写入的行数为准，丢弃可能写了一半的最后一行
+            done = (os.path.getsize(progress_vectors) - VECTOR_HEADER.size) // (dim * 4)
+            with open(progress_vectors, "r+b") as f:
+                f.truncate(VECTOR_HEADER.size + done * dim * 4)
+            print(f"检测到未完成的重建任务，从第 {done + 1} 条继续...")
+        else:
+            print("已有的重建进度属于其他嵌入模型或记忆库已变化，重新开始。")
+
+    print(f"正在使用 {embedding_id} 重建 {len(texts)} 条记忆向量 (每批 {batch_size} 条)...")
+    while done < len(texts):
+        chunk = texts[done:done + batch_size]
+        vectors = llm.embed_contents(chunk)
+        if len(vectors) != len(chunk) or not all(vectors):
+            print(f"⚠️ 第 {done + 1} 条起的批次嵌入失败，已保存进度，稍后重新运行即可继续。")
+            return False
+
+        if dim == 0:
+            dim = len(vectors[0])
+            with open(progress_vectors, "wb") as f:
+                f.write(pack_vector_header(dim))
+            with open(progress_file, "w", encoding="utf-8") as f:
+                json.dump({"embedding_model": embedding_id, "dim": dim, "total": len(texts)}, f)
+
+        if any(len(vec) != dim for vec in vectors):
+            print("⚠️ 嵌入模型返回的向量维度不一致，已中止。")
+            return False
+
+        with open(progress_vectors, "ab") as f:
+            for vec in vectors:
+                f.write(pack_vector_row(vec))
+            f.flush()
+            os.fsync(f.fileno())
+        done += len(chunk)
+        print(f"  - 已完成 {done}/{len(texts)}")
+
+    rag.install_vectors(progress_vectors, embedding_id)
+    os.remove(progress_file)
+    print(f"✅ 记忆向量重建完成，维度 {dim}。")
+    return True
+
+def main():
+    if len(sys.argv) < 2:
+        print("用法: python tools/reembed_memory.py <小说目录> [配置文件]")
+        return
+
+    novel_dir = sys.argv[1]
+    config = load_config(sys.argv[2] if len(sys.argv) > 2 else "config.yaml")
+    llm_config = get_llm_config(config)
+    if not llm_config["api_key"]:
+        print("错误: 未找到 API Key，请检查 .env 文件。")
+        return
+
+    # 嵌入缓存按模型区分，命中的向量同样出自新模型，可以直接复用
+    llm = get_driver(llm_config["provider"], llm_config["api_key"], llm_config["model_name"], llm_config["base_url"])
+    reembed_memory(novel_dir, llm)
+
+if __name__ == "__main__":
+    main()